@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Benchmarks for the scanning engines.
+
+Runs the same scan with each engine and prints wall time, CPU time
+(including child processes such as ping), peak thread count and what was
+found, so results can be compared between engines and machines.
+
+Examples:
+    python benchmark.py discovery --subnet 192.168.1.0/24
+    python benchmark.py discovery --subnet 127.0.0.0/22 --runs 3
+    python benchmark.py neighbors --subnet 192.168.1.0/24
+    python benchmark.py ports --host 192.168.1.1 --concurrency 2000
+    python benchmark.py hosts --hosts 192.168.1.1 192.168.1.20 192.168.1.30 --ports 1-10000
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import statistics
+import threading
+import time
+from typing import Callable, Dict, List
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from core.logger import setup_logger
+from scanner import DeviceInfo, LanScanner, PortScanner
+
+setup_logger()
+
+
+def _cpu_seconds() -> float:
+    if resource is None:
+        return sum(os.times()[:4])
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def measure(func: Callable[[], object], runs: int) -> Dict[str, object]:
+    """Run ``func`` ``runs`` times; returns medians and the last result."""
+    walls, cpus, peaks = [], [], []
+    result = None
+    for _ in range(runs):
+        peak = threading.active_count()
+        done = threading.Event()
+
+        def watch():
+            nonlocal peak
+            while not done.wait(0.05):
+                peak = max(peak, threading.active_count())
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        cpu, start = _cpu_seconds(), time.perf_counter()
+        result = func()
+        walls.append(time.perf_counter() - start)
+        cpus.append(_cpu_seconds() - cpu)
+        done.set()
+        watcher.join()
+        peaks.append(peak - 1)  # without the watcher itself
+    return {"wall_s": round(statistics.median(walls), 3),
+            "cpu_s": round(statistics.median(cpus), 3),
+            "peak_threads": max(peaks), "result": result}
+
+
+def bench_discovery(args) -> Dict[str, object]:
+    report = {"subnet": args.subnet, "concurrency": args.concurrency, "timeout": args.timeout}
+    for engine in args.engines:
+        scanner = LanScanner(concurrency=args.concurrency, timeout=args.timeout, engine=engine)
+        stats = measure(lambda: scanner.scan_network(args.subnet, show_progress=False), args.runs)
+        devices = stats.pop("result")
+        stats["found"] = len(devices)
+        report[engine] = stats
+    return report
+
+
+def bench_neighbors(args) -> Dict[str, object]:
+    hosts = [str(host) for host in ipaddress.ip_network(args.subnet, strict=False).hosts()]
+    report = {"subnet": args.subnet, "hosts": len(hosts)}
+
+    def per_host():
+        device_info = DeviceInfo()
+        return sum(device_info.get_mac_address(ip) is not None for ip in hosts)
+
+    def snapshot():
+        device_info = DeviceInfo()
+        device_info.refresh_neighbors()
+        return sum(device_info.get_mac_address(ip) is not None for ip in hosts)
+
+    for name, func in (("arp_per_host", per_host), ("snapshot", snapshot)):
+        stats = measure(func, args.runs)
+        stats["found"] = stats.pop("result")
+        report[name] = stats
+    return report
+
+
+def _max_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1024 * 1024 if os.uname().sysname == 'Darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def bench_ports(args) -> Dict[str, object]:
+    ports = list(range(0, 65536)) if args.ports == 'all' else [int(p) for p in args.ports.split(',')]
+    report = {"host": args.host, "ports": len(ports), "concurrency": args.concurrency,
+              "timeout": args.timeout}
+    scanner = PortScanner(concurrency=args.concurrency, timeout=args.timeout)
+    stats = measure(lambda: scanner.scan_ports(args.host, ports, show_progress=False), args.runs)
+    stats["open"] = stats.pop("result")
+    stats["max_rss_mb"] = _max_rss_mb()
+    report["scan"] = stats
+    return report
+
+
+def _port_list(spec: str) -> List[int]:
+    if spec == 'all':
+        return list(range(0, 65536))
+    if '-' in spec:
+        first, last = spec.split('-')
+        return list(range(int(first), int(last) + 1))
+    return [int(p) for p in spec.split(',')]
+
+
+def bench_hosts(args) -> Dict[str, object]:
+    ports = _port_list(args.ports)
+    report = {"hosts": args.hosts, "ports": len(ports), "concurrency": args.concurrency,
+              "per_host": args.per_host, "timeout": args.timeout}
+    scanner = PortScanner(concurrency=args.concurrency, timeout=args.timeout,
+                          per_host_limit=args.per_host)
+
+    def serial():
+        # One host after another, as main.py used to do.
+        start, done = time.perf_counter(), {}
+        for ip in args.hosts:
+            scanner.scan_ports(ip, ports, show_progress=False)
+            done[ip] = round(time.perf_counter() - start, 3)
+        return done
+
+    def scheduled():
+        start, done = time.perf_counter(), {}
+        for ip, _ in scanner.scan_hosts({ip: ports for ip in args.hosts}):
+            done[ip] = round(time.perf_counter() - start, 3)
+        return done
+
+    for name, func in (("serial", serial), ("scheduled", scheduled)):
+        stats = measure(func, args.runs)
+        stats["host_done_s"] = stats.pop("result")
+        report[name] = stats
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks for the scanning engines',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__.split('Examples:')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    discovery = commands.add_parser('discovery', help='Host discovery: async vs thread engine')
+    discovery.add_argument('--subnet', required=True, help='Subnet to scan (CIDR)')
+    discovery.add_argument('--engines', nargs='+', default=['async', 'thread'],
+                           choices=['async', 'thread'])
+    discovery.add_argument('--concurrency', type=int, default=500)
+    discovery.add_argument('--timeout', type=float, default=1.0)
+    discovery.add_argument('--runs', type=int, default=1)
+    discovery.set_defaults(func=bench_discovery)
+
+    neighbors = commands.add_parser('neighbors', help='MAC lookups: arp per host vs one snapshot')
+    neighbors.add_argument('--subnet', required=True, help='Subnet whose hosts are looked up (CIDR)')
+    neighbors.add_argument('--runs', type=int, default=1)
+    neighbors.set_defaults(func=bench_neighbors)
+
+    ports = commands.add_parser('ports', help='Port scan of one host')
+    ports.add_argument('--host', required=True, help='Host to scan')
+    ports.add_argument('--ports', default='all', help="'all' or a comma separated list")
+    ports.add_argument('--concurrency', type=int, default=500)
+    ports.add_argument('--timeout', type=float, default=0.5)
+    ports.add_argument('--runs', type=int, default=1)
+    ports.set_defaults(func=bench_ports)
+
+    hosts = commands.add_parser('hosts', help='Port scan of several hosts: serial vs scheduled')
+    hosts.add_argument('--hosts', nargs='+', required=True, help='Hosts to scan')
+    hosts.add_argument('--ports', default='1-1024', help="'all', 'first-last' or a comma separated list")
+    hosts.add_argument('--concurrency', type=int, default=500)
+    hosts.add_argument('--per-host', type=int, default=256)
+    hosts.add_argument('--timeout', type=float, default=0.5)
+    hosts.add_argument('--runs', type=int, default=1)
+    hosts.set_defaults(func=bench_hosts)
+
+    args = parser.parse_args()
+    print(json.dumps(args.func(args), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,10 @@ class Config:
             "concurrency": 500,
             "timeout": 1.0,
             "ports": "common",
-            "enrich": True
+            "enrich": True,
+            "engine": "auto",
+            "per_host": 256,
+            "rate": 0.0
         },
         "output": {
             "format": "console",
@@ -108,6 +111,30 @@ class Config:
     def enrich(self, value: bool):
         self.set("scan.enrich", value)
     
+    @property
+    def engine(self) -> str:
+        return self.get("scan.engine", "auto")
+    
+    @engine.setter
+    def engine(self, value: str):
+        self.set("scan.engine", value)
+    
+    @property
+    def per_host(self) -> int:
+        return self.get("scan.per_host", 256)
+    
+    @per_host.setter
+    def per_host(self, value: int):
+        self.set("scan.per_host", value)
+    
+    @property
+    def rate(self) -> float:
+        return self.get("scan.rate", 0.0)
+    
+    @rate.setter
+    def rate(self, value: float):
+        self.set("scan.rate", value)
+    
     @property
     def output_format(self) -> str:
         return self.get("output.format", "console")
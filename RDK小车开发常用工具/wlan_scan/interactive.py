@@ -409,6 +409,9 @@ class InteractiveMenu:
         args.scan_local = getattr(self, 'args_scan_local', False)
         args.concurrency = self.config.concurrency
         args.timeout = self.config.timeout
+        args.engine = self.config.engine
+        args.per_host = self.config.per_host
+        args.rate = self.config.rate
         args.enrich = getattr(self, 'args_enrich', self.config.enrich)
         args.ports = getattr(self, 'args_ports', self.config.ports)
         args.full_port = args.ports == "all"
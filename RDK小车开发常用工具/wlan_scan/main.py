@@ -61,6 +61,33 @@ def find_gateway(args) -> Optional:
         return None
 
 
+def scan_device_ports(devices: List[Device], args) -> None:
+    """Scan the ports of all devices together and store them on each device.
+    
+    Ports of every device share one pool of connects, limited per host by
+    ``--per-host`` and overall by ``--rate``; each device is printed as
+    soon as its last port has been answered.
+    """
+    if args.full_port or args.ports == 'all':
+        print(f"\n=== Scanning Ports (0-65535) ===")
+        port_list = list(range(0, 65536))
+    elif args.ports and args.ports != 'common':
+        print(f"\n=== Scanning Ports ({args.ports}) ===")
+        port_list = [int(p.strip()) for p in args.ports.split(',')]
+    else:
+        print(f"\n=== Scanning Common Ports ===")
+        port_list = list(PortScanner.COMMON_PORTS.keys())
+    
+    port_scanner = PortScanner(concurrency=args.concurrency,
+                               per_host_limit=getattr(args, 'per_host', None),
+                               rate=getattr(args, 'rate', 0.0))
+    by_ip = {device.ip: device for device in devices}
+    
+    for ip, open_ports in port_scanner.scan_hosts({ip: port_list for ip in by_ip}):
+        by_ip[ip].open_ports = open_ports
+        print(f"  {ip}: {len(open_ports)} open port(s)")
+
+
 def scan_network(args) -> List[Device]:
     """Scan a network for devices."""
     subnet = args.subnet
@@ -70,7 +97,8 @@ def scan_network(args) -> List[Device]:
     print(f"\n=== Scanning Network: {subnet} ===")
     print(f"Concurrency: {concurrency}, Timeout: {timeout}s\n")
     
-    scanner = LanScanner(concurrency=concurrency, timeout=timeout)
+    scanner = LanScanner(concurrency=concurrency, timeout=timeout,
+                         engine=getattr(args, 'engine', 'auto'))
     start_time = time.time()
     
     devices = scanner.scan_network(subnet, show_progress=True)
@@ -81,33 +109,14 @@ def scan_network(args) -> List[Device]:
         print("No devices found.")
         return []
     
-    if args.full_port or args.ports == 'all':
-        print(f"\n=== Scanning Ports (0-65535) ===")
-        port_scanner = PortScanner(concurrency=concurrency)
-        
-        for device in devices:
-            print(f"  Scanning ports on {device.ip}...")
-            device.open_ports = port_scanner.scan_ports(device.ip, show_progress=False)
-    elif args.ports and args.ports != 'common':
-        print(f"\n=== Scanning Ports ({args.ports}) ===")
-        port_list = args.ports.split(',')
-        port_list = [int(p.strip()) for p in port_list]
-        port_scanner = PortScanner(concurrency=concurrency)
-        
-        for device in devices:
-            print(f"  Scanning ports on {device.ip}...")
-            device.open_ports = port_scanner.scan_ports(device.ip, port_list, show_progress=False)
-    else:
-        print(f"\n=== Scanning Common Ports ===")
-        port_scanner = PortScanner(concurrency=concurrency)
-        
-        for device in devices:
-            print(f"  Scanning common ports on {device.ip}...")
-            device.open_ports = port_scanner.scan_common_ports(device.ip)
+    scan_device_ports(devices, args)
     
     if args.enrich or args.full_port or args.ports != 'common':
         print(f"\n=== Enriching Device Information ===")
         device_info = DeviceInfo()
+        # One snapshot for every device, taken now that discovery has
+        # filled the neighbor table.
+        print(f"  Read {device_info.refresh_neighbors()} neighbor table entries")
         
         for device in devices:
             print(f"  Getting info for {device.ip}...")
@@ -126,37 +135,20 @@ def scan_local_network(args) -> List[Device]:
     print(f"\n=== Scanning Local Networks ===")
     print(f"Concurrency: {concurrency}, Timeout: {timeout}s\n")
     
-    scanner = LanScanner(concurrency=concurrency, timeout=timeout)
+    scanner = LanScanner(concurrency=concurrency, timeout=timeout,
+                         engine=getattr(args, 'engine', 'auto'))
     start_time = time.time()
     
     devices = scanner.scan_local_network(show_progress=True)
     
-    if args.full_port or args.ports == 'all':
-        print(f"\n=== Scanning Ports (0-65535) ===")
-        port_scanner = PortScanner(concurrency=concurrency)
-        
-        for device in devices:
-            print(f"  Scanning ports on {device.ip}...")
-            device.open_ports = port_scanner.scan_ports(device.ip, show_progress=False)
-    elif args.ports and args.ports != 'common':
-        port_list = args.ports.split(',')
-        port_list = [int(p.strip()) for p in port_list]
-        port_scanner = PortScanner(concurrency=concurrency)
-        
-        for device in devices:
-            print(f"  Scanning ports on {device.ip}...")
-            device.open_ports = port_scanner.scan_ports(device.ip, port_list, show_progress=False)
-    else:
-        print(f"\n=== Scanning Common Ports ===")
-        port_scanner = PortScanner(concurrency=concurrency)
-        
-        for device in devices:
-            print(f"  Scanning common ports on {device.ip}...")
-            device.open_ports = port_scanner.scan_common_ports(device.ip)
+    scan_device_ports(devices, args)
     
     if args.enrich or args.full_port or args.ports != 'common':
         print(f"\n=== Enriching Device Information ===")
         device_info = DeviceInfo()
+        # One snapshot for every device, taken now that discovery has
+        # filled the neighbor table.
+        print(f"  Read {device_info.refresh_neighbors()} neighbor table entries")
         
         for device in devices:
             print(f"  Getting info for {device.ip}...")
@@ -234,6 +226,14 @@ Examples:
                         help='Number of concurrent scans (default: 500)')
     parser.add_argument('--timeout', type=float, default=1.0,
                         help='Timeout for each host/port check in seconds (default: 1.0)')
+    parser.add_argument('--engine', type=str, choices=LanScanner.ENGINES, default='auto',
+                        help='Host discovery engine: "async" (ICMP sockets and non-blocking connects '
+                             'on one event loop), "thread" (ping processes in a thread pool) or '
+                             '"auto" (default)')
+    parser.add_argument('--per-host', type=int, default=256, metavar='N',
+                        help='Maximum port connects in flight to one host (default: 256)')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='Maximum port connects started per second, 0 for no limit (default: 0)')
     
     parser.add_argument('--enrich', action='store_true',
                         help='Enrich device info (MAC vendor, hostname)')
@@ -1,7 +1,11 @@
 """Scanner module for network and port scanning."""
 
 from .lan_scanner import LanScanner
+from .async_discovery import AsyncDiscovery
 from .port_scanner import PortScanner
+from .port_scheduler import PortScheduler
+from .connect_scanner import ConnectScanner
 from .device_info import DeviceInfo
+from .neighbor_table import NeighborTable
 
-__all__ = ['LanScanner', 'PortScanner', 'DeviceInfo']
+__all__ = ['LanScanner', 'AsyncDiscovery', 'PortScanner', 'PortScheduler', 'ConnectScanner', 'DeviceInfo', 'NeighborTable']
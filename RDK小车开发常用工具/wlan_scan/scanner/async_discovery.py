@@ -0,0 +1,246 @@
+"""Asyncio host discovery: ICMP echo and TCP probes from a single event loop."""
+
+import asyncio
+import functools
+import itertools
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.logger import get_logger
+from models import Device
+
+logger = get_logger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+TCP_PROBE_PORTS = [80, 443, 22, 445, 139, 3389]
+ICMP_RECEIVE_BUFFER = 4 * 1024 * 1024
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def open_icmp_socket() -> Tuple[Optional[socket.socket], bool]:
+    """Open a non-blocking ICMP socket.
+
+    Tries an unprivileged datagram socket first (Linux with a matching
+    net.ipv4.ping_group_range, macOS), then a raw socket (root or
+    CAP_NET_RAW).
+
+    Returns:
+        (socket, is_raw), or (None, False) if neither is permitted
+    """
+    for sock_type, is_raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+        try:
+            sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except (OSError, AttributeError):
+            continue
+        sock.setblocking(False)
+        try:
+            # Replies to a whole subnet's burst of requests arrive together.
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ICMP_RECEIVE_BUFFER)
+        except OSError:
+            pass
+        return sock, is_raw
+    return None, False
+
+
+class IcmpPinger:
+    """Sends echo requests to many hosts over one socket and matches the replies."""
+
+    def __init__(self, sock: socket.socket, is_raw: bool):
+        self.sock = sock
+        self.is_raw = is_raw
+        self.identifier = os.getpid() & 0xFFFF
+        self._sequence = itertools.count(1)
+        self._waiting: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        self._loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+    async def ping(self, ip: str, timeout: float) -> Optional[float]:
+        """Round trip time to ``ip`` in milliseconds, or None without a reply."""
+        sequence = next(self._sequence) & 0xFFFF
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, self.identifier, sequence)
+        payload = b'wlan_scan'
+        packet = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, _checksum(header + payload),
+                             self.identifier, sequence) + payload
+
+        future = self._loop.create_future()
+        self._waiting[(ip, sequence)] = future
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    self.sock.sendto(packet, (ip, 0))
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        return None
+                    await asyncio.sleep(0.005)
+                except OSError:
+                    return None
+            await asyncio.wait_for(future, max(deadline - time.monotonic(), 0))
+            return (time.perf_counter() - start) * 1000
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._waiting.pop((ip, sequence), None)
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if self.is_raw:
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, identifier, sequence = struct.unpack('!BBHHH', data[:8])
+            # Datagram sockets only see their own replies, with the
+            # identifier rewritten by the kernel; raw sockets see all ICMP.
+            if icmp_type != ICMP_ECHO_REPLY or (self.is_raw and identifier != self.identifier):
+                continue
+            future = self._waiting.pop((address[0], sequence), None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+
+class AsyncDiscovery:
+    """Finds live hosts with non-blocking probes multiplexed on one event loop.
+
+    Every host first gets an ICMP echo request; hosts that do not answer
+    within the timeout are probed with TCP connects to ``TCP_PROBE_PORTS``.
+    A completed connect or a refused one (the host answered with a reset)
+    counts as alive. At most ``concurrency`` probes are in flight at once:
+    one slot per outstanding echo request and per connecting socket.
+    """
+
+    def __init__(self, concurrency: int = 500, timeout: float = 1.0,
+                 tcp_ports: Optional[List[int]] = None):
+        """Initialize the discovery engine.
+
+        Args:
+            concurrency: Maximum number of probes in flight
+            timeout: Timeout for each probe in seconds
+            tcp_ports: Ports probed when a host does not answer ICMP
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.tcp_ports = tcp_ports if tcp_ports is not None else TCP_PROBE_PORTS
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._pinger: Optional[IcmpPinger] = None
+
+    def discover(self, hosts: List[str],
+                 on_result: Optional[Callable[[str, Optional[Device]], None]] = None
+                 ) -> List[Device]:
+        """Probe ``hosts`` and return a Device for each one that is alive.
+
+        Args:
+            hosts: IP addresses to probe
+            on_result: Called with (ip, Device or None) as each host finishes
+
+        Returns:
+            List of discovered Device objects, in the order they were found
+        """
+        return asyncio.run(self._discover(hosts, on_result))
+
+    async def _discover(self, hosts: List[str], on_result) -> List[Device]:
+        self._limit = asyncio.Semaphore(self.concurrency)
+        self._pinger = None
+        sock, is_raw = open_icmp_socket()
+        if sock is not None:
+            try:
+                self._pinger = IcmpPinger(sock, is_raw)
+            except NotImplementedError:  # the Windows proactor loop has no add_reader
+                sock.close()
+        if self._pinger is None:
+            logger.warning("ICMP sockets are not available; probing with TCP only")
+        devices = []
+
+        def finished(ip: str, task: asyncio.Task) -> None:
+            device = None
+            if task.exception() is not None:
+                logger.debug(f"Error scanning {ip}: {task.exception()}")
+            else:
+                device = task.result()
+            if device is not None:
+                devices.append(device)
+            if on_result is not None:
+                on_result(ip, device)
+
+        try:
+            pending = set()
+            for ip in hosts:
+                # Take the host's first slot before creating its task, so
+                # a /16 does not turn into 65k waiting tasks at once.
+                await self._limit.acquire()
+                task = asyncio.ensure_future(self._check_host(ip))
+                task.add_done_callback(functools.partial(finished, ip))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            if self._pinger is not None:
+                self._pinger.close()
+        return devices
+
+    async def _check_host(self, ip: str) -> Optional[Device]:
+        """Probe one host; called holding one slot of the in-flight limit."""
+        start = time.perf_counter()
+        try:
+            response_time = None
+            if self._pinger is not None:
+                response_time = await self._pinger.ping(ip, self.timeout)
+        finally:
+            self._limit.release()
+
+        if response_time is None and await self._tcp_check_host(ip):
+            response_time = (time.perf_counter() - start) * 1000
+
+        if response_time is None:
+            return None
+        return Device(ip=ip, is_alive=True, response_time=response_time)
+
+    async def _tcp_check_host(self, ip: str) -> bool:
+        probes = [asyncio.ensure_future(self._tcp_probe(ip, port)) for port in self.tcp_ports]
+        try:
+            for probe in asyncio.as_completed(probes):
+                if await probe:
+                    return True
+            return False
+        finally:
+            for probe in probes:
+                probe.cancel()
+
+    async def _tcp_probe(self, ip: str, port: int) -> bool:
+        async with self._limit:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (ip, port)),
+                                       self.timeout)
+                return True
+            except ConnectionRefusedError:
+                return True
+            except (OSError, asyncio.TimeoutError):
+                return False
+            finally:
+                sock.close()
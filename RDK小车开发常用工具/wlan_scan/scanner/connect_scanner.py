@@ -0,0 +1,211 @@
+"""TCP connect scanning with non-blocking sockets multiplexed on one selector."""
+
+import collections
+import errno
+import selectors
+import socket
+import struct
+import sys
+import time
+from typing import Iterable, Iterator, Tuple, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Descriptors kept free for the rest of the process (logging, output files, DNS).
+RESERVED_FDS = 64
+# select() on Windows handles at most 512 sockets per call.
+WINDOWS_SELECT_LIMIT = 500
+
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035}  # 10035: WSAEWOULDBLOCK
+# Out of descriptors or local ports: retry once some connects have finished.
+_OUT_OF_RESOURCES = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL}
+
+
+def max_sockets(requested: int) -> int:
+    """Number of sockets that can be open at once, at most ``requested``.
+
+    Raises the soft RLIMIT_NOFILE towards the hard limit when ``requested``
+    needs it, and keeps ``RESERVED_FDS`` descriptors free.
+    """
+    if sys.platform == 'win32':
+        return max(1, min(requested, WINDOWS_SELECT_LIMIT))
+    if resource is None:
+        return max(1, requested)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = requested + RESERVED_FDS
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError) as e:
+            logger.debug(f"Could not raise the open file limit to {target}: {e}")
+    if soft == resource.RLIM_INFINITY:
+        return max(1, requested)
+    return max(1, min(requested, soft - RESERVED_FDS))
+
+
+class ConnectScanner:
+    """Runs many TCP connects at once from a single thread.
+
+    Each target gets a non-blocking socket whose connect is started and then
+    watched for writability (epoll on Linux, kqueue on BSD/macOS, select on
+    Windows). A completed connect means the port is open; a refused or failed
+    one, or no answer before the socket's own deadline, means it is not. At
+    most ``concurrency`` connects are in flight, further limited by the open
+    file limit, and targets are pulled from the iterable only as slots free
+    up, so memory stays flat however many ports are scanned.
+    """
+
+    def __init__(self, concurrency: int = 500, timeout: float = 0.5):
+        """Initialize the connect scanner.
+
+        Args:
+            concurrency: Maximum number of connects in flight
+            timeout: Timeout for each connect in seconds
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def scan(self, targets: Iterable[Union[Tuple[str, int], float]]
+             ) -> Iterator[Tuple[str, int, bool]]:
+        """Try to connect to every (ip, port) in ``targets``.
+
+        ``targets`` is read lazily, one item per free slot. Besides (ip, port)
+        pairs it may produce a number of seconds, meaning that nothing is
+        ready to start yet (a scheduler holding work back for a rate or
+        per-host limit); it is asked again after that long, or sooner when
+        a connect finishes.
+
+        Args:
+            targets: (ip, port) pairs to connect to, or pauses in seconds
+
+        Yields:
+            (ip, port, is_open) as each connect finishes
+        """
+        limit = max_sockets(self.concurrency)
+        targets = iter(targets)
+        retry = collections.deque()
+        # Every socket gets the same timeout, so insertion order is deadline
+        # order and expiring means popping from the front.
+        in_flight = collections.OrderedDict()
+        selector = selectors.DefaultSelector()
+        exhausted = False
+        wake = None
+
+        try:
+            while True:
+                while len(in_flight) < limit and (retry or not exhausted):
+                    if retry:
+                        target = retry.popleft()
+                    else:
+                        target = next(targets, None)
+                        if target is None:
+                            exhausted = True
+                            break
+                        if not isinstance(target, tuple):
+                            wake = time.monotonic() + target
+                            break
+                    state = self._start(selector, in_flight, target)
+                    if state is None:
+                        continue
+                    if state == 'retry':
+                        if not in_flight:
+                            # Nothing will free up: report it rather than spin.
+                            yield target[0], target[1], False
+                            continue
+                        retry.append(target)
+                        limit = max(1, len(in_flight))
+                        logger.debug(f"Out of sockets, in-flight limit lowered to {limit}")
+                        break
+                    yield target[0], target[1], state == 'open'
+
+                if not in_flight:
+                    if exhausted and not retry:
+                        break
+                    if wake is not None:
+                        time.sleep(max(wake - time.monotonic(), 0))
+                        wake = None
+                    continue
+
+                until = next(iter(in_flight.values()))[3]
+                if wake is not None:
+                    until, wake = min(until, wake), None
+                for key, _ in selector.select(max(until - time.monotonic(), 0)):
+                    sock, ip, port, _ = in_flight.pop(key.fd)
+                    selector.unregister(sock)
+                    is_open = (sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+                               and not self._self_connected(sock))
+                    self._close(sock, is_open)
+                    yield ip, port, is_open
+
+                now = time.monotonic()
+                while in_flight:
+                    fd, (sock, ip, port, deadline) = next(iter(in_flight.items()))
+                    if deadline > now:
+                        break
+                    del in_flight[fd]
+                    selector.unregister(sock)
+                    sock.close()
+                    yield ip, port, False
+        finally:
+            for sock, _, _, _ in in_flight.values():
+                sock.close()
+            selector.close()
+
+    def _start(self, selector, in_flight, target):
+        """Start one connect; returns 'open', 'closed', 'retry' or None if pending."""
+        ip, port = target
+        try:
+            sock = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET,
+                                 socket.SOCK_STREAM)
+        except OSError as e:
+            if e.errno in _OUT_OF_RESOURCES:
+                return 'retry'
+            logger.debug(f"Cannot create socket for {ip}:{port}: {e}")
+            return 'closed'
+
+        sock.setblocking(False)
+        try:
+            err = sock.connect_ex((ip, port))
+        except OSError as e:  # e.g. unresolvable or malformed address
+            logger.debug(f"Cannot connect to {ip}:{port}: {e}")
+            sock.close()
+            return 'closed'
+
+        if err in _IN_PROGRESS:
+            selector.register(sock, selectors.EVENT_WRITE)
+            in_flight[sock.fileno()] = (sock, ip, port, time.monotonic() + self.timeout)
+            return None
+        is_open = err == 0 and not self._self_connected(sock)
+        self._close(sock, is_open)
+        if err in _OUT_OF_RESOURCES:
+            return 'retry'
+        return 'open' if is_open else 'closed'
+
+    @staticmethod
+    def _self_connected(sock: socket.socket) -> bool:
+        """Scanning a local address can pick the target port as the source port,
+        and TCP simultaneous open then "connects" the socket to itself."""
+        try:
+            return sock.getsockname() == sock.getpeername()
+        except OSError:
+            return True
+
+    def _close(self, sock: socket.socket, connected: bool) -> None:
+        if connected:
+            # Reset instead of a FIN handshake: no TIME_WAIT entry per open
+            # port, so rescans do not run out of local ports.
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            except OSError:
+                pass
+        sock.close()
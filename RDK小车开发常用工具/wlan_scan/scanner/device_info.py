@@ -8,6 +8,7 @@ import platform
 
 from core.logger import get_logger
 from core.network_utils import NetworkUtils
+from .neighbor_table import NeighborTable
 
 logger = get_logger(__name__)
 
@@ -66,16 +67,34 @@ class DeviceInfo:
     
     def __init__(self):
         self.network_utils = NetworkUtils()
+        self.neighbors = NeighborTable()
+    
+    def refresh_neighbors(self) -> int:
+        """Take a snapshot of the neighbor table for MAC lookups.
+        
+        Call once after host discovery, when the probes have filled the
+        table, instead of running ``arp`` for every device.
+        
+        Returns:
+            Number of neighbors with a known MAC address
+        """
+        return self.neighbors.refresh()
     
     def get_mac_address(self, ip: str) -> Optional[str]:
         """Get MAC address of a device using ARP.
         
+        Uses the neighbor table snapshot once one has been taken, otherwise
+        asks ``arp`` about this one address.
+        
         Args:
             ip: IP address of the device
             
         Returns:
             MAC address string or None
         """
+        if self.neighbors.loaded:
+            return self.neighbors.get(ip)
+        
         try:
             if self.network_utils.is_windows:
                 result = subprocess.run(
@@ -200,6 +219,9 @@ class DeviceInfo:
         Args:
             device: Device object to enrich
         """
+        if not self.neighbors.loaded:
+            self.refresh_neighbors()
+        
         if not device.mac:
             device.mac = self.get_mac_address(device.ip)
         
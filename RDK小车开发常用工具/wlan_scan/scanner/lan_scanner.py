@@ -10,6 +10,7 @@ from dataclasses import dataclass, field
 from core.network_utils import NetworkUtils
 from core.logger import get_logger
 from models import Device
+from .async_discovery import AsyncDiscovery, open_icmp_socket
 
 logger = get_logger(__name__)
 
@@ -17,15 +18,24 @@ logger = get_logger(__name__)
 class LanScanner:
     """Scans local area networks for active devices."""
     
-    def __init__(self, concurrency: int = 500, timeout: float = 1.0):
+    ENGINES = ('auto', 'async', 'thread')
+    
+    def __init__(self, concurrency: int = 500, timeout: float = 1.0, engine: str = 'auto'):
         """Initialize LAN scanner.
         
         Args:
             concurrency: Number of concurrent scans
             timeout: Timeout for each host check in seconds
+            engine: 'async' probes every host from one event loop with ICMP
+                sockets and non-blocking connects, 'thread' runs ping and
+                blocking connects in a thread pool, 'auto' picks 'async'
+                where an ICMP socket can be opened
         """
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}, expected one of {self.ENGINES}")
         self.concurrency = concurrency
         self.timeout = timeout
+        self.engine = engine
         self.network_utils = NetworkUtils()
         self._scanned_count = 0
         self._found_count = 0
@@ -49,6 +59,47 @@ class LanScanner:
         
         self._scanned_count = 0
         self._found_count = 0
+        
+        if self.resolve_engine() == 'async':
+            devices = self._scan_hosts_async(hosts, show_progress)
+        else:
+            devices = self._scan_hosts_threaded(hosts, show_progress)
+        
+        if show_progress:
+            print(f"\r  Scanned: {self._scanned_count}/{len(hosts)}, Found: {self._found_count}")
+        
+        logger.info(f"Scan complete. Found {len(devices)} active hosts.")
+        return devices
+    
+    def resolve_engine(self) -> str:
+        """Return the engine a scan will use ('async' or 'thread')."""
+        if self.engine != 'auto':
+            return self.engine
+        if self.network_utils.is_windows:
+            return 'thread'
+        sock, _ = open_icmp_socket()
+        if sock is None:
+            logger.info("ICMP sockets not permitted, using the thread engine")
+            return 'thread'
+        sock.close()
+        return 'async'
+    
+    def _count_result(self, device: Optional[Device], total: int, show_progress: bool) -> None:
+        self._scanned_count += 1
+        if device is not None:
+            self._found_count += 1
+        if show_progress and self._scanned_count % 50 == 0:
+            print(f"\r  Scanned: {self._scanned_count}/{total}, Found: {self._found_count}", 
+                  end='', flush=True)
+    
+    def _scan_hosts_async(self, hosts: List[str], show_progress: bool) -> List[Device]:
+        """Probe all hosts from a single event loop."""
+        discovery = AsyncDiscovery(concurrency=self.concurrency, timeout=self.timeout)
+        return discovery.discover(
+            hosts, lambda ip, device: self._count_result(device, len(hosts), show_progress))
+    
+    def _scan_hosts_threaded(self, hosts: List[str], show_progress: bool) -> List[Device]:
+        """Probe the hosts from a thread pool, one ping process per host."""
         devices = []
         
         with concurrent.futures.ThreadPoolExecutor(
@@ -63,22 +114,12 @@ class LanScanner:
                 ip = futures[future]
                 try:
                     result = future.result()
-                    self._scanned_count += 1
-                    
-                    if show_progress and self._scanned_count % 50 == 0:
-                        print(f"\r  Scanned: {self._scanned_count}/{len(hosts)}, Found: {self._found_count}", 
-                              end='', flush=True)
-                    
+                    self._count_result(result, len(hosts), show_progress)
                     if result:
-                        self._found_count += 1
                         devices.append(result)
                 except Exception as e:
                     logger.debug(f"Error scanning {ip}: {e}")
         
-        if show_progress:
-            print(f"\r  Scanned: {self._scanned_count}/{len(hosts)}, Found: {self._found_count}")
-        
-        logger.info(f"Scan complete. Found {len(devices)} active hosts.")
         return devices
     
     def scan_local_network(self, show_progress: bool = True) -> List[Device]:
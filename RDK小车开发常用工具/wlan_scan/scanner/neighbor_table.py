@@ -0,0 +1,134 @@
+"""Snapshot of the operating system's neighbor (ARP/NDP) table."""
+
+import os
+import re
+import subprocess
+import time
+from typing import Dict, Optional
+
+from core.logger import get_logger
+from core.network_utils import NetworkUtils
+
+logger = get_logger(__name__)
+
+PROC_NET_ARP = '/proc/net/arp'
+PROC_IF_INET6 = '/proc/net/if_inet6'
+_MAC = re.compile(r'([0-9a-fA-F]{1,2}[:-]){5}[0-9a-fA-F]{1,2}')
+_INCOMPLETE_MAC = '00:00:00:00:00:00'
+
+
+def _normalize_mac(mac: str) -> str:
+    """Upper case, colon separated, two digits per octet (macOS drops leading zeros)."""
+    return ':'.join(octet.zfill(2) for octet in re.split('[:-]', mac)).upper()
+
+
+class NeighborTable:
+    """IP to MAC address map read from the kernel in a single pass.
+
+    On Linux ``/proc/net/arp`` is read directly and, where IPv6 is
+    configured, ``ip -6 neigh`` is run once; elsewhere ``arp -a`` is run
+    once and parsed. Call ``refresh`` after host discovery, which fills the
+    table with the hosts that were just probed; lookups then cost a dict
+    access instead of a process per device.
+    """
+
+    def __init__(self):
+        self.network_utils = NetworkUtils()
+        self._entries: Dict[str, str] = {}
+        self.loaded = False
+        self.refreshed_at: Optional[float] = None
+
+    def refresh(self) -> int:
+        """Re-read the neighbor table.
+
+        Returns:
+            Number of entries with a known MAC address
+        """
+        entries: Dict[str, str] = {}
+        if os.path.exists(PROC_NET_ARP):
+            entries.update(self._read_proc_arp())
+            if os.path.exists(PROC_IF_INET6):
+                entries.update(self._read_ip_neigh())
+        else:
+            entries.update(self._read_arp_command())
+        self._entries = entries
+        self.loaded = True
+        self.refreshed_at = time.time()
+        logger.debug(f"Neighbor table: {len(entries)} entries")
+        return len(entries)
+
+    def get(self, ip: str) -> Optional[str]:
+        """Get the MAC address of ``ip`` as of the last refresh.
+
+        Args:
+            ip: IP address of the device
+
+        Returns:
+            MAC address string or None
+        """
+        return self._entries.get(ip)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _read_proc_arp(self) -> Dict[str, str]:
+        entries = {}
+        try:
+            with open(PROC_NET_ARP, 'r') as f:
+                next(f, None)  # header
+                for line in f:
+                    parts = line.split()
+                    # IP address, HW type, Flags, HW address, Mask, Device
+                    if len(parts) < 4 or parts[2] == '0x0' or parts[3] == _INCOMPLETE_MAC:
+                        continue
+                    entries[parts[0]] = _normalize_mac(parts[3])
+        except OSError as e:
+            logger.debug(f"Failed to read {PROC_NET_ARP}: {e}")
+        return entries
+
+    def _read_ip_neigh(self) -> Dict[str, str]:
+        entries = {}
+        try:
+            result = subprocess.run(
+                ['ip', '-6', 'neigh', 'show'],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"Failed to run ip neigh: {e}")
+            return entries
+
+        for line in result.stdout.split('\n'):
+            # fe80::1 dev eth0 lladdr aa:bb:cc:dd:ee:ff router REACHABLE
+            parts = line.split()
+            if 'lladdr' in parts and parts.index('lladdr') + 1 < len(parts):
+                if parts[-1] in ('FAILED', 'INCOMPLETE'):
+                    continue
+                entries[parts[0]] = _normalize_mac(parts[parts.index('lladdr') + 1])
+        return entries
+
+    def _read_arp_command(self) -> Dict[str, str]:
+        entries = {}
+        command = ['arp', '-a'] if self.network_utils.is_windows else ['arp', '-an']
+        try:
+            result = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.debug(f"Failed to run {' '.join(command)}: {e}")
+            return entries
+
+        for line in result.stdout.split('\n'):
+            # Windows: "  192.168.1.1     aa-bb-cc-dd-ee-ff     dynamic"
+            # macOS:   "? (192.168.1.1) at aa:bb:cc:dd:ee:ff on en0 ifscope [ethernet]"
+            ip_match = re.search(r'\(?(\d{1,3}(?:\.\d{1,3}){3})\)?', line)
+            mac_match = _MAC.search(line)
+            if ip_match and mac_match:
+                mac = _normalize_mac(mac_match.group(0))
+                if mac != _INCOMPLETE_MAC and mac != 'FF:FF:FF:FF:FF:FF':
+                    entries[ip_match.group(1)] = mac
+        return entries
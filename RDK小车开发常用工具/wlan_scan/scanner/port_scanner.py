@@ -1,12 +1,10 @@
 """Port scanner for scanning ports on network devices."""
 
-import socket
-import concurrent.futures
-import time
-from typing import List, Set, Optional, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from core.logger import get_logger
 from core.network_utils import NetworkUtils
+from .port_scheduler import PortScheduler
 
 logger = get_logger(__name__)
 
@@ -25,18 +23,29 @@ class PortScanner:
         27017: 'MONGODB', 5000: 'FLASK', 8000: 'HTTP-ALT', 9200: 'ELASTIC'
     }
     
-    def __init__(self, concurrency: int = 500, timeout: float = 0.5):
+    def __init__(self, concurrency: int = 500, timeout: float = 0.5,
+                 per_host_limit: Optional[int] = None, rate: float = 0.0):
         """Initialize port scanner.
         
         Args:
-            concurrency: Number of concurrent port scans
+            concurrency: Number of connects in flight at once (one thread
+                drives them all, so thousands are fine)
             timeout: Timeout for each port connection
+            per_host_limit: Maximum connects in flight to one host, None
+                for no limit beyond ``concurrency``
+            rate: Maximum connects started per second, 0 for no limit
         """
         self.concurrency = concurrency
         self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.rate = rate
         self.network_utils = NetworkUtils()
         self._scanned_ports = 0
     
+    def _scheduler(self) -> PortScheduler:
+        return PortScheduler(concurrency=self.concurrency, timeout=self.timeout,
+                             per_host_limit=self.per_host_limit, rate=self.rate)
+    
     def scan_ports(self, ip: str, ports: Optional[List[int]] = None,
                    show_progress: bool = True) -> List[int]:
         """Scan ports on a specific host.
@@ -52,67 +61,47 @@ class PortScanner:
         if ports is None:
             ports = list(self.COMMON_PORTS.keys())
         
-        if ports == list(range(0, 65536)):
-            ports = self._generate_all_ports()
-        
         logger.debug(f"Scanning {len(ports)} ports on {ip}")
         
         self._scanned_ports = 0
-        open_ports = []
+        found = 0
         
-        port_chunks = self._chunk_list(ports, 1000)
+        def count(_ip: str, _port: int, is_open: bool) -> None:
+            nonlocal found
+            self._scanned_ports += 1
+            found += is_open
+            if show_progress and self._scanned_ports % 1000 == 0:
+                print(f"\r  Scanned: {self._scanned_ports}/{len(ports)} ports, Open: {found}",
+                      end='', flush=True)
         
-        for chunk in port_chunks:
-            chunk_open = self._scan_port_chunk(ip, chunk, show_progress)
-            open_ports.extend(chunk_open)
+        open_ports = []
+        for _, open_ports in self._scheduler().scan({ip: ports}, on_result=count):
+            pass
+        
+        if show_progress:
+            print(f"\r  Scanned: {self._scanned_ports}/{len(ports)} ports, Open: {found}")
         
         logger.debug(f"Found {len(open_ports)} open ports on {ip}")
-        return sorted(open_ports)
-    
-    def _generate_all_ports(self) -> List[int]:
-        """Generate list of all ports (0-65535)."""
-        return list(range(0, 65536))
-    
-    def _chunk_list(self, lst: List, chunk_size: int) -> List[List]:
-        """Split list into chunks."""
-        return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+        return open_ports
     
-    def _scan_port_chunk(self, ip: str, ports: List[int], 
-                         show_progress: bool) -> List[int]:
-        """Scan a chunk of ports."""
-        open_ports = []
+    def scan_hosts(self, jobs: Dict[str, List[int]]) -> Iterator[Tuple[str, List[int]]]:
+        """Scan several hosts at once, sharing one pool of connects.
         
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.concurrency
-        ) as executor:
-            futures = {
-                executor.submit(self._check_port, ip, port): port
-                for port in ports
-            }
-            
-            for future in concurrent.futures.as_completed(futures):
-                port = futures[future]
-                try:
-                    if future.result():
-                        open_ports.append(port)
-                        logger.debug(f"Port {port} is open on {ip}")
-                except Exception as e:
-                    logger.debug(f"Error scanning port {port}: {e}")
-                
-                self._scanned_ports += 1
+        Ports of all hosts are interleaved, so a slow host does not hold
+        up the others, and each host is reported as soon as it is done.
         
-        return open_ports
+        Args:
+            jobs: Mapping of IP address to the ports to scan on it
+            
+        Yields:
+            (ip, sorted open ports) as each host finishes
+        """
+        logger.debug(f"Scanning {sum(len(p) for p in jobs.values())} ports on {len(jobs)} hosts")
+        return self._scheduler().scan(jobs)
     
-    def _check_port(self, ip: str, port: int) -> bool:
-        """Check if a single port is open."""
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.timeout)
-            result = sock.connect_ex((ip, port))
-            sock.close()
-            return result == 0
-        except Exception:
-            return False
+    def _generate_all_ports(self) -> List[int]:
+        """Generate list of all ports (0-65535)."""
+        return list(range(0, 65536))
     
     def scan_common_ports(self, ip: str) -> List[int]:
         """Scan only common ports on a host.
@@ -148,31 +137,12 @@ class PortScanner:
         Returns:
             Dictionary mapping IP to open ports
         """
-        from core.network_utils import NetworkUtils
-        
-        utils = NetworkUtils()
+        utils = self.network_utils
         start_int = utils.ip_to_int(start_ip)
         end_int = utils.ip_to_int(end_ip)
         
-        ips = [utils.int_to_ip(i) for i in range(start_int, end_int + 1)]
-        
-        results = {}
-        
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=min(self.concurrency, 50)
-        ) as executor:
-            futures = {
-                executor.submit(self.scan_ports, ip, ports, False): ip
-                for ip in ips
-            }
-            
-            for future in concurrent.futures.as_completed(futures):
-                ip = futures[future]
-                try:
-                    open_ports = future.result()
-                    if open_ports:
-                        results[ip] = open_ports
-                except Exception as e:
-                    logger.debug(f"Error scanning {ip}: {e}")
+        if ports is None:
+            ports = list(self.COMMON_PORTS.keys())
+        jobs = {utils.int_to_ip(i): ports for i in range(start_int, end_int + 1)}
         
-        return results
+        return {ip: open_ports for ip, open_ports in self.scan_hosts(jobs) if open_ports}
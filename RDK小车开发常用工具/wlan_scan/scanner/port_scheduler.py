@@ -0,0 +1,120 @@
+"""Schedules port scans of many hosts onto one shared connect scanner."""
+
+import collections
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from core.logger import get_logger
+from .connect_scanner import ConnectScanner
+
+logger = get_logger(__name__)
+
+
+class PortScheduler:
+    """Interleaves (host, port) work from many hosts into one pool of connects.
+
+    Hosts take turns round robin, one port at a time, so a host that drops
+    probes (every connect waits for the timeout) holds at most
+    ``per_host_limit`` of the ``concurrency`` slots while the other hosts
+    keep being scanned. ``rate`` caps how many connects are started per
+    second across all hosts. Results come back per host, as soon as the
+    last port of that host has been answered.
+    """
+
+    def __init__(self, concurrency: int = 500, timeout: float = 0.5,
+                 per_host_limit: Optional[int] = None, rate: float = 0.0):
+        """Initialize the scheduler.
+
+        Args:
+            concurrency: Maximum number of connects in flight in total
+            timeout: Timeout for each connect in seconds
+            per_host_limit: Maximum number of connects in flight to one
+                host, None for no limit beyond ``concurrency``
+            rate: Maximum number of connects started per second, 0 for
+                no limit
+        """
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.rate = rate
+
+    def scan(self, jobs: Dict[str, List[int]],
+             on_result: Optional[Callable[[str, int, bool], None]] = None
+             ) -> Iterator[Tuple[str, List[int]]]:
+        """Scan the ports of every host in ``jobs``.
+
+        Args:
+            jobs: Mapping of IP address to the ports to scan on it
+            on_result: Called with (ip, port, is_open) as each connect finishes
+
+        Yields:
+            (ip, sorted open ports) as each host finishes
+        """
+        remaining = {}
+        open_ports = {}
+        for ip, ports in jobs.items():
+            if ports:
+                remaining[ip] = len(ports)
+                open_ports[ip] = []
+            else:
+                yield ip, []
+        if not remaining:
+            return
+
+        in_flight = collections.Counter()
+        engine = ConnectScanner(concurrency=self.concurrency, timeout=self.timeout)
+        targets = self._targets({ip: jobs[ip] for ip in remaining}, in_flight)
+        for ip, port, is_open in engine.scan(targets):
+            in_flight[ip] -= 1
+            if on_result is not None:
+                on_result(ip, port, is_open)
+            if is_open:
+                open_ports[ip].append(port)
+                logger.debug(f"Port {port} is open on {ip}")
+            remaining[ip] -= 1
+            if not remaining[ip]:
+                del remaining[ip]
+                yield ip, sorted(open_ports.pop(ip))
+
+    def _targets(self, jobs: Dict[str, List[int]],
+                 in_flight: collections.Counter) -> Iterator[Union[Tuple[str, int], float]]:
+        """Produce targets round robin over hosts, honouring both limits.
+
+        ``in_flight`` is decremented by ``scan`` as results come back; the
+        engine reads this generator on the same thread, so it always sees
+        current counts. When every host with work left is at its limit, or
+        the rate allows no connect yet, a pause is produced instead.
+        """
+        per_host = self.per_host_limit or self.concurrency
+        rotation = collections.deque(jobs)
+        position = dict.fromkeys(jobs, 0)
+        # Token bucket holding up to 10 ms of connects, at least one.
+        capacity = max(1.0, self.rate / 100)
+        tokens, refilled = capacity, time.monotonic()
+
+        while rotation:
+            if self.rate > 0:
+                now = time.monotonic()
+                tokens = min(capacity, tokens + (now - refilled) * self.rate)
+                refilled = now
+                if tokens < 1:
+                    yield (1 - tokens) / self.rate
+                    continue
+
+            for _ in range(len(rotation)):
+                ip = rotation.popleft()
+                if in_flight[ip] >= per_host:
+                    rotation.append(ip)
+                    continue
+                ports = jobs[ip]
+                port = ports[position[ip]]
+                position[ip] += 1
+                if position[ip] < len(ports):
+                    rotation.append(ip)
+                in_flight[ip] += 1
+                tokens -= 1
+                yield ip, port
+                break
+            else:
+                # Every host is at its limit; a finishing connect frees one.
+                yield self.timeout
@@ -0,0 +1,105 @@
+"""Tests for PortScheduler: interleaving, per-host limit, rate limit, results."""
+
+import collections
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scanner import PortScanner, PortScheduler  # noqa: E402
+
+
+def _take(targets, count):
+    return [next(targets) for _ in range(count)]
+
+
+class TargetOrderTest(unittest.TestCase):
+
+    def test_hosts_are_interleaved(self):
+        scheduler = PortScheduler(concurrency=100)
+        in_flight = collections.Counter()
+        targets = scheduler._targets({'a': [1, 2, 3], 'b': [1, 2], 'c': [1]}, in_flight)
+        self.assertEqual(list(targets), [('a', 1), ('b', 1), ('c', 1),
+                                         ('a', 2), ('b', 2), ('a', 3)])
+
+    def test_per_host_limit(self):
+        scheduler = PortScheduler(concurrency=100, timeout=0.5, per_host_limit=2)
+        in_flight = collections.Counter()
+        targets = scheduler._targets({'a': [1, 2, 3, 4], 'b': [1, 2, 3]}, in_flight)
+
+        self.assertEqual(_take(targets, 4), [('a', 1), ('b', 1), ('a', 2), ('b', 2)])
+        self.assertEqual(in_flight, {'a': 2, 'b': 2})
+        # Both hosts are at their limit: the engine is told to wait.
+        self.assertIsInstance(next(targets), float)
+
+        in_flight['b'] -= 1
+        self.assertEqual(next(targets), ('b', 3))
+        self.assertIsInstance(next(targets), float)
+
+        in_flight['a'] -= 2
+        self.assertEqual(_take(targets, 2), [('a', 3), ('a', 4)])
+        self.assertEqual(list(targets), [])
+
+    def test_rate_limit_pauses(self):
+        scheduler = PortScheduler(concurrency=100, rate=10)
+        targets = scheduler._targets({'a': [1, 2]}, collections.Counter())
+        self.assertEqual(next(targets), ('a', 1))
+        pause = next(targets)
+        self.assertIsInstance(pause, float)
+        self.assertLessEqual(pause, 0.1)
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listeners = []
+        for _ in range(3):
+            sock = socket.socket()
+            sock.bind(('127.0.0.1', 0))
+            sock.listen(16)
+            self.listeners.append(sock)
+        self.open_ports = sorted(sock.getsockname()[1] for sock in self.listeners)
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+
+    def tearDown(self):
+        for sock in self.listeners:
+            sock.close()
+
+    def test_results_per_host(self):
+        ports = self.open_ports + [self.closed_port]
+        jobs = {'127.0.0.1': ports, '127.0.0.2': [self.closed_port], '127.0.0.3': []}
+        scheduler = PortScheduler(concurrency=4, timeout=2.0, per_host_limit=2)
+        results = dict(scheduler.scan(jobs))
+        self.assertEqual(results, {'127.0.0.1': self.open_ports,
+                                   '127.0.0.2': [], '127.0.0.3': []})
+
+    def test_per_host_limit_holds_during_scan(self):
+        scheduler = PortScheduler(concurrency=50, timeout=2.0, per_host_limit=3)
+        peak = collections.Counter()
+        original = scheduler._targets
+
+        def watched(jobs, in_flight):
+            for target in original(jobs, in_flight):
+                if isinstance(target, tuple):
+                    peak[target[0]] = max(peak[target[0]], in_flight[target[0]])
+                yield target
+
+        scheduler._targets = watched
+        jobs = {f'127.0.0.{i}': list(range(40000, 40200)) for i in range(1, 5)}
+        self.assertEqual(len(list(scheduler.scan(jobs))), 4)
+        self.assertEqual(max(peak.values()), 3)
+
+    def test_scan_range(self):
+        scanner = PortScanner(concurrency=20, timeout=2.0)
+        results = scanner.scan_range('127.0.0.1', '127.0.0.3', self.open_ports)
+        # Listeners are bound to 127.0.0.1 only; hosts without open ports are left out.
+        self.assertEqual(results, {'127.0.0.1': self.open_ports})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Building blocks for the LAN share server (downloads, listings, caches).
+
+The submodules are imported when one of their names is first used, so a
+process only pays for the parts it touches: the archive writers (tarfile,
+zstandard) are not loaded until the first batch download.
+"""
+
+import importlib
+from typing import TYPE_CHECKING
+
+# exported name -> submodule defining it
+_EXPORTS = {
+    'ServiceError': 'errors',
+    'LeaderLock': 'leader',
+    'INTERNAL_DIR_NAME': 'paths', 'resolve_shared_path': 'paths',
+    'file_response': 'file_response', 'make_etag': 'file_response',
+    'SmallFileCache': 'filecache',
+    'FsEvent': 'watcher', 'InotifyWatcher': 'watcher', 'create_watcher': 'watcher',
+    'DirectorySizes': 'dirsizes',
+    'ChangeFeed': 'events',
+    'DirectoryLister': 'listing', 'ListingQueryError': 'listing', 'make_name_filter': 'listing',
+    'iter_manifest': 'listing',
+    'UploadError': 'upload', 'UploadManager': 'upload', 'UploadSession': 'upload',
+    'SearchIndex': 'search',
+    'FAST_ALGORITHM': 'hashing', 'HashCache': 'hashing',
+    'ThumbnailCache': 'thumbs', 'ThumbnailError': 'thumbs',
+    'ARCHIVE_FORMATS': 'archive', 'ZSTD_AVAILABLE': 'archive', 'ArchiveCache': 'archive',
+    'collect_entries': 'archive', 'stored_zip_length': 'archive', 'stream_tar': 'archive',
+    'stream_tar_zst': 'archive', 'stream_zip': 'archive', 'tar_length': 'archive',
+    'BlockingPool': 'blocking',
+    'BandwidthMiddleware': 'bandwidth', 'BandwidthScheduler': 'bandwidth',
+    'PrecompressedStaticFiles': 'compression', 'compressed_response': 'compression',
+    'negotiate': 'compression', 'variant_etag': 'compression',
+    'ImportProfiler': 'importprofile',
+    'TransferLog': 'transfers', 'TransferMiddleware': 'transfers',
+    'Mirror': 'sync', 'SyncError': 'sync', 'open_delta': 'sync',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    submodule = importlib.import_module(f".{module}", __name__)
+    # Bind every name of the submodule at once: importing it has just set the
+    # package attribute of its own name (file_response) to the module itself.
+    for export, owner in _EXPORTS.items():
+        if owner == module:
+            globals()[export] = getattr(submodule, export)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if TYPE_CHECKING:
+    from .errors import ServiceError
+    from .leader import LeaderLock
+    from .paths import INTERNAL_DIR_NAME, resolve_shared_path
+    from .file_response import file_response, make_etag
+    from .filecache import SmallFileCache
+    from .watcher import FsEvent, InotifyWatcher, create_watcher
+    from .dirsizes import DirectorySizes
+    from .events import ChangeFeed
+    from .listing import DirectoryLister, ListingQueryError, iter_manifest, make_name_filter
+    from .upload import UploadError, UploadManager, UploadSession
+    from .search import SearchIndex
+    from .hashing import FAST_ALGORITHM, HashCache
+    from .thumbs import ThumbnailCache, ThumbnailError
+    from .archive import (ARCHIVE_FORMATS, ZSTD_AVAILABLE, ArchiveCache, collect_entries,
+                          stored_zip_length, stream_tar, stream_tar_zst, stream_zip, tar_length)
+    from .blocking import BlockingPool
+    from .bandwidth import BandwidthMiddleware, BandwidthScheduler
+    from .compression import PrecompressedStaticFiles, compressed_response, negotiate, variant_etag
+    from .importprofile import ImportProfiler
+    from .transfers import TransferLog, TransferMiddleware
+    from .sync import Mirror, SyncError, open_delta
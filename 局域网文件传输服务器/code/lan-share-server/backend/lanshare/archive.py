@@ -0,0 +1,384 @@
+"""Streaming zip and tar archives of shared files, with a disk cache of finished archives."""
+
+import hashlib
+import json
+import os
+import secrets
+import struct
+import tarfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from .fileio import read_at
+from .paths import INTERNAL_DIR_NAME, internal_dir, resolve_shared_path
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+READ_SIZE = 1024 * 1024
+COMPRESSION_METHODS = {"store": 0, "deflate": 8}
+# Media type and file suffix of each archive format.
+ARCHIVE_FORMATS = {
+    "zip": ("application/zip", ".zip"),
+    "tar": ("application/x-tar", ".tar"),
+    "tar.zst": ("application/zstd", ".tar.zst"),
+}
+# A partial archive of another process that has not grown for this long was
+# left behind by a process that died.
+STALE_TMP_AGE = 3600.0
+
+_ZIP32_MAX = 0xFFFFFFFF
+_ZIP32_MAX_COUNT = 0xFFFF
+_FLAGS = 0x0808  # sizes in a trailing data descriptor, UTF-8 names
+
+
+@dataclass
+class ArchiveEntry:
+    """One file of an archive, as it was when the archive was requested."""
+    path: Path
+    name: str
+    size: int
+    mtime_ns: int
+
+
+def collect_entries(shared_dir: Path, rel_paths: List[str]) -> List[ArchiveEntry]:
+    """Expand the requested files and folders into a sorted list of files.
+
+    Archive names are relative to the shared directory's parent, so every
+    archive has the shared directory's name as its single top-level folder.
+    Paths outside the shared tree and the internal directory are skipped;
+    a file selected twice (directly and through its folder) appears once.
+    """
+    base_len = len(os.path.join(str(shared_dir.parent), ""))
+    entries = {}
+
+    def add(path: str, st: os.stat_result) -> None:
+        name = path[base_len:].replace("\\", "/")
+        entries[name] = ArchiveEntry(Path(path), name, st.st_size, st.st_mtime_ns)
+
+    for rel_path in rel_paths:
+        full_path = resolve_shared_path(shared_dir, rel_path)
+        if full_path is None:
+            continue
+        if full_path.is_file():
+            add(str(full_path), full_path.stat())
+            continue
+        stack = [str(full_path)] if full_path.is_dir() else []
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if directory == str(shared_dir) and entry.name == INTERNAL_DIR_NAME:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            add(entry.path, entry.stat())
+            except OSError:
+                continue
+    return [entries[name] for name in sorted(entries)]
+
+
+def _dos_datetime(mtime_ns: int):
+    t = time.localtime(mtime_ns / 1e9)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+def _needs_zip64(size: int) -> bool:
+    # Deflate can make incompressible data slightly larger; leave headroom.
+    return size + size // 100 + 1024 > _ZIP32_MAX
+
+
+def _local_header(name: bytes, method: int, mtime_ns: int, zip64: bool) -> bytes:
+    dos_time, dos_date = _dos_datetime(mtime_ns)
+    extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+    sizes = _ZIP32_MAX if zip64 else 0
+    return struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, _FLAGS, method,
+                       dos_time, dos_date, 0, sizes, sizes, len(name), len(extra)) + name + extra
+
+
+def _data_descriptor(crc: int, compressed: int, size: int, zip64: bool) -> bytes:
+    if zip64:
+        return struct.pack("<IIQQ", 0x08074B50, crc, compressed, size)
+    return struct.pack("<IIII", 0x08074B50, crc, compressed, size)
+
+
+def _central_header(name: bytes, method: int, mtime_ns: int, zip64: bool, crc: int,
+                    compressed: int, size: int, offset: int) -> bytes:
+    dos_time, dos_date = _dos_datetime(mtime_ns)
+    fields = [size, compressed] if zip64 else []
+    if offset >= _ZIP32_MAX:
+        fields.append(offset)
+    extra = struct.pack("<HH" + "Q" * len(fields), 1, 8 * len(fields), *fields) if fields else b""
+    version = 45 if extra else 20
+    return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, _FLAGS,
+                       method, dos_time, dos_date, crc,
+                       _ZIP32_MAX if zip64 else compressed, _ZIP32_MAX if zip64 else size,
+                       len(name), len(extra), 0, 0, 0, 0o100644 << 16,
+                       min(offset, _ZIP32_MAX)) + name + extra
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    records = b""
+    if count >= _ZIP32_MAX_COUNT or cd_offset >= _ZIP32_MAX or cd_size >= _ZIP32_MAX:
+        zip64_end = cd_offset + cd_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, (3 << 8) | 45, 45, 0, 0,
+                               count, count, cd_size, cd_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1)
+    return records + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(count, _ZIP32_MAX_COUNT),
+                                 min(count, _ZIP32_MAX_COUNT), min(cd_size, _ZIP32_MAX),
+                                 min(cd_offset, _ZIP32_MAX), 0)
+
+
+def stored_zip_length(entries: List[ArchiveEntry]) -> int:
+    """Exact size of the uncompressed archive ``stream_zip`` produces for ``entries``.
+
+    Every header field that affects the length (name, zip64 use, offsets)
+    is known before any file is read, so the whole length is too.
+    """
+    offset = cd_size = 0
+    for entry in entries:
+        name = entry.name.encode("utf-8")
+        zip64 = _needs_zip64(entry.size)
+        cd_size += len(_central_header(name, 0, entry.mtime_ns, zip64, 0, entry.size,
+                                       entry.size, offset))
+        offset += (len(_local_header(name, 0, entry.mtime_ns, zip64)) + entry.size
+                   + len(_data_descriptor(0, entry.size, entry.size, zip64)))
+    return offset + cd_size + len(_end_records(len(entries), offset, cd_size))
+
+
+def stream_zip(entries: List[ArchiveEntry], compression: str = "deflate") -> Iterator[bytes]:
+    """Yield a zip archive of ``entries`` in pieces of about ``READ_SIZE`` bytes.
+
+    Each piece costs at most a few ``READ_SIZE`` reads, even when the data
+    compresses to nearly nothing; a piece may then be empty. This keeps the
+    time between pieces short, which is when a stream can be abandoned.
+
+    Sizes and CRCs follow each file's data in a data descriptor, so the
+    archive can be sent while it is being built. A file whose size changed
+    since it was collected aborts the stream, since for stored archives the
+    announced Content-Length would no longer be true.
+    """
+    return _coalesce(_zip_pieces(entries, COMPRESSION_METHODS[compression]))
+
+
+def _coalesce(pieces: Iterator[bytes]) -> Iterator[bytes]:
+    # Merge small pieces up to READ_SIZE; full-size reads pass through
+    # uncopied. Empty pieces are passed on as stopping points.
+    buffer = bytearray()
+    for piece in pieces:
+        if not buffer and len(piece) >= READ_SIZE:
+            yield piece
+            continue
+        buffer += piece
+        if len(buffer) >= READ_SIZE or not piece:
+            yield bytes(buffer)
+            buffer.clear()
+    yield bytes(buffer)
+
+
+def _zip_pieces(entries: List[ArchiveEntry], method: int) -> Iterator[bytes]:
+    # Headers and descriptors are tiny; stream_zip merges them with the data
+    # so archives of many small files do not cost one send per header. An
+    # empty piece means a read produced no compressed output yet.
+    central = []
+    offset = 0
+    for entry in entries:
+        name = entry.name.encode("utf-8")
+        zip64 = _needs_zip64(entry.size)
+        header = _local_header(name, method, entry.mtime_ns, zip64)
+        yield header
+
+        crc = compressed = remaining = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if method else None
+        with open(entry.path, "rb") as fh:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            remaining = entry.size
+            while remaining:
+                chunk = read_at(fh, entry.size - remaining, min(READ_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                crc = zlib.crc32(chunk, crc)
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                compressed += len(chunk)
+                yield chunk
+        if remaining:
+            raise OSError(f"{entry.path} changed while it was being archived")
+        if compressor is not None:
+            tail = compressor.flush()
+            compressed += len(tail)
+            yield tail
+
+        yield _data_descriptor(crc, compressed, entry.size, zip64)
+        central.append(_central_header(name, method, entry.mtime_ns, zip64, crc,
+                                       compressed, entry.size, offset))
+        offset += len(header) + compressed + len(_data_descriptor(0, 0, 0, zip64))
+
+    cd_size = sum(len(header) for header in central)
+    yield b"".join(central) + _end_records(len(central), offset, cd_size)
+
+
+def _tar_header(entry: ArchiveEntry) -> bytes:
+    info = tarfile.TarInfo(entry.name)
+    info.size = entry.size
+    info.mtime = entry.mtime_ns // 1_000_000_000
+    info.mode = 0o644
+    # pax records are added only where ustar falls short: non-ASCII or long
+    # names and files of 8 GiB and more.
+    return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+
+def _tar_padding(size: int) -> int:
+    return -size % tarfile.BLOCKSIZE
+
+
+def tar_length(entries: List[ArchiveEntry]) -> int:
+    """Exact size of the archive ``stream_tar`` produces for ``entries``."""
+    return sum(len(_tar_header(entry)) + entry.size + _tar_padding(entry.size)
+               for entry in entries) + 2 * tarfile.BLOCKSIZE
+
+
+def stream_tar(entries: List[ArchiveEntry]) -> Iterator[bytes]:
+    """Yield an uncompressed tar archive of ``entries``.
+
+    File data is read in ``READ_SIZE`` chunks at aligned offsets and passed
+    on as read; only headers and padding are merged into other pieces.
+    There is nothing to compute, so the archive costs little more CPU than
+    sending the files one by one, and its length is known up front.
+    """
+    return _coalesce(_tar_pieces(entries))
+
+
+def stream_tar_zst(entries: List[ArchiveEntry], level: int = 3, threads: int = 0) -> Iterator[bytes]:
+    """Yield a zstd-compressed tar archive of ``entries``.
+
+    ``threads`` compression workers are used, 0 meaning one per CPU. The
+    compressor keeps whole jobs buffered, so many pieces are empty.
+    """
+    if not ZSTD_AVAILABLE:
+        raise RuntimeError("tar.zst archives need the zstandard module")
+    compressor = zstandard.ZstdCompressor(level=level, threads=threads or -1).compressobj()
+    for piece in _coalesce(_tar_pieces(entries)):
+        yield compressor.compress(piece)
+    yield compressor.flush()
+
+
+def _tar_pieces(entries: List[ArchiveEntry]) -> Iterator[bytes]:
+    for entry in entries:
+        yield _tar_header(entry)
+        with open(entry.path, "rb") as fh:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            offset = 0
+            while offset < entry.size:
+                chunk = read_at(fh, offset, min(READ_SIZE, entry.size - offset))
+                if not chunk:
+                    break
+                offset += len(chunk)
+                yield chunk
+        if offset != entry.size:
+            raise OSError(f"{entry.path} changed while it was being archived")
+        yield bytes(_tar_padding(entry.size))
+    yield bytes(2 * tarfile.BLOCKSIZE)
+
+
+class ArchiveCache:
+    """Finished archives kept under ``.lanshare/archives`` for repeat downloads.
+
+    The cache key covers the format or compression method and every archived file's
+    name, size and mtime, so a cached archive is only reused while all of
+    its files are unchanged. Hits refresh the file's mtime; when the cache
+    outgrows ``max_bytes`` the least recently used archives are deleted.
+    """
+
+    def __init__(self, shared_dir: Path, max_bytes: int = 4 * 1024 * 1024 * 1024):
+        self.cache_dir = internal_dir(shared_dir, "archives")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Other workers share the directory and may be filling archives right
+        # now: only remove our own leftovers and those nobody writes to.
+        own = f".{os.getpid()}."
+        now = time.time()
+        for stale in self.cache_dir.glob("*.tmp"):
+            try:
+                if own in stale.name or now - stale.stat().st_mtime > STALE_TMP_AGE:
+                    stale.unlink()
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def key(entries: List[ArchiveEntry], compression: str) -> str:
+        digest = hashlib.sha256(compression.encode())
+        for entry in entries:
+            digest.update(json.dumps([entry.name, entry.size, entry.mtime_ns]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, key: str, archive_format: str = "zip") -> Optional[Path]:
+        """Return the cached archive for ``key`` and mark it as recently used."""
+        path = self.cache_dir / (key + ARCHIVE_FORMATS[archive_format][1])
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def fill(self, key: str, pieces: Iterator[bytes], archive_format: str = "zip") -> Iterator[bytes]:
+        """Pass ``pieces`` through, saving them as the archive for ``key``.
+
+        The archive only enters the cache once the last piece was produced;
+        an interrupted stream leaves nothing behind.
+        """
+        target = self.cache_dir / (key + ARCHIVE_FORMATS[archive_format][1])
+        tmp = self.cache_dir / f"{key}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+        complete = False
+        try:
+            with open(tmp, "wb") as fh:
+                for piece in pieces:
+                    fh.write(piece)
+                    yield piece
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp, target)
+                self._evict()
+            else:
+                try:
+                    tmp.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            archives = []
+            for path in self.cache_dir.iterdir():
+                if path.suffix == ".tmp":
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                archives.append((st.st_mtime, st.st_size, path))
+            archives.sort()
+            total = sum(size for _, size, _ in archives)
+            for _, size, path in archives:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                except OSError:
+                    pass
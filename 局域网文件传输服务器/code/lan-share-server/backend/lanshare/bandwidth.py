@@ -0,0 +1,231 @@
+"""Fair sharing of outgoing bandwidth between download clients."""
+
+import asyncio
+import collections
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Bytes a client may send per round-robin turn before the next client's turn.
+QUANTUM = 256 * 1024
+# Rates are averaged over windows of this many seconds.
+RATE_WINDOW = 1.0
+# Idle clients are forgotten by a sweep that runs at most this often.
+PRUNE_INTERVAL = 30.0
+
+
+class TokenBucket:
+    """A token bucket that hands out reservations instead of blocking.
+
+    ``reserve`` always succeeds and returns how long the caller has to wait
+    before using the reserved bytes; the bucket may go into debt, so single
+    sends larger than the burst size are fine.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate / 4, 64 * 1024)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: int) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+
+class _Client:
+    def __init__(self, rate: Optional[float]):
+        self.bucket = TokenBucket(rate) if rate else None
+        self.waiting: Deque[Tuple[int, asyncio.Future]] = collections.deque()
+        self.deficit = 0
+        self.streams = 0
+        self.sent = 0
+        self.window_start = time.monotonic()
+        self.window_sent = 0
+        self.rate = 0.0
+
+    def count(self, amount: int) -> None:
+        self.sent += amount
+        self.window_sent += amount
+        now = time.monotonic()
+        if now - self.window_start >= RATE_WINDOW:
+            self.rate = self.window_sent / (now - self.window_start)
+            self.window_start, self.window_sent = now, 0
+
+    def current_rate(self) -> float:
+        idle = time.monotonic() - self.window_start
+        if idle >= 2 * RATE_WINDOW:
+            return 0.0
+        return self.rate
+
+
+class BandwidthScheduler:
+    """Shares ``total_rate`` bytes/s between clients, at most ``client_rate`` each.
+
+    Every response body piece first waits for the client's own bucket and
+    then for its turn at the shared bucket. Turns go round-robin over the
+    clients that are waiting (deficit round robin with a ``QUANTUM`` byte
+    quantum), so each active client gets an equal share no matter how many
+    connections it opens, and a single client still gets the whole link
+    when nobody else is downloading. A rate of 0 or None means no limit.
+
+    A client on one connection has at most one piece waiting, so its queue
+    drains on every grant. It keeps the rest of its quantum while it has a
+    stream open, and a piece that fits in it continues the client's turn
+    ahead of the other clients; otherwise small pieces would get one piece
+    per turn while a client with several connections gets a full quantum.
+    """
+
+    def __init__(self, total_rate: Optional[float] = None, client_rate: Optional[float] = None):
+        self.total_rate = total_rate or None
+        self.client_rate = client_rate or None
+        self._bucket = TokenBucket(self.total_rate) if self.total_rate else None
+        self._clients: Dict[str, _Client] = {}
+        self._turns: Deque[str] = collections.deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._pruned = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return self.total_rate is not None or self.client_rate is not None
+
+    def open(self, client: str) -> None:
+        """Register a response stream of ``client``."""
+        if time.monotonic() - self._pruned >= PRUNE_INTERVAL:
+            self._prune()
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = _Client(self.client_rate)
+        state.streams += 1
+
+    def close(self, client: str) -> None:
+        state = self._clients.get(client)
+        if state is not None:
+            state.streams -= 1
+            if state.streams <= 0:
+                state.deficit = 0
+
+    async def send(self, client: str, amount: int) -> None:
+        """Wait until ``client`` may send ``amount`` more bytes."""
+        state = self._clients[client]
+        if state.bucket is not None:
+            delay = state.bucket.reserve(amount)
+            if delay:
+                await asyncio.sleep(delay)
+        if self._bucket is not None:
+            granted = asyncio.get_running_loop().create_future()
+            if not state.waiting:
+                if state.deficit >= amount:
+                    self._turns.appendleft(client)  # the rest of its turn
+                else:
+                    self._turns.append(client)
+            state.waiting.append((amount, granted))
+            self._ensure_dispatcher()
+            self._wakeup.set()
+            await granted
+        state.count(amount)
+
+    def count(self, client: str, amount: int) -> None:
+        """Record bytes sent without throttling (e.g. a zero-copy file send)."""
+        state = self._clients.get(client)
+        if state is not None:
+            state.count(amount)
+
+    def stats(self) -> List[Dict[str, object]]:
+        """Current rate (bytes/s), open streams and total bytes per client."""
+        self._prune()
+        return sorted(({"client": client, "rate": round(state.current_rate()),
+                        "streams": state.streams, "bytes_sent": state.sent}
+                       for client, state in self._clients.items()),
+                      key=lambda item: -item["rate"])
+
+    def _prune(self) -> None:
+        """Forget clients with no open stream that have been idle for a while."""
+        self._pruned = time.monotonic()
+        for client, state in list(self._clients.items()):
+            if state.streams <= 0 and not state.waiting and state.current_rate() == 0:
+                del self._clients[client]
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        delay = 0.0
+        while True:
+            if delay:
+                # Wait out the previous grant before choosing the next turn,
+                # so the client that was just served is queued up again.
+                await asyncio.sleep(delay)
+                delay = 0.0
+            if not self._turns:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            client = self._turns.popleft()
+            state = self._clients.get(client)
+            if state is None:
+                continue
+            while state.waiting and state.waiting[0][1].done():  # cancelled
+                state.waiting.popleft()
+            if state.waiting and state.waiting[0][0] > state.deficit:
+                state.deficit += QUANTUM  # a new turn
+            while state.waiting and state.waiting[0][0] <= state.deficit:
+                amount, granted = state.waiting.popleft()
+                state.deficit -= amount
+                delay = self._bucket.reserve(amount)
+                if not granted.done():
+                    granted.set_result(None)
+            if state.waiting:
+                self._turns.append(client)
+            elif state.streams <= 0:
+                state.deficit = 0
+
+
+class BandwidthMiddleware:
+    """ASGI middleware that paces response bodies under ``prefixes``.
+
+    Clients are told apart by IP address. While a limit is configured the
+    ``http.response.pathsend`` extension (offered by some ASGI servers, not
+    by Uvicorn) is hidden from the app, since a send the server does on its
+    own cannot be paced.
+    """
+
+    def __init__(self, app, scheduler: BandwidthScheduler, prefixes: Tuple[str, ...] = ("/api/download/",)):
+        self.app = app
+        self.scheduler = scheduler
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        client = scope["client"][0] if scope.get("client") else "unknown"
+        extensions = scope.get("extensions") or {}
+        if self.scheduler.limited and "http.response.pathsend" in extensions:
+            extensions = {k: v for k, v in extensions.items() if k != "http.response.pathsend"}
+            scope = dict(scope, extensions=extensions)
+        length = 0
+
+        async def paced_send(message) -> None:
+            nonlocal length
+            if message["type"] == "http.response.start":
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-length":
+                        length = int(value)
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    await self.scheduler.send(client, len(message["body"]))
+            elif message["type"] == "http.response.pathsend":
+                self.scheduler.count(client, length)
+            await send(message)
+
+        self.scheduler.open(client)
+        try:
+            await self.app(scope, receive, paced_send)
+        finally:
+            self.scheduler.close(client)
@@ -0,0 +1,59 @@
+"""Bounded thread pools for the blocking filesystem work of async handlers."""
+
+import asyncio
+import concurrent.futures
+import functools
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class BlockingPool:
+    """Runs blocking calls off the event loop on at most ``workers`` threads.
+
+    Each kind of work gets its own pool, so a handful of long archive
+    streams can never take the threads that directory listings need.
+    """
+
+    def __init__(self, workers: int, name: str):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                               thread_name_prefix=name)
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Call ``func`` in the pool and wait for its result.
+
+        If the awaiting request is cancelled before the call started, the
+        call is dropped from the queue.
+        """
+        future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        return await asyncio.wrap_future(future)
+
+    async def iterate(self, iterator: Iterator[T]) -> AsyncIterator[T]:
+        """Drive a blocking iterator from the pool, one item per call.
+
+        Empty items are not passed on; iterators can yield them to bound the
+        time a single call takes.
+
+        When the consumer stops early (the client disconnected and the
+        response was cancelled) the iterator is closed as soon as the item
+        in progress is finished, so generators release their files and
+        temporary data right away.
+        """
+        pending = None
+        try:
+            while True:
+                pending = self._executor.submit(next, iterator, _DONE)
+                item = await asyncio.wrap_future(pending)
+                if item is _DONE:
+                    return
+                if item:  # empty items only mark a point where we may stop
+                    yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                if pending is None or pending.done():
+                    self._executor.submit(close)
+                else:
+                    pending.add_done_callback(lambda _: self._executor.submit(close))
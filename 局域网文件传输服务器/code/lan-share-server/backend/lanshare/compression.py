@@ -0,0 +1,177 @@
+"""gzip/Brotli for text responses: precompressed frontend assets and large JSON bodies."""
+
+import gzip
+import importlib.util
+import os
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+# Brotli is optional (pip install brotli); without it only gzip is offered.
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+# Encodings we produce, preferred first.
+ENCODINGS = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+# Frontend files worth compressing; images and fonts are compressed already.
+COMPRESSIBLE_SUFFIXES = {".html", ".htm", ".js", ".mjs", ".css", ".svg", ".json", ".map",
+                         ".txt", ".xml"}
+# Below this size compression saves less than it costs.
+MIN_SIZE = 1024
+# Larger assets are always sent as they are.
+MAX_ASSET_SIZE = 16 * 1024 * 1024
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The first encoding of ``ENCODINGS`` that an Accept-Encoding header allows."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    for encoding in ENCODINGS:
+        if weights.get(encoding, weights.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def variant_etag(etag: str, encoding: Optional[str]) -> str:
+    """The ETag of the ``encoding`` variant of a representation tagged ``etag``.
+
+    Each encoding is a different representation, so it needs its own
+    validator; otherwise If-None-Match/If-Range could match bytes in the
+    wrong encoding.
+    """
+    if encoding is None:
+        return etag
+    suffix = "-gz" if encoding == "gzip" else f"-{encoding}"
+    if etag.endswith('"'):
+        return etag[:-1] + suffix + '"'
+    return etag + suffix
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compress ``data``; ``best`` is slow and small, for content compressed once."""
+    if encoding == "br":
+        import brotli
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def compressed_response(request: Request, body: bytes, media_type: str = "application/json",
+                        min_size: int = MIN_SIZE, etag: Optional[str] = None) -> Response:
+    """Respond with ``body``, compressed if the client accepts it.
+
+    Bodies under ``min_size`` bytes are sent as they are. Compresses in the
+    calling thread, so large bodies should be passed in from a worker pool.
+    ``etag`` is the validator of the uncompressed body; a compressed body
+    is sent with its encoding's variant of it.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate(request.headers.get("accept-encoding")) if len(body) >= min_size else None
+    if encoding is not None:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    if etag is not None:
+        headers["ETag"] = variant_etag(etag, encoding)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that sends gzip/Brotli variants of text assets.
+
+    Each variant is compressed once at the strongest setting and kept in
+    memory together with the size and mtime of its file, so an edited asset
+    is compressed again. ``warm`` compresses everything up front; an asset
+    requested before its variant exists is sent uncompressed while the
+    variant is built in the background, so requests never wait for the
+    compressor. Range requests always get the plain file. Variants carry
+    the file's ETag with an encoding suffix (see ``variant_etag``).
+    """
+
+    def __init__(self, *args, min_size: int = MIN_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+        # (path, encoding) -> ((size, mtime_ns), compressed bytes or None
+        # where compression does not make the file smaller)
+        self._variants: Dict[Tuple[str, str], Tuple[Tuple[int, int], Optional[bytes]]] = {}
+        self._pending: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def warm(self) -> None:
+        """Compress every asset below the directory (blocking)."""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.realpath(os.path.join(root, name))
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if self._compressible(path, st):
+                    for encoding in ENCODINGS:
+                        self._build(path, st, encoding)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200
+                      ) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if not self._compressible(str(full_path), stat_result):
+            return response
+        response.headers["Vary"] = "Accept-Encoding"
+        request_headers = Headers(scope=scope)
+        if not isinstance(response, FileResponse) or status_code != 200 or "range" in request_headers:
+            return response
+        encoding = negotiate(request_headers.get("accept-encoding"))
+        if encoding is None:
+            return response
+        key = (str(full_path), encoding)
+        with self._lock:
+            variant = self._variants.get(key)
+        if variant is None or variant[0] != (stat_result.st_size, stat_result.st_mtime_ns):
+            self._build_later(str(full_path), stat_result, encoding)
+            return response
+        if variant[1] is None:
+            return response
+        headers = {name: value for name, value in response.headers.items()
+                   if name not in ("content-length", "accept-ranges")}
+        headers["content-encoding"] = encoding
+        headers["etag"] = variant_etag(response.headers["etag"], encoding)
+        if self.is_not_modified(Headers(headers), request_headers):
+            return NotModifiedResponse(Headers(headers))
+        return Response(variant[1], status_code=status_code, headers=headers)
+
+    def _compressible(self, path: str, st: os.stat_result) -> bool:
+        return (os.path.splitext(path)[1].lower() in COMPRESSIBLE_SUFFIXES
+                and self.min_size <= st.st_size <= MAX_ASSET_SIZE)
+
+    def _build_later(self, path: str, st: os.stat_result, encoding: str) -> None:
+        with self._lock:
+            if (path, encoding) in self._pending:
+                return
+            self._pending.add((path, encoding))
+        threading.Thread(target=self._build, args=(path, st, encoding), name="precompress",
+                         daemon=True).start()
+
+    def _build(self, path: str, st: os.stat_result, encoding: str) -> None:
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            if len(data) == st.st_size:
+                compressed = compress(data, encoding, best=True)
+                with self._lock:
+                    self._variants[(path, encoding)] = (
+                        (st.st_size, st.st_mtime_ns), compressed if len(compressed) < len(data) else None)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard((path, encoding))
@@ -0,0 +1,399 @@
+"""Recursive size and file count of every directory in the shared tree."""
+
+import concurrent.futures
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .leader import LeaderLock
+from .paths import INTERNAL_DIR_NAME, resolve_shared_path, to_rel_path
+from .watcher import FsEvent, InotifyWatcher
+
+# Multi-worker mode: the leader's totals. Every change gets the next seq so
+# followers can fetch what changed since their last poll; a removed
+# directory stays behind as a row with size -1 until the next snapshot.
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dir_sizes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dir_sizes_by_seq ON dir_sizes (seq);
+CREATE TABLE IF NOT EXISTS dir_sizes_meta (generation INTEGER NOT NULL, seq INTEGER NOT NULL);
+INSERT INTO dir_sizes_meta SELECT 0, 0 WHERE NOT EXISTS (SELECT 1 FROM dir_sizes_meta);
+"""
+# Seconds events are collected before the touched directories are rescanned,
+# so a copy of many files costs one rescan per directory, not one per file.
+DEBOUNCE = 0.5
+TAKEOVER_INTERVAL = 10.0
+
+
+class _Dir:
+    __slots__ = ("own_size", "own_files", "subdirs", "size", "files")
+
+    def __init__(self, own_size: int = 0, own_files: int = 0, subdirs: Optional[Set[str]] = None):
+        self.own_size = own_size
+        self.own_files = own_files
+        self.subdirs = subdirs or set()
+        self.size = own_size
+        self.files = own_files
+
+
+def _parent(rel_dir: str) -> str:
+    return rel_dir.rpartition("/")[0] or "."
+
+
+def _depth(rel_dir: str) -> int:
+    return 0 if rel_dir == "." else rel_dir.count("/") + 1
+
+
+def _join(rel_dir: str, name: str) -> str:
+    return name if rel_dir == "." else f"{rel_dir}/{name}"
+
+
+class DirectorySizes:
+    """Total size and number of files below each directory.
+
+    The tree is walked once in the background by ``workers`` threads that
+    scan directories in parallel. With an inotify watcher the totals then
+    follow change events: a touched directory is rescanned on its own
+    (only its entries, not its subtree) and the difference is added to
+    every ancestor. Without a watcher the whole tree is walked again every
+    ``rescan_interval`` seconds.
+
+    ``on_changed`` is called with the relative path of each directory whose
+    totals changed. Started with a ``LeaderLock``, only the leader walks
+    the tree and the others follow the totals it publishes to
+    ``state_path``.
+    """
+
+    def __init__(self, shared_dir: Path, watcher: Optional[InotifyWatcher] = None,
+                 workers: int = 4, rescan_interval: float = 300.0,
+                 state_path: Optional[Path] = None):
+        self.shared_dir = shared_dir
+        self.watcher = watcher
+        self.rescan_interval = rescan_interval
+        self.state_path = state_path
+        self.ready = False
+        self.on_changed = None  # Optional callback(rel_dir)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                           thread_name_prefix="dirsizes")
+        self._dirs: Dict[str, _Dir] = {}
+        self._lock = threading.Lock()
+        self._events: "queue.Queue[FsEvent]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._leader: Optional[LeaderLock] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._generation = 0
+        self._seq = 0
+        self._leading = False
+        if watcher is not None:
+            watcher.subscribe(self._on_event)
+
+    def start(self, leader: Optional[LeaderLock] = None) -> None:
+        """Start the initial walk (or, without the leader lock, following the leader)."""
+        if self._thread is None:
+            self._leader = leader
+            self._thread = threading.Thread(target=self._run, name="dirsizes", daemon=True)
+            self._thread.start()
+
+    def get(self, rel_dir: str) -> Optional[Tuple[int, int]]:
+        """``(size, files)`` below ``rel_dir``, or None if not known yet."""
+        with self._lock:
+            node = self._dirs.get(rel_dir)
+            return None if node is None else (node.size, node.files)
+
+    def estimate(self, rel_paths: Iterable[str]) -> Tuple[int, int, bool]:
+        """Size and file count of a selection of files and folders.
+
+        Folders are looked up, files are stat'ed. The third value is False
+        when a folder's totals were not known yet and it was left out.
+        """
+        selected = {}
+        for rel_path in rel_paths:
+            full_path = resolve_shared_path(self.shared_dir, rel_path)
+            if full_path is not None:
+                selected[to_rel_path(self.shared_dir, full_path)] = full_path
+        size = files = 0
+        complete = True
+        counted: List[str] = []
+        # Parents first, so nothing inside a selected folder is counted twice.
+        for rel in sorted(selected, key=_depth):
+            if any(other == "." or rel.startswith(other + "/") for other in counted):
+                continue
+            counted.append(rel)
+            full_path = selected[rel]
+            if full_path.is_file():
+                size += full_path.stat().st_size
+                files += 1
+            elif full_path.is_dir():
+                totals = self.get(rel)
+                if totals is None:
+                    complete = False
+                else:
+                    size += totals[0]
+                    files += totals[1]
+        return size, files, complete and self.ready
+
+    def __len__(self) -> int:
+        return len(self._dirs)
+
+    # --- walking ---
+
+    def _scan(self, rel_dir: str, watch: bool) -> Optional[_Dir]:
+        """Own files and subdirectories of one directory; None if it is gone."""
+        path = self.shared_dir / rel_dir
+        if watch:
+            # Watch before scanning so nothing created in between is lost.
+            self.watcher.add_watch(path)
+        own_size = own_files = 0
+        subdirs = set()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if rel_dir == "." and entry.name == INTERNAL_DIR_NAME:
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.add(entry.name)
+                        elif entry.is_file():
+                            own_size += entry.stat().st_size
+                            own_files += 1
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return _Dir(own_size, own_files, subdirs)
+
+    def _walk(self, top: str, watch: bool) -> Dict[str, _Dir]:
+        """Scan the tree below ``top`` with the worker pool and add up the totals."""
+        nodes: Dict[str, _Dir] = {}
+        pending = {self._pool.submit(self._scan, top, watch): top}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                rel_dir = pending.pop(future)
+                node = future.result()
+                if node is None:
+                    continue
+                nodes[rel_dir] = node
+                for name in node.subdirs:
+                    child = _join(rel_dir, name)
+                    pending[self._pool.submit(self._scan, child, watch)] = child
+        # Deepest first, so every child is complete before it is added to its parent.
+        for rel_dir in sorted(nodes, key=_depth, reverse=True):
+            node = nodes[rel_dir]
+            # Drop subdirectories that vanished before they were scanned.
+            node.subdirs = {name for name in node.subdirs if _join(rel_dir, name) in nodes}
+            parent = nodes.get(_parent(rel_dir)) if rel_dir != top else None
+            if parent is not None:
+                parent.size += node.size
+                parent.files += node.files
+        return nodes
+
+    # --- background thread ---
+
+    def _run(self) -> None:
+        if self.state_path is not None:
+            self._db = sqlite3.connect(self.state_path, timeout=30, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_STATE_SCHEMA)
+        if self._leader is not None and not self._leader.try_acquire():
+            self._follow()
+        self._leading = True
+
+        use_events = self.watcher is not None
+        if use_events:
+            self.watcher.add_tree_root(self.shared_dir, skip=INTERNAL_DIR_NAME)
+        self._rebuild(watch=use_events)
+        next_rescan = time.monotonic() + self.rescan_interval
+        while True:
+            if not use_events or self.watcher.limit_reached:
+                use_events = False
+                if time.monotonic() >= next_rescan:
+                    self._rebuild(watch=False)
+                    next_rescan = time.monotonic() + self.rescan_interval
+            try:
+                event = self._events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            dirty, overflow = set(), False
+            deadline = time.monotonic() + DEBOUNCE
+            while True:
+                if event.kind == "overflow":
+                    overflow = True
+                else:
+                    rel_dir = self._rel_parent(event)
+                    if rel_dir is not None:
+                        dirty.add(rel_dir)
+                try:
+                    event = self._events.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if overflow:
+                self._rebuild(watch=False)
+            else:
+                self._refresh(dirty)
+
+    def _on_event(self, event: FsEvent) -> None:
+        if self._leading:
+            self._events.put(event)
+
+    def _rel_parent(self, event: FsEvent) -> Optional[str]:
+        try:
+            rel_path = event.path.relative_to(self.shared_dir).as_posix()
+        except ValueError:
+            return None
+        if rel_path == "." or rel_path.split("/", 1)[0] == INTERNAL_DIR_NAME:
+            return None
+        return _parent(rel_path)
+
+    def _rebuild(self, watch: bool) -> None:
+        nodes = self._walk(".", watch)
+        with self._lock:
+            old, self._dirs = self._dirs, nodes
+        self.ready = True
+        self._publish()
+        self._notify(path for path, node in nodes.items()
+                     if (old.get(path) is None or (old[path].size, old[path].files)
+                         != (node.size, node.files)))
+
+    def _refresh(self, dirty: Set[str]) -> None:
+        """Rescan the directories in ``dirty`` and pass the differences upwards."""
+        changed: Dict[str, Optional[_Dir]] = {}
+        # Parents first, so a directory that is gone is handled once as a
+        # missing subdirectory of its parent.
+        for rel_dir in sorted(dirty, key=_depth):
+            while rel_dir != "." and rel_dir not in self._dirs:
+                rel_dir = _parent(rel_dir)  # new below an unknown directory
+            old = self._dirs.get(rel_dir)
+            if old is None:
+                continue
+            fresh = self._scan(rel_dir, watch=False)
+            if fresh is None:
+                if rel_dir != ".":
+                    dirty_parent = _parent(rel_dir)
+                    if dirty_parent not in dirty:
+                        self._refresh({dirty_parent})
+                continue
+            added = fresh.subdirs - old.subdirs
+            removed = old.subdirs - fresh.subdirs
+            subtrees = {}
+            for name in added:
+                subtrees.update(self._walk(_join(rel_dir, name), watch=self.watcher is not None))
+            fresh.subdirs = (old.subdirs - removed) | {
+                name for name in added if _join(rel_dir, name) in subtrees}
+            with self._lock:
+                for name in removed:
+                    for path in self._drop(_join(rel_dir, name)):
+                        changed[path] = None
+                self._dirs.update(subtrees)
+                fresh.size = fresh.own_size + sum(self._dirs[_join(rel_dir, name)].size
+                                                  for name in fresh.subdirs)
+                fresh.files = fresh.own_files + sum(self._dirs[_join(rel_dir, name)].files
+                                                    for name in fresh.subdirs)
+                size_delta, files_delta = fresh.size - old.size, fresh.files - old.files
+                self._dirs[rel_dir] = fresh
+                changed.update(subtrees)
+                changed[rel_dir] = fresh
+                ancestor = rel_dir
+                while (size_delta or files_delta) and ancestor != ".":
+                    ancestor = _parent(ancestor)
+                    node = self._dirs.get(ancestor)
+                    if node is None:
+                        break
+                    node.size += size_delta
+                    node.files += files_delta
+                    changed[ancestor] = node
+        if changed:
+            self._write_log(changed)
+            self._notify(changed)
+
+    def _drop(self, rel_dir: str) -> List[str]:
+        """Forget ``rel_dir`` and everything below it (caller holds the lock)."""
+        dropped = []
+        stack = [rel_dir]
+        while stack:
+            path = stack.pop()
+            node = self._dirs.pop(path, None)
+            if node is not None:
+                dropped.append(path)
+                stack.extend(_join(path, name) for name in node.subdirs)
+        return dropped
+
+    def _notify(self, rel_dirs: Iterable[str]) -> None:
+        if self.on_changed is not None:
+            for rel_dir in rel_dirs:
+                self.on_changed(rel_dir)
+
+    # --- multi-worker state ---
+
+    def _publish(self) -> None:
+        """Replace the shared totals with a snapshot of the current ones."""
+        if self._db is None:
+            return
+        with self._lock:
+            rows = [(path, node.size, node.files) for path, node in self._dirs.items()]
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM dir_sizes")
+            self._db.executemany("INSERT INTO dir_sizes VALUES (?, ?, ?, 0)", rows)
+            self._db.execute("UPDATE dir_sizes_meta SET generation = generation + 1, seq = 0")
+
+    def _write_log(self, changed: Dict[str, Optional[_Dir]]) -> None:
+        if self._db is None:
+            return
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("UPDATE dir_sizes_meta SET seq = seq + 1")
+            seq = self._db.execute("SELECT seq FROM dir_sizes_meta").fetchone()[0]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO dir_sizes VALUES (?, ?, ?, ?)",
+                ((path, -1, 0, seq) if node is None else (path, node.size, node.files, seq)
+                 for path, node in changed.items()))
+
+    def _follow(self) -> None:
+        """Mirror the leader's totals until this process becomes the leader."""
+        next_attempt = time.monotonic() + TAKEOVER_INTERVAL
+        while True:
+            try:
+                self._poll()
+            except sqlite3.Error:
+                pass
+            if time.monotonic() >= next_attempt:
+                if self._leader.try_acquire():
+                    return
+                next_attempt = time.monotonic() + TAKEOVER_INTERVAL
+            time.sleep(1.0)
+
+    def _poll(self) -> None:
+        with self._db:
+            self._db.execute("BEGIN")
+            generation, seq = self._db.execute(
+                "SELECT generation, seq FROM dir_sizes_meta").fetchone()
+            full = generation != self._generation
+            if full:
+                rows = self._db.execute("SELECT path, size, files FROM dir_sizes").fetchall()
+            elif seq != self._seq:
+                rows = self._db.execute("SELECT path, size, files FROM dir_sizes WHERE seq > ?",
+                                        (self._seq,)).fetchall()
+            else:
+                return
+        with self._lock:
+            if full:
+                self._dirs = {}
+            for path, size, files in rows:
+                if size < 0:
+                    self._dirs.pop(path, None)
+                else:
+                    node = self._dirs.get(path) or _Dir()
+                    node.size, node.files = size, files
+                    self._dirs[path] = node
+        self._generation, self._seq = generation, seq
+        self.ready = generation > 0
+        self._notify(path for path, _, _ in rows)
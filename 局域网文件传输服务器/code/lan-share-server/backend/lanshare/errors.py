@@ -0,0 +1,10 @@
+"""Exceptions that map directly onto HTTP error responses."""
+
+
+class ServiceError(Exception):
+    """A request that cannot be honoured; carries an HTTP status."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
@@ -0,0 +1,165 @@
+"""Directory change notifications pushed to clients as Server-Sent Events."""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from .paths import INTERNAL_DIR_NAME
+from .watcher import FsEvent, InotifyWatcher
+
+# Changes to a directory are collected this many seconds after the first one
+# and sent as one batch, so a directory receiving many files per second gets
+# a few updates per second.
+DEBOUNCE = 0.3
+# Seconds of silence after which a comment line keeps the connection alive.
+KEEPALIVE = 15.0
+
+
+def _merge(previous: Optional[str], kind: str) -> Optional[str]:
+    """Combine two changes of one entry within a batch; None cancels both."""
+    if previous == "created":
+        return None if kind == "deleted" else "created"
+    if previous == "deleted" and kind == "created":
+        return "modified"  # replaced
+    return kind
+
+
+class _Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, rel_dirs: Tuple[str, ...]):
+        self.loop = loop
+        self.rel_dirs = rel_dirs
+        self.queue: "asyncio.Queue[Dict[str, object]]" = asyncio.Queue()
+
+
+class ChangeFeed:
+    """Sends clients the changes of the directories they have open.
+
+    Watcher events for subscribed directories are handed to a background
+    thread that coalesces them per entry (a file created and then written
+    is one ``created`` change) and sends one batch per directory every
+    ``DEBOUNCE`` seconds at most. Created and modified entries carry the
+    same fields as listing items, so clients can update their view without
+    listing the directory again. When the kernel dropped events, a
+    ``reset`` tells clients to reload.
+    """
+
+    def __init__(self, shared_dir: Path, watcher: InotifyWatcher):
+        self.shared_dir = shared_dir
+        self.watcher = watcher
+        self._subscribers: Dict[str, List[_Subscription]] = {}
+        self._lock = threading.Lock()
+        self._events: "queue.Queue[FsEvent]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        watcher.subscribe(self._on_event)
+
+    async def stream(self, rel_dirs: List[str]) -> AsyncIterator[bytes]:
+        """Yield the SSE stream for ``rel_dirs`` (relative paths, "." is the root)."""
+        subscription = _Subscription(asyncio.get_running_loop(), tuple(dict.fromkeys(rel_dirs)))
+        self._add(subscription)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    batch = await asyncio.wait_for(subscription.queue.get(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                data = json.dumps(batch, ensure_ascii=False)
+                yield f"event: changes\ndata: {data}\n\n".encode("utf-8")
+        finally:
+            self._remove(subscription)
+
+    def _add(self, subscription: _Subscription) -> None:
+        for rel_dir in subscription.rel_dirs:
+            self.watcher.add_watch(self.shared_dir / rel_dir)
+            with self._lock:
+                self._subscribers.setdefault(rel_dir, []).append(subscription)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+            self._thread.start()
+
+    def _remove(self, subscription: _Subscription) -> None:
+        for rel_dir in subscription.rel_dirs:
+            with self._lock:
+                subscribers = self._subscribers.get(rel_dir, [])
+                if subscription in subscribers:
+                    subscribers.remove(subscription)
+                if not subscribers:
+                    self._subscribers.pop(rel_dir, None)
+            self.watcher.remove_watch(self.shared_dir / rel_dir)
+
+    def _on_event(self, event: FsEvent) -> None:
+        if self._subscribers:
+            self._events.put(event)
+
+    def _run(self) -> None:
+        while True:
+            event = self._events.get()
+            pending: Dict[str, Dict[str, Tuple[Optional[str], bool]]] = {}
+            reset: Set[str] = set()
+            deadline = time.monotonic() + DEBOUNCE
+            while True:
+                self._collect(event, pending, reset)
+                try:
+                    event = self._events.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            for rel_dir in reset:
+                self._send(rel_dir, {"dir": rel_dir, "reset": True})
+            for rel_dir, changes in pending.items():
+                if rel_dir not in reset:
+                    batch = self._batch(rel_dir, changes)
+                    if batch["changes"]:
+                        self._send(rel_dir, batch)
+
+    def _collect(self, event: FsEvent, pending: Dict[str, Dict[str, Tuple[Optional[str], bool]]],
+                 reset: Set[str]) -> None:
+        if event.kind == "overflow":
+            with self._lock:
+                reset.update(self._subscribers)
+            return
+        try:
+            rel_path = event.path.relative_to(self.shared_dir).as_posix()
+        except ValueError:
+            return
+        with self._lock:
+            if rel_path in self._subscribers and event.kind == "deleted" and event.is_dir:
+                reset.add(rel_path)  # an open directory itself went away
+            rel_dir, _, name = rel_path.rpartition("/")
+            rel_dir = rel_dir or "."
+            if rel_path == "." or rel_dir not in self._subscribers:
+                return
+        if rel_dir == "." and name == INTERNAL_DIR_NAME:
+            return
+        changes = pending.setdefault(rel_dir, {})
+        kind = _merge(changes[name][0], event.kind) if name in changes else event.kind
+        changes[name] = (kind, event.is_dir)
+
+    def _batch(self, rel_dir: str, changes: Dict[str, Tuple[Optional[str], bool]]) -> Dict[str, object]:
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+        items = []
+        for name, (kind, is_dir) in sorted(changes.items()):
+            if kind is None:
+                continue
+            item = {"kind": kind, "name": name, "path": prefix + name, "is_directory": is_dir}
+            if kind != "deleted":
+                try:
+                    st = os.stat(self.shared_dir / item["path"])
+                except OSError:
+                    item["kind"] = "deleted"
+                else:
+                    item["size"] = None if is_dir else st.st_size
+                    item["mtime"] = st.st_mtime
+            items.append(item)
+        return {"dir": rel_dir, "changes": items}
+
+    def _send(self, rel_dir: str, batch: Dict[str, object]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(rel_dir, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, batch)
@@ -0,0 +1,272 @@
+"""Single file responses with HTTP Range, If-Range and conditional GET support."""
+
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .fileio import read_at
+
+# Read size for the chunked path, which is what the bundled Uvicorn always
+# uses. Large reads keep the number of threadpool hops per GB low.
+CHUNK_SIZE = 1024 * 1024
+# More ranges than this in one request is treated as abuse and served whole.
+MAX_RANGES = 16
+
+Range = Tuple[int, int]
+
+
+def make_etag(st: os.stat_result) -> str:
+    """Build a validator from a file's identity (inode, mtime, size)."""
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range_header(header: str, size: int) -> Optional[List[Range]]:
+    """Parse a ``Range: bytes=...`` header.
+
+    Args:
+        header: Raw header value
+        size: Size of the file in bytes
+
+    Returns:
+        None if the header should be ignored (syntax error, unknown unit,
+        too many ranges), an empty list if no range is satisfiable, or the
+        sorted and merged list of inclusive ``(start, end)`` ranges.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges: List[Range] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged: List[Range] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in header.split(",")]
+    weak_etag = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or any(
+        (tag[2:] if tag.startswith("W/") else tag) == weak_etag for tag in candidates
+    )
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return False
+
+
+def _if_range_matches(header: str, etag: str, last_modified: str) -> bool:
+    header = header.strip()
+    if header.startswith('"'):
+        # If-Range requires a strong comparison.
+        return not etag.startswith("W/") and header == etag
+    if header.startswith("W/"):
+        return False
+    return header == last_modified
+
+
+class RangeFileResponse(Response):
+    """Streams a whole file or a set of byte ranges of it.
+
+    The file is read in large positioned chunks off the event loop, and
+    reading stops as soon as the client disconnects. With ``content`` the
+    body is cut from those bytes and the file is not opened at all.
+
+    A whole-file body is instead handed to the server as
+    ``http.response.pathsend`` if the server advertises that extension, so
+    a server that implements it with ``sendfile`` can send it zero-copy.
+    Uvicorn, which the app ships with, does not advertise it; under Uvicorn
+    every download takes the chunked path.
+    """
+
+    def __init__(self, path: Path, size: int, status_code: int, headers: dict,
+                 ranges: List[Range], media_type: str, send_body: bool = True,
+                 content: Optional[bytes] = None):
+        self.path = path
+        self.size = size
+        self.content = content
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.send_body = send_body
+        self.parts: List[Tuple[bytes, int, int]] = []
+        self.epilogue = b""
+
+        if len(ranges) > 1:
+            boundary = secrets.token_hex(12)
+            content_type = f"multipart/byteranges; boundary={boundary}"
+            length = 0
+            for start, end in ranges:
+                prefix = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                if self.parts:
+                    prefix = b"\r\n" + prefix
+                self.parts.append((prefix, start, end))
+                length += len(prefix) + end - start + 1
+            self.epilogue = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            length += len(self.epilogue)
+        else:
+            content_type = media_type
+            start, end = ranges[0] if ranges else (0, size - 1)
+            if size:
+                self.parts.append((b"", start, end))
+            length = end - start + 1 if size else 0
+            if status_code == 206:
+                headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        headers["content-length"] = str(length)
+        self.init_headers(headers)
+        self.headers["content-type"] = content_type
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code,
+                    "headers": self.raw_headers})
+        if not self.send_body or not self.parts:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if self.content is not None:
+            body = b"".join(prefix + self.content[start:end + 1] for prefix, start, end in self.parts)
+            await send({"type": "http.response.body", "body": body + self.epilogue})
+            return
+
+        whole_file = self.status_code == 200
+        if whole_file and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        async with anyio.create_task_group() as task_group:
+            async def stream() -> None:
+                await self._send_parts(send)
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(stream)
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            task_group.cancel_scope.cancel()
+
+    async def _send_parts(self, send) -> None:
+        fh = await run_in_threadpool(open, self.path, "rb")
+        try:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            for prefix, start, end in self.parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                offset = start
+                while offset <= end:
+                    chunk = await run_in_threadpool(
+                        read_at, fh, offset, min(CHUNK_SIZE, end - offset + 1))
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": self.epilogue})
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(fh.close)
+
+
+def file_response(request: Request, path: Path, filename: Optional[str] = None,
+                  media_type: str = "application/octet-stream",
+                  etag: Optional[str] = None, inline: bool = False,
+                  content: Optional[bytes] = None,
+                  st: Optional[os.stat_result] = None) -> Response:
+    """Build the response for a single file download.
+
+    Handles ``If-None-Match``/``If-Modified-Since`` (304), ``Range`` with
+    optional ``If-Range`` (206/416) and plain 200 downloads.
+
+    Args:
+        request: Incoming request (headers and method are inspected)
+        path: Absolute path of an existing regular file
+        filename: Name offered in Content-Disposition (defaults to path name)
+        media_type: Content type of the body
+        etag: Validator to use instead of the stat based one
+        inline: Ask the browser to display the body instead of saving it
+        content: The file's bytes, if already in memory
+        st: The file's stat result, if already known
+
+    Returns:
+        A Response ready to be returned from a route
+    """
+    st = st or path.stat()
+    etag = etag or make_etag(st)
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, etag)
+    else:
+        if_modified_since = request.headers.get("if-modified-since")
+        not_modified = bool(if_modified_since) and _not_modified_since(if_modified_since, st.st_mtime)
+    if not_modified and request.method in ("GET", "HEAD"):
+        return Response(status_code=304, headers=headers)
+
+    name = filename or path.name
+    disposition = "inline" if inline else "attachment"
+    headers["content-disposition"] = f"{disposition}; filename*=utf-8''{quote(name)}"
+    send_body = request.method != "HEAD"
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or _if_range_matches(if_range, etag, last_modified)):
+        ranges = parse_range_header(range_header, st.st_size)
+        if ranges == []:
+            headers["content-range"] = f"bytes */{st.st_size}"
+            return Response(status_code=416, headers=headers)
+        if ranges:
+            return RangeFileResponse(path, st.st_size, 206, headers, ranges,
+                                     media_type, send_body, content)
+
+    return RangeFileResponse(path, st.st_size, 200, headers, [], media_type, send_body, content)
@@ -0,0 +1,106 @@
+"""In-memory LRU of small, frequently downloaded files."""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+class CachedFile:
+    __slots__ = ("key", "data", "etag")
+
+    def __init__(self, key: Tuple[int, int, int, int], data: bytes, etag: str):
+        self.key = key
+        self.data = data
+        self.etag = etag
+
+
+def _identity(st: os.stat_result) -> Tuple[int, int, int, int]:
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class SmallFileCache:
+    """Keeps the contents of files up to ``max_file_bytes`` in memory.
+
+    Meant for the many small files (configs, labels, scripts) that a room
+    full of devices download at the same moment. An entry is only served
+    while the file's (device, inode, size, mtime) still match the stat the
+    caller passes in, so a changed file is read again. The ETag is the
+    SHA-256 of the content, computed once on load, so it matches the one
+    hashed downloads get. The least recently used entries are dropped when
+    the cache holds more than ``max_bytes``.
+    """
+
+    def __init__(self, max_file_bytes: int = 256 * 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_file_bytes = max_file_bytes
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Path, CachedFile]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def accepts(self, st: os.stat_result) -> bool:
+        return 0 < st.st_size <= min(self.max_file_bytes, self.max_bytes)
+
+    def get(self, path: Path, st: os.stat_result) -> Optional[CachedFile]:
+        """Return the cached content of ``path`` if it is still as of ``st``.
+
+        Only looks at memory; on a miss the caller uses ``load``.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.key == _identity(st):
+                self._entries.move_to_end(path)
+                self.hits += 1
+                self.bytes_saved += len(entry.data)
+                return entry
+            self.misses += 1
+            return None
+
+    def load(self, path: Path, st: os.stat_result) -> Optional[CachedFile]:
+        """Read ``path`` into the cache.
+
+        Returns None for files the cache does not take or that changed since
+        ``st`` was taken.
+        """
+        if not self.accepts(st):
+            return None
+        entry = self._read(path, _identity(st))
+        if entry is None:
+            return None
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._bytes -= len(old.data)
+            self._entries[path] = entry
+            self._bytes += len(entry.data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.data)
+        return entry
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "max_file_bytes": self.max_file_bytes,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / requests, 4) if requests else None,
+                    "bytes_saved": self.bytes_saved}
+
+    @staticmethod
+    def _read(path: Path, key: Tuple[int, int, int, int]) -> Optional[CachedFile]:
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read(key[2] + 1)
+                if _identity(os.fstat(fh.fileno())) != key:
+                    return None
+        except OSError:
+            return None
+        if len(data) != key[2]:
+            return None
+        return CachedFile(key, data, f'"{hashlib.sha256(data).hexdigest()}"')
@@ -0,0 +1,39 @@
+"""Positioned file I/O that works on POSIX and Windows."""
+
+import os
+
+
+def read_at(fh, offset: int, size: int) -> bytes:
+    """Positioned read that does not depend on the shared file offset."""
+    if hasattr(os, "pread"):
+        return os.pread(fh.fileno(), size, offset)
+    fh.seek(offset)
+    return fh.read(size)
+
+
+def write_at(fh, offset: int, data: bytes) -> None:
+    """Positioned write of all of ``data``.
+
+    Without pwrite (Windows) this falls back to seek + write, which is safe
+    as long as every writer uses its own file handle.
+    """
+    if hasattr(os, "pwrite"):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fh.fileno(), view, offset)
+            view = view[written:]
+            offset += written
+    else:
+        fh.seek(offset)
+        fh.write(data)
+
+
+def preallocate(fh, size: int) -> None:
+    """Reserve ``size`` bytes for a file that will be filled out of order."""
+    if hasattr(os, "posix_fallocate") and size:
+        try:
+            os.posix_fallocate(fh.fileno(), 0, size)
+            return
+        except OSError:
+            pass
+    fh.truncate(size)
@@ -0,0 +1,359 @@
+"""Background content hashing with a persistent SQLite cache."""
+
+import ctypes
+import hashlib
+import importlib.util
+import itertools
+import os
+import platform
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# xxhash is imported by the hasher thread, not while the server starts.
+XXHASH_AVAILABLE = importlib.util.find_spec("xxhash") is not None
+
+from .leader import LeaderLock
+from .paths import INTERNAL_DIR_NAME, internal_dir
+from .watcher import FsEvent, InotifyWatcher
+
+FAST_ALGORITHM = "xxh3_128" if XXHASH_AVAILABLE else "blake2b_128"
+READ_SIZE = 1024 * 1024
+
+# name -> (size, mtime_ns, fast digest, sha256)
+DirHashes = Dict[str, Tuple[int, int, str, str]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    fast TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (dev, ino, size, mtime_ns)
+);
+CREATE INDEX IF NOT EXISTS hashes_by_path ON hashes (dir, name);
+"""
+
+# Multi-worker mode: followers queue hash requests for the leader and learn
+# from the log which files the leader has hashed.
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hash_requests (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS hash_log (seq INTEGER PRIMARY KEY, path TEXT NOT NULL);
+"""
+LOG_KEEP = 10_000
+TAKEOVER_INTERVAL = 10.0
+
+
+def _new_fast_hash():
+    if XXHASH_AVAILABLE:
+        import xxhash
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def _split(rel_path: str) -> Tuple[str, str]:
+    directory, _, name = rel_path.rpartition("/")
+    return directory, name
+
+
+def _lower_thread_priority() -> None:
+    """Best effort: lowest CPU and I/O priority for the calling thread."""
+    if sys.platform.startswith("linux"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (OSError, AttributeError):
+            pass
+        # ioprio_set(IOPRIO_WHO_PROCESS, tid, IOPRIO_CLASS_IDLE << 13)
+        syscall_nr = {"x86_64": 251, "aarch64": 30, "armv7l": 314}.get(platform.machine())
+        if syscall_nr is not None:
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.syscall(syscall_nr, 1, threading.get_native_id(), 3 << 13)
+            except (OSError, AttributeError):
+                pass
+    elif sys.platform == "win32":
+        # THREAD_MODE_BACKGROUND_BEGIN lowers both CPU and I/O priority.
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetThreadPriority(kernel32.GetCurrentThread(), 0x00010000)
+
+
+class HashCache:
+    """Fast and SHA-256 digests for files below the shared directory.
+
+    Digests live in ``.lanshare/hashes.sqlite3`` keyed by
+    ``(dev, inode, size, mtime_ns)``, so unchanged files are never hashed
+    twice, not even across restarts. A single low priority thread does the
+    hashing, throttled to ``max_bytes_per_second`` so downloads keep the
+    disk. Files announced by the watcher are queued as they change; files
+    requested through ``request`` jump the queue. Rows of files that are
+    deleted, renamed or changed are dropped when ``get`` misses on their
+    path, when the watcher reports the deletion and on the periodic walk,
+    which also drops the rows of directories that no longer exist.
+
+    Started with a ``LeaderLock``, only the process holding the lock hashes;
+    in the others ``request`` is passed on through the database and
+    ``on_hashed`` fires for files the leader has hashed.
+    """
+
+    def __init__(self, shared_dir: Path, watcher: Optional[InotifyWatcher] = None,
+                 max_bytes_per_second: int = 64 * 1024 * 1024, rescan_interval: float = 3600.0):
+        self.shared_dir = shared_dir
+        self.watcher = watcher
+        self.max_bytes_per_second = max_bytes_per_second
+        self.rescan_interval = rescan_interval
+        self.db_path = internal_dir(shared_dir, "") / "hashes.sqlite3"
+        self.on_hashed = None  # Optional callback(rel_path) after a file was hashed
+        self._local = threading.local()
+        self._queue: "queue.PriorityQueue[Tuple[int, int, str]]" = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._leader: Optional[LeaderLock] = None
+        # The database is opened (and its schema created) on first use, off
+        # the startup path.
+        self._schema_ready = False
+        if watcher is not None:
+            watcher.subscribe(self._on_event)
+
+    def start(self, leader: Optional[LeaderLock] = None) -> None:
+        """Start the background hasher (or, without the leader lock, the follower)."""
+        if self._thread is None:
+            if leader is not None:
+                with self._connect() as conn:
+                    conn.executescript(_SHARED_SCHEMA)
+            self._leader = leader
+            self._thread = threading.Thread(target=self._run, name="hasher", daemon=True)
+            self._thread.start()
+
+    def get(self, rel_path: str, st: os.stat_result) -> Optional[Tuple[str, str]]:
+        """Return ``(fast, sha256)`` if the file is hashed in its current state."""
+        if st.st_ino:
+            row = self._db().execute(
+                "SELECT fast, sha256 FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)).fetchone()
+        else:
+            # DirEntry.stat() on Windows has no inode; fall back to the path.
+            directory, name = _split(rel_path)
+            row = self._db().execute(
+                "SELECT fast, sha256 FROM hashes WHERE dir=? AND name=? AND size=? AND mtime_ns=?",
+                (directory, name, st.st_size, st.st_mtime_ns)).fetchone()
+        if row is None:
+            self._drop_stale(rel_path)
+            return None
+        return tuple(row)
+
+    def dir_hashes(self, rel_dir: str) -> DirHashes:
+        """All stored digests for the files of one directory."""
+        rows = self._db().execute(
+            "SELECT name, size, mtime_ns, fast, sha256 FROM hashes WHERE dir=?",
+            ("" if rel_dir == "." else rel_dir,))
+        return {name: (size, mtime_ns, fast, sha) for name, size, mtime_ns, fast, sha in rows}
+
+    def request(self, rel_path: str) -> None:
+        """Hash ``rel_path`` before anything that is merely queued."""
+        if self._leader is not None and not self._leader.held:
+            self._db().execute("INSERT OR IGNORE INTO hash_requests VALUES (?)", (rel_path,))
+        else:
+            self._queue.put((0, next(self._seq), rel_path))
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if not self._schema_ready:
+            conn.executescript(_SCHEMA)
+            self._schema_ready = True
+        return conn
+
+    def _drop_stale(self, rel_path: str) -> None:
+        """Delete the row stored for ``rel_path`` after a lookup by its current state missed."""
+        directory, name = _split(rel_path)
+        conn = self._db()
+        # Look first: a DELETE takes the write lock even when it matches nothing.
+        if conn.execute("SELECT 1 FROM hashes WHERE dir=? AND name=?", (directory, name)).fetchone():
+            conn.execute("DELETE FROM hashes WHERE dir=? AND name=?", (directory, name))
+
+    def _forget(self, rel_path: str) -> None:
+        """Delete the rows of a removed file, or of everything below a removed directory."""
+        directory, name = _split(rel_path)
+        prefix = rel_path + "/"
+        self._db().execute(
+            "DELETE FROM hashes WHERE (dir=? AND name=?) OR dir=? OR substr(dir, 1, ?)=?",
+            (directory, name, rel_path, len(prefix), prefix))
+
+    def _follow_rename(self, rel_path: str, st: os.stat_result) -> None:
+        """Move a row found by inode to ``rel_path`` if its old path is gone."""
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        conn = self._db()
+        row = conn.execute("SELECT dir, name FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                           key).fetchone()
+        directory, name = _split(rel_path)
+        # A second hard link keeps the row where it is.
+        if row is None or tuple(row) == (directory, name) or (self.shared_dir / row[0] / row[1]).exists():
+            return
+        conn.execute("UPDATE hashes SET dir=?, name=? WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                     (directory, name) + key)
+
+    def _on_event(self, event: FsEvent) -> None:
+        # Deletions (and the old name of a rename) are queued too; the hasher
+        # finds the path gone and drops its rows, off the watcher thread.
+        if event.kind == "deleted" or (event.kind in ("created", "modified") and not event.is_dir):
+            try:
+                rel_path = event.path.relative_to(self.shared_dir).as_posix()
+            except ValueError:
+                return
+            if rel_path != "." and not rel_path.startswith(INTERNAL_DIR_NAME + "/"):
+                self._queue.put((1, next(self._seq), rel_path))
+
+    def _run(self) -> None:
+        _lower_thread_priority()
+        if self._leader is not None and not self._leader.try_acquire():
+            self._follow()
+        shared = self._leader is not None
+        next_walk = 0.0
+        while True:
+            if time.monotonic() >= next_walk:
+                self._walk()
+                next_walk = time.monotonic() + self.rescan_interval
+            if shared:
+                self._take_requests()
+            try:
+                _, _, rel_path = self._queue.get(timeout=1.0 if shared else 5.0)
+            except queue.Empty:
+                continue
+            try:
+                self._hash_if_needed(rel_path)
+            except OSError:
+                pass
+
+    def _follow(self) -> None:
+        """Report the leader's progress until this process becomes the leader."""
+        conn = self._db()
+        last = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM hash_log").fetchone()[0]
+        next_attempt = time.monotonic() + TAKEOVER_INTERVAL
+        while True:
+            try:
+                rows = conn.execute("SELECT seq, path FROM hash_log WHERE seq > ? ORDER BY seq",
+                                    (last,)).fetchall()
+            except sqlite3.Error:
+                rows = []
+            for last, rel_path in rows:
+                if self.on_hashed is not None:
+                    self.on_hashed(rel_path)
+            if time.monotonic() >= next_attempt:
+                if self._leader.try_acquire():
+                    return
+                next_attempt = time.monotonic() + TAKEOVER_INTERVAL
+            time.sleep(1.0)
+
+    def _take_requests(self) -> None:
+        conn = self._db()
+        rows = conn.execute("SELECT path FROM hash_requests").fetchall()
+        if rows:
+            conn.executemany("DELETE FROM hash_requests WHERE path=?", rows)
+        for (rel_path,) in rows:
+            self._queue.put((0, next(self._seq), rel_path))
+
+    def _walk(self) -> None:
+        """Queue every file that has no digest for its current state."""
+        if self._leader is not None:
+            self._db().execute(
+                "DELETE FROM hash_log WHERE seq <= (SELECT MAX(seq) FROM hash_log) - ?", (LOG_KEEP,))
+        stack = [self.shared_dir]
+        visited = set()
+        while stack:
+            directory = stack.pop()
+            rel_dir = directory.relative_to(self.shared_dir).as_posix()
+            visited.add("" if rel_dir == "." else rel_dir)
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            known = self.dir_hashes(rel_dir)
+            gone = known.keys() - {entry.name for entry in entries}
+            if gone:
+                self._db().executemany("DELETE FROM hashes WHERE dir=? AND name=?",
+                                       [("" if rel_dir == "." else rel_dir, name) for name in gone])
+            for entry in entries:
+                if directory == self.shared_dir and entry.name == INTERNAL_DIR_NAME:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                stored = known.get(entry.name)
+                if stored is None or stored[:2] != (st.st_size, st.st_mtime_ns):
+                    rel_path = entry.name if rel_dir == "." else f"{rel_dir}/{entry.name}"
+                    self._queue.put((2, next(self._seq), rel_path))
+        # Directories deleted or renamed while nobody watched (no inotify, or
+        # the server was down) were not visited; drop everything stored for them.
+        conn = self._db()
+        gone = [(rel_dir,) for rel_dir, in conn.execute("SELECT DISTINCT dir FROM hashes")
+                if rel_dir not in visited]
+        if gone:
+            conn.executemany("DELETE FROM hashes WHERE dir=?", gone)
+
+    def _hash_if_needed(self, rel_path: str) -> None:
+        path = self.shared_dir / rel_path
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self._forget(rel_path)
+            return
+        if not path.is_file():
+            return
+        if self.get(rel_path, st) is not None:
+            if st.st_ino:
+                self._follow_rename(rel_path, st)
+            return
+        fast, sha = _new_fast_hash(), hashlib.sha256()
+        budget_start, budget_bytes = time.monotonic(), 0
+        with open(path, "rb") as fh:
+            while True:
+                chunk = fh.read(READ_SIZE)
+                if not chunk:
+                    break
+                fast.update(chunk)
+                sha.update(chunk)
+                budget_bytes += len(chunk)
+                # Throttle: never read faster than max_bytes_per_second.
+                ahead = budget_bytes / self.max_bytes_per_second - (time.monotonic() - budget_start)
+                if ahead > 0:
+                    time.sleep(ahead)
+            if hasattr(os, "posix_fadvise"):
+                # Do not let a multi-GB hash evict files clients are reading.
+                os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        if os.stat(path).st_mtime_ns != st.st_mtime_ns:
+            return  # Changed while hashing; the watcher/next walk re-queues it.
+
+        directory, name = _split(rel_path)
+        conn = self._db()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM hashes WHERE dir=? AND name=?", (directory, name))
+            conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, directory, name,
+                          fast.hexdigest(), sha.hexdigest()))
+            if self._leader is not None:
+                conn.execute("INSERT INTO hash_log (path) VALUES (?)", (rel_path,))
+        if self.on_hashed is not None:
+            self.on_hashed(rel_path)
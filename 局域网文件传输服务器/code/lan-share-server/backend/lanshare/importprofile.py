@@ -0,0 +1,73 @@
+"""Import-time profiling that also works inside a PyInstaller executable."""
+
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+from typing import Dict, List
+
+
+class ImportProfiler:
+    """Measures how long the modules imported during startup take to load.
+
+    ``install`` wraps ``builtins.__import__``, which every ``import``
+    statement goes through, so this works in frozen builds where
+    ``python -X importtime`` is not available. For each module it records
+    the cumulative time (including the modules it imports in turn) and the
+    time spent in the module itself. Only imports made by the main thread
+    are timed.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.cumulative: Dict[str, float] = {}
+        self.own: Dict[str, float] = {}
+        self.total = 0.0
+        self._children: List[float] = []
+        self._thread_id = threading.get_ident()
+        self._original = builtins.__import__
+
+    def install(self) -> None:
+        builtins.__import__ = self._import
+
+    def uninstall(self) -> None:
+        if builtins.__import__ == self._import:
+            builtins.__import__ = self._original
+
+    def report(self, limit: int = 30) -> str:
+        """The ``limit`` slowest imports, as a table for the console."""
+        lines = [f"Import profile: {self.total * 1000:.0f} ms in imports, "
+                 f"{(time.perf_counter() - self.started) * 1000:.0f} ms since profiling started",
+                 f"{'cumulative':>12} {'self':>10}  module"]
+        slowest = sorted(self.cumulative, key=self.cumulative.get, reverse=True)[:limit]
+        for name in slowest:
+            lines.append(f"{self.cumulative[name] * 1000:>9.1f} ms "
+                         f"{self.own[name] * 1000:>7.1f} ms  {name}")
+        return "\n".join(lines)
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original
+        module_name = name
+        if level:
+            try:
+                module_name = importlib.util.resolve_name(
+                    "." * level + name, (globals or {}).get("__package__") or "")
+            except (ImportError, ValueError):
+                pass
+        if module_name in sys.modules or threading.get_ident() != self._thread_id:
+            return original(name, globals, locals, fromlist, level)
+
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._children.pop()
+            self.cumulative[module_name] = self.cumulative.get(module_name, 0.0) + elapsed
+            self.own[module_name] = self.own.get(module_name, 0.0) + elapsed - children
+            if self._children:
+                self._children[-1] += elapsed
+            else:
+                self.total += elapsed
@@ -0,0 +1,47 @@
+"""Election of the one worker process that does background work."""
+
+import sys
+import threading
+from pathlib import Path
+
+from .paths import internal_dir
+
+
+class LeaderLock:
+    """An exclusive lock on ``.lanshare/leader.lock``.
+
+    When several worker processes serve the same shared directory, the one
+    holding this lock walks the tree, keeps the search index and hashes
+    files; the others follow its results. The operating system releases
+    the lock when the holder exits, so a follower that keeps calling
+    ``try_acquire`` takes over.
+    """
+
+    def __init__(self, shared_dir: Path):
+        self.path = internal_dir(shared_dir, "") / "leader.lock"
+        self._fh = None
+        self._lock = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._fh is not None
+
+    def try_acquire(self) -> bool:
+        """Take the lock if nobody holds it. Returns whether this process holds it."""
+        with self._lock:
+            if self._fh is not None:
+                return True
+            fh = open(self.path, "a+b")
+            try:
+                if sys.platform == "win32":
+                    import msvcrt
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                return False
+            self._fh = fh
+            return True
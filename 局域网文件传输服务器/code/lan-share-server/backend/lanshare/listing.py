@@ -0,0 +1,420 @@
+"""Directory listings built on os.scandir with a per-directory cache."""
+
+import base64
+import bisect
+import fnmatch
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .compression import compress
+from .dirsizes import DirectorySizes
+from .hashing import DirHashes, HashCache
+from .paths import INTERNAL_DIR_NAME, to_rel_path
+from .watcher import FsEvent, InotifyWatcher
+
+
+@dataclass
+class _CachedListing:
+    key: Tuple[int, int]
+    items: List[Dict[str, Any]]
+    created: float
+    body: Optional[bytes] = None
+    # Content-Encoding -> body compressed with it
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+    watched: bool = False
+    stale: bool = False
+    # sort name -> (items in that order, their sort keys for bisect)
+    views: Dict[str, Tuple[List[Dict[str, Any]], List[tuple]]] = field(default_factory=dict)
+
+
+@functools.total_ordering
+class _Desc:
+    """Inverts the ordering of the wrapped value inside a sort key."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+# Every key ends with the exact name, which is unique inside a directory, so
+# the order is total and a cursor always points at one position.
+SORT_KEYS: Dict[str, Callable[[Dict[str, Any]], tuple]] = {
+    "name": lambda i: (not i["is_directory"], i["name"].lower(), i["name"]),
+    "-name": lambda i: (not i["is_directory"], _Desc(i["name"].lower()), _Desc(i["name"])),
+    "mtime": lambda i: (not i["is_directory"], i["mtime"], i["name"]),
+    "-mtime": lambda i: (not i["is_directory"], -i["mtime"], i["name"]),
+    "size": lambda i: (not i["is_directory"], i["size"] or 0, i["name"]),
+    "-size": lambda i: (not i["is_directory"], -(i["size"] or 0), i["name"]),
+}
+
+
+class ListingQueryError(ValueError):
+    """Raised for an unknown sort order or a cursor that cannot be used."""
+
+
+def encode_cursor(sort: str, item: Dict[str, Any]) -> str:
+    raw = json.dumps([sort, item["is_directory"], item["name"], item["mtime"], item["size"]])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(sort: str, cursor: str) -> tuple:
+    """Turn a cursor back into the sort key of the item it was issued after."""
+    try:
+        cursor_sort, is_dir, name, mtime, size = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise ListingQueryError("malformed cursor")
+    if cursor_sort != sort:
+        raise ListingQueryError("cursor was issued for a different sort order")
+    # Valid JSON with the wrong types would fail building the key, or later
+    # when bisect compares it with the real keys.
+    if not (isinstance(is_dir, bool) and isinstance(name, str) and _is_number(mtime)
+            and (size is None or _is_number(size))):
+        raise ListingQueryError("malformed cursor")
+    return SORT_KEYS[sort]({"is_directory": is_dir, "name": name, "mtime": mtime, "size": size})
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def make_name_filter(prefix: Optional[str], pattern: Optional[str]) -> Optional[Callable[[str], bool]]:
+    """Build a case-insensitive name predicate from a prefix and/or glob."""
+    if not prefix and not pattern:
+        return None
+    prefix = (prefix or "").lower()
+    pattern = (pattern or "").lower()
+
+    def matches(name: str) -> bool:
+        lowered = name.lower()
+        return lowered.startswith(prefix) and (not pattern or fnmatch.fnmatchcase(lowered, pattern))
+    return matches
+
+
+def scan_directory(shared_dir: Path, path: Path, hashes: Optional[DirHashes] = None,
+                   dir_sizes: Optional[DirectorySizes] = None) -> List[Dict[str, Any]]:
+    """List one directory, directories first, then by case-insensitive name.
+
+    Uses the type and stat information cached on each ``DirEntry``, so an
+    entry costs at most one stat call (none on Windows). When ``hashes`` is
+    given, files carry ``sha256``/``fast_hash`` (None until hashed). With
+    ``dir_sizes``, directories carry their recursive ``size`` and
+    ``file_count`` (None until known).
+    """
+    rel_dir = to_rel_path(shared_dir, path)
+    prefix = f"{rel_dir}/" if rel_dir != "." else ""
+    items = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if not prefix and entry.name == INTERNAL_DIR_NAME:
+                continue
+            try:
+                is_dir = entry.is_dir()
+                st = entry.stat()
+            except OSError:
+                # Dangling symlink or entry removed while scanning.
+                try:
+                    is_dir, st = False, entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+            item = {
+                "name": entry.name,
+                "path": prefix + entry.name,
+                "is_directory": is_dir,
+                "size": None if is_dir else st.st_size,
+                "mtime": st.st_mtime,
+            }
+            if dir_sizes is not None and is_dir:
+                totals = dir_sizes.get(item["path"])
+                item["size"], item["file_count"] = totals if totals is not None else (None, None)
+            if hashes is not None and not is_dir:
+                known = hashes.get(entry.name)
+                fresh = known is not None and known[:2] == (st.st_size, st.st_mtime_ns)
+                item["fast_hash"] = known[2] if fresh else None
+                item["sha256"] = known[3] if fresh else None
+            items.append(item)
+    items.sort(key=SORT_KEYS["name"])
+    return items
+
+
+def _ndjson_batches(items: List[Dict[str, Any]], name_filter: Optional[Callable[[str], bool]],
+                    batch: int) -> Iterator[bytes]:
+    lines = []
+    for item in items:
+        if name_filter is None or name_filter(item["name"]):
+            lines.append(json.dumps(item, ensure_ascii=False))
+            if len(lines) == batch:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_manifest(shared_dir: Path, path: Path, hash_cache: Optional[HashCache] = None,
+                  batch: int = 500) -> Iterator[bytes]:
+    """Describe every file below ``path`` (or ``path`` itself) as NDJSON batches.
+
+    Each line is ``{"path", "size", "mtime_ns", "sha256"}`` with ``sha256``
+    None while the file is not hashed in its current state. Folders are
+    walked depth first in name order without following symlinks; the
+    internal directory is skipped. Meant for download clients, which fetch
+    the files listed here and check them against ``sha256``.
+    """
+    def line(rel_path: str, st: os.stat_result, sha256: Optional[str]) -> str:
+        return json.dumps({"path": rel_path, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                           "sha256": sha256}, ensure_ascii=False)
+
+    if path.is_file():
+        rel_path, st = to_rel_path(shared_dir, path), path.stat()
+        digests = hash_cache.get(rel_path, st) if hash_cache is not None else None
+        yield (line(rel_path, st, digests[1] if digests else None) + "\n").encode("utf-8")
+        return
+
+    lines = []
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        rel_dir = to_rel_path(shared_dir, directory)
+        prefix = f"{rel_dir}/" if rel_dir != "." else ""
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        hashes = hash_cache.dir_hashes(rel_dir) if hash_cache is not None else {}
+        subdirs = []
+        for entry in entries:
+            if not prefix and entry.name == INTERNAL_DIR_NAME:
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(Path(entry.path))
+                    continue
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            known = hashes.get(entry.name)
+            fresh = known is not None and known[:2] == (st.st_size, st.st_mtime_ns)
+            lines.append(line(prefix + entry.name, st, known[3] if fresh else None))
+            if len(lines) == batch:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines = []
+        stack.extend(reversed(subdirs))
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class DirectoryLister:
+    """Serves directory listings from memory until the directory changes.
+
+    A cached listing is reused while the directory's (inode, mtime) is
+    unchanged. With an inotify watcher the listing is additionally marked stale
+    as soon as an entry is created, deleted or rewritten; without one, listings
+    are re-scanned after ``ttl`` seconds so entry sizes cannot go stale
+    forever.
+    """
+
+    def __init__(self, shared_dir: Path, watcher: Optional[InotifyWatcher] = None,
+                 max_entries: int = 200_000, ttl: float = 2.0,
+                 hash_cache: Optional[HashCache] = None,
+                 dir_sizes: Optional[DirectorySizes] = None):
+        """Initialize the lister.
+
+        Args:
+            shared_dir: Root of the shared tree
+            watcher: Optional inotify watcher used for invalidation
+            max_entries: Total number of cached entries over all directories
+            ttl: Revalidation interval for directories that are not watched
+            hash_cache: Optional source of file digests for the listings
+            dir_sizes: Optional source of recursive directory totals
+        """
+        self.shared_dir = shared_dir
+        self.watcher = watcher
+        self.hash_cache = hash_cache
+        self.dir_sizes = dir_sizes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache: "OrderedDict[Path, _CachedListing]" = OrderedDict()
+        self._cached_entries = 0
+        self._scanning: Dict[Path, int] = {}
+        self._lock = threading.Lock()
+        if watcher is not None:
+            watcher.subscribe(self._on_event)
+        if hash_cache is not None:
+            hash_cache.on_hashed = lambda rel_path: self.invalidate(
+                (shared_dir / rel_path).parent)
+        if dir_sizes is not None:
+            dir_sizes.on_changed = lambda rel_dir: self.invalidate(
+                (shared_dir / rel_dir).parent)
+
+    def list_dir(self, path: Path) -> List[Dict[str, Any]]:
+        """Return the listing for ``path`` (an existing directory)."""
+        return self._get(path).items
+
+    def listing_json(self, path: Path) -> bytes:
+        """Return the listing for ``path`` already encoded as JSON."""
+        return self._json(self._get(path))
+
+    def encoded_listing(self, path: Path, encoding: Optional[str] = None,
+                        min_size: int = 0) -> Tuple[bytes, Optional[str]]:
+        """Return the JSON listing and its Content-Encoding.
+
+        With ``encoding`` (gzip/br), listings of at least ``min_size`` bytes
+        are compressed, once per listing version.
+        """
+        listing = self._get(path)
+        body = self._json(listing)
+        if encoding is None or len(body) < min_size:
+            return body, None
+        encoded = listing.encoded.get(encoding)
+        if encoded is None:
+            encoded = listing.encoded[encoding] = compress(body, encoding)
+        return encoded, encoding
+
+    def page(self, path: Path, sort: str = "name", cursor: Optional[str] = None,
+             limit: int = 500, name_filter: Optional[Callable[[str], bool]] = None
+             ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of a listing in a stable order.
+
+        Args:
+            path: Directory to list
+            sort: One of ``SORT_KEYS``
+            cursor: ``next_cursor`` from the previous page, if any
+            limit: Maximum number of items on the page
+            name_filter: Optional predicate applied to entry names
+
+        Returns:
+            The page items and the cursor of the next page (None at the end)
+        """
+        items, keys = self._view(path, sort)
+        start = bisect.bisect_right(keys, decode_cursor(sort, cursor)) if cursor else 0
+        page = []
+        for index in range(start, len(items)):
+            item = items[index]
+            if name_filter is None or name_filter(item["name"]):
+                page.append(item)
+                if len(page) == limit:
+                    more = index + 1 < len(items)
+                    return page, encode_cursor(sort, item) if more else None
+        return page, None
+
+    def iter_ndjson(self, path: Path, sort: str = "name",
+                    name_filter: Optional[Callable[[str], bool]] = None,
+                    batch: int = 500) -> Iterator[bytes]:
+        """Return an iterator over a listing as newline-delimited JSON.
+
+        The sorted view is taken (and ``sort`` validated) immediately, so the
+        stream is consistent even if the directory changes while it is being
+        sent. At most ``batch`` encoded lines are held at a time.
+        """
+        items, _ = self._view(path, sort)
+        return _ndjson_batches(items, name_filter, batch)
+
+    def invalidate(self, path: Path) -> None:
+        """Mark the cached listing of ``path`` as stale.
+
+        The inotify watch is kept so a busy directory is not re-watched on
+        every change; it is released when the listing is evicted.
+        """
+        with self._lock:
+            if path in self._scanning:
+                self._scanning[path] += 1
+            listing = self._cache.get(path)
+            if listing is not None:
+                listing.stale = True
+
+    def clear(self) -> None:
+        with self._lock:
+            for path in self._scanning:
+                self._scanning[path] += 1
+            for listing in self._cache.values():
+                listing.stale = True
+
+    def _view(self, path: Path, sort: str) -> Tuple[List[Dict[str, Any]], List[tuple]]:
+        if sort not in SORT_KEYS:
+            raise ListingQueryError(f"unknown sort order: {sort}")
+        listing = self._get(path)
+        view = listing.views.get(sort)
+        if view is None:
+            key = SORT_KEYS[sort]
+            items = listing.items if sort == "name" else sorted(listing.items, key=key)
+            view = (items, [key(item) for item in items])
+            listing.views[sort] = view
+        return view
+
+    @staticmethod
+    def _json(listing: _CachedListing) -> bytes:
+        if listing.body is None:
+            listing.body = json.dumps(listing.items, ensure_ascii=False).encode("utf-8")
+        return listing.body
+
+    def _get(self, path: Path) -> _CachedListing:
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns)
+        now = time.monotonic()
+        with self._lock:
+            listing = self._cache.get(path)
+            if listing is not None and not listing.stale and listing.key == key and (
+                    listing.watched or now - listing.created < self.ttl):
+                self._cache.move_to_end(path)
+                return listing
+            was_watched = listing is not None and listing.watched
+            self._scanning[path] = 0
+
+        try:
+            if self.watcher is None:
+                watched = False
+            elif was_watched and self.watcher.is_watched(path):
+                watched = True
+            else:
+                watched = self.watcher.add_watch(path)
+            hashes = None
+            if self.hash_cache is not None:
+                hashes = self.hash_cache.dir_hashes(to_rel_path(self.shared_dir, path))
+            listing = _CachedListing(key, scan_directory(self.shared_dir, path, hashes,
+                                                         self.dir_sizes),
+                                     now, watched=watched)
+        finally:
+            with self._lock:
+                changed = self._scanning.pop(path, 0)
+        # Something changed while we were scanning; serve the listing but
+        # let the next request scan again.
+        listing.stale = changed > 0
+
+        evicted = []
+        with self._lock:
+            old = self._cache.pop(path, None)
+            if old is not None:
+                self._cached_entries -= len(old.items)
+            self._cache[path] = listing
+            self._cached_entries += len(listing.items)
+            while self._cached_entries > self.max_entries and len(self._cache) > 1:
+                old_path, old = self._cache.popitem(last=False)
+                self._cached_entries -= len(old.items)
+                if old.watched:
+                    evicted.append(old_path)
+        for old_path in evicted:
+            self.watcher.remove_watch(old_path)
+        return listing
+
+    def _on_event(self, event: FsEvent) -> None:
+        if event.kind == "overflow":
+            self.clear()
+            return
+        self.invalidate(event.path.parent)
+        if event.is_dir and event.kind == "deleted":
+            self.invalidate(event.path)
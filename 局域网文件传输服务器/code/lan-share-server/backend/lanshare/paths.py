@@ -0,0 +1,41 @@
+"""Path helpers that keep every request inside the shared directory."""
+
+from pathlib import Path
+from typing import Optional
+
+# Server-owned data (upload staging, caches) lives in this directory at the
+# top of the shared tree. It is never listed or served to clients.
+INTERNAL_DIR_NAME = ".lanshare"
+
+
+def resolve_shared_path(shared_dir: Path, rel_path: str) -> Optional[Path]:
+    """Resolve a client supplied relative path against the shared directory.
+
+    Args:
+        shared_dir: Absolute, resolved shared directory
+        rel_path: Path as sent by the client (``/`` separated)
+
+    Returns:
+        The resolved absolute path, or None if it escapes ``shared_dir`` or
+        points into the server's internal directory
+    """
+    full_path = shared_dir.joinpath(rel_path.lstrip("/")).resolve()
+    if full_path == shared_dir:
+        return full_path
+    if shared_dir not in full_path.parents:
+        return None
+    if full_path.relative_to(shared_dir).parts[0] == INTERNAL_DIR_NAME:
+        return None
+    return full_path
+
+
+def internal_dir(shared_dir: Path, name: str) -> Path:
+    """Return (and create) a subdirectory of the server's internal directory."""
+    path = shared_dir / INTERNAL_DIR_NAME / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def to_rel_path(shared_dir: Path, full_path: Path) -> str:
+    """Return the ``/`` separated path of ``full_path`` relative to ``shared_dir``."""
+    return str(full_path.relative_to(shared_dir)).replace("\\", "/")
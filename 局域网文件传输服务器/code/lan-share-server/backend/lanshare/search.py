@@ -0,0 +1,346 @@
+"""In-memory trigram index over the relative paths of the shared tree."""
+
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .leader import LeaderLock
+from .paths import INTERNAL_DIR_NAME
+from .watcher import FsEvent, InotifyWatcher
+
+# Shared index state for multi-worker mode: the leader's last snapshot plus
+# the changes applied since. Followers poll it; the leader republishes the
+# snapshot once the log grows past LOG_LIMIT entries.
+_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_paths (path TEXT NOT NULL, is_dir INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS search_log (
+    seq INTEGER PRIMARY KEY,
+    op TEXT NOT NULL,
+    path TEXT NOT NULL,
+    is_dir INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_meta (generation INTEGER NOT NULL);
+INSERT INTO search_meta SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM search_meta);
+"""
+LOG_LIMIT = 50_000
+# Seconds between a follower's attempts to become the leader.
+TAKEOVER_INTERVAL = 10.0
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Index:
+    """The index data. Only touched by the indexer thread (writes) and by
+    queries under ``SearchIndex._lock``.
+
+    Paths get increasing integer ids, so posting lists stay sorted by
+    appending. Removed paths leave a tombstone (None) that queries skip; the
+    whole index is rebuilt once tombstones make up a quarter of it.
+    """
+
+    def __init__(self):
+        self.paths: List[Optional[str]] = []
+        self.lower: List[Optional[str]] = []
+        self.is_dir = bytearray()
+        self.ids: Dict[str, int] = {}
+        self.postings: Dict[str, array] = {}
+        self.removed = 0
+
+    def add(self, rel_path: str, is_dir: bool) -> None:
+        if rel_path in self.ids:
+            return
+        path_id = len(self.paths)
+        lowered = rel_path.lower()
+        self.paths.append(rel_path)
+        self.lower.append(lowered)
+        self.is_dir.append(is_dir)
+        self.ids[rel_path] = path_id
+        for gram in _trigrams(lowered):
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array("I")
+            posting.append(path_id)
+
+    def remove(self, rel_path: str) -> None:
+        path_id = self.ids.pop(rel_path, None)
+        if path_id is not None:
+            self.paths[path_id] = None
+            self.lower[path_id] = None
+            self.removed += 1
+
+    def remove_tree(self, rel_dir: str) -> None:
+        self.remove(rel_dir)
+        prefix = rel_dir + "/"
+        for rel_path in [p for p in self.ids if p.startswith(prefix)]:
+            self.remove(rel_path)
+
+    def apply(self, op: str, rel_path: str, is_dir: bool) -> None:
+        if op == "add":
+            self.add(rel_path, is_dir)
+        elif op == "remove_tree":
+            self.remove_tree(rel_path)
+        else:
+            self.remove(rel_path)
+
+
+class SearchIndex:
+    """Answers path substring queries without touching the disk.
+
+    The index is built by a background thread that walks the tree once at
+    startup. With an inotify watcher it is then kept current from change
+    events; without one (or when the kernel's watch limit was hit) it is
+    rebuilt every ``rescan_interval`` seconds instead.
+
+    With ``state_path`` (multi-worker mode) the index is also published to
+    that SQLite file. Only the process holding the ``LeaderLock`` walks and
+    watches the tree; the others load the published index and follow its
+    change log, and take over if the leader exits.
+    """
+
+    def __init__(self, shared_dir: Path, watcher: Optional[InotifyWatcher] = None,
+                 rescan_interval: float = 300.0, state_path: Optional[Path] = None):
+        self.shared_dir = shared_dir
+        self.watcher = watcher
+        self.rescan_interval = rescan_interval
+        self.state_path = state_path
+        self.ready = False
+        self._index = _Index()
+        self._lock = threading.Lock()
+        self._events: "queue.Queue[FsEvent]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._leader: Optional[LeaderLock] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[str, str, bool]] = []
+        self._log_size = 0
+        self._generation = 0
+        self._seq = 0
+        self._leading = False
+        if watcher is not None:
+            watcher.subscribe(self._on_event)
+
+    def start(self, leader: Optional[LeaderLock] = None) -> None:
+        """Start building (or, without the leader lock, following) the index."""
+        if self._thread is None:
+            self._leader = leader
+            self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+            self._thread.start()
+
+    def search(self, query: str, limit: int = 100) -> List[Dict[str, object]]:
+        """Return paths containing every whitespace separated term of ``query``.
+
+        Matches where the file name itself contains the query come first,
+        then shorter paths.
+        """
+        terms = [term for term in query.lower().split() if term]
+        if not terms:
+            return []
+        with self._lock:
+            index = self._index
+            candidates = self._candidates(index, terms)
+            hits = []
+            for path_id in candidates:
+                lowered = index.lower[path_id]
+                if lowered is not None and all(term in lowered for term in terms):
+                    hits.append(path_id)
+                    if len(hits) >= limit * 10:
+                        break
+            results = [(index.paths[i], bool(index.is_dir[i])) for i in hits]
+
+        def rank(result):
+            name = result[0].rsplit("/", 1)[-1].lower()
+            return (not all(term in name for term in terms), len(result[0]), result[0])
+        results.sort(key=rank)
+        return [{"path": path, "name": path.rsplit("/", 1)[-1], "is_directory": is_dir}
+                for path, is_dir in results[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._index.ids)
+
+    def _candidates(self, index: _Index, terms: List[str]):
+        # Walk the shortest posting list among all trigrams of all terms and
+        # verify each candidate; terms shorter than 3 characters need a scan.
+        shortest = None
+        for term in terms:
+            for gram in _trigrams(term):
+                posting = index.postings.get(gram)
+                if posting is None:
+                    return ()
+                if shortest is None or len(posting) < len(shortest):
+                    shortest = posting
+        return shortest if shortest is not None else range(len(index.paths))
+
+    def _run(self) -> None:
+        if self.state_path is not None:
+            self._db = sqlite3.connect(self.state_path, timeout=30, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_STATE_SCHEMA)
+        if self._leader is not None and not self._leader.try_acquire():
+            self._follow()
+        self._leading = True
+
+        use_events = self.watcher is not None
+        if use_events:
+            self.watcher.add_tree_root(self.shared_dir, skip=INTERNAL_DIR_NAME)
+        if len(self):
+            self._swap(self._build(watch=use_events))
+        else:
+            self._build(watch=use_events, live=True)
+            self._publish()
+        self.ready = True
+        next_rescan = time.monotonic() + self.rescan_interval
+        while True:
+            if not use_events or self.watcher.limit_reached:
+                use_events = False
+                if time.monotonic() >= next_rescan:
+                    self._swap(self._build(watch=False))
+                    next_rescan = time.monotonic() + self.rescan_interval
+            try:
+                event = self._events.get(timeout=1.0)
+            except queue.Empty:
+                self._flush_log()
+                continue
+            self._apply(event)
+            index = self._index
+            if index.removed > 1000 and index.removed * 4 > len(index.paths):
+                self._swap(self._build(watch=False))
+            elif self._events.empty() or len(self._pending) >= 1000:
+                self._flush_log()
+
+    def _build(self, watch: bool, live: bool = False) -> _Index:
+        """Walk the tree into a fresh index.
+
+        With ``live`` the walk fills the index that queries already use, so
+        results appear while the first build is still running.
+        """
+        index = self._index if live else _Index()
+        root_len = len(os.path.join(str(self.shared_dir), ""))
+        stack = [self.shared_dir]
+        while stack:
+            directory = stack.pop()
+            if watch:
+                # Watch before scanning so nothing created in between is lost.
+                self.watcher.add_watch(directory)
+            try:
+                with os.scandir(directory) as it:
+                    entries = [(entry.path, entry.name, entry.is_dir(follow_symlinks=False))
+                               for entry in it]
+            except OSError:
+                continue
+            if directory == self.shared_dir:
+                entries = [entry for entry in entries if entry[1] != INTERNAL_DIR_NAME]
+            with self._lock if live else contextlib.nullcontext():
+                for path, _, is_dir in entries:
+                    index.add(path[root_len:].replace("\\", "/"), is_dir)
+            stack.extend(Path(path) for path, _, is_dir in entries if is_dir)
+        return index
+
+    def _on_event(self, event: FsEvent) -> None:
+        if self._leading:
+            self._events.put(event)
+
+    def _swap(self, index: _Index) -> None:
+        with self._lock:
+            self._index = index
+        self._publish()
+
+    def _apply(self, event: FsEvent) -> None:
+        if event.kind == "overflow":
+            self._swap(self._build(watch=False))
+            return
+        try:
+            rel_path = event.path.relative_to(self.shared_dir).as_posix()
+        except ValueError:
+            return
+        if rel_path == "." or rel_path.split("/", 1)[0] == INTERNAL_DIR_NAME:
+            return
+        if event.kind == "created":
+            op = "add"
+        elif event.kind == "deleted":
+            op = "remove_tree" if event.is_dir else "remove"
+        else:
+            return
+        with self._lock:
+            self._index.apply(op, rel_path, event.is_dir)
+        if self._db is not None:
+            self._pending.append((op, rel_path, event.is_dir))
+
+    def _publish(self) -> None:
+        """Replace the shared snapshot with the current index."""
+        if self._db is None:
+            return
+        index = self._index
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute("DELETE FROM search_paths")
+            self._db.execute("DELETE FROM search_log")
+            self._db.executemany("INSERT INTO search_paths VALUES (?, ?)",
+                                 ((path, index.is_dir[path_id])
+                                  for path_id, path in enumerate(index.paths) if path is not None))
+            self._db.execute("UPDATE search_meta SET generation = generation + 1")
+        self._pending.clear()
+        self._log_size = 0
+
+    def _flush_log(self) -> None:
+        if self._db is None or not self._pending:
+            return
+        with self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany("INSERT INTO search_log (op, path, is_dir) VALUES (?, ?, ?)",
+                                 self._pending)
+        self._log_size += len(self._pending)
+        self._pending.clear()
+        if self._log_size > LOG_LIMIT:
+            self._publish()
+
+    def _follow(self) -> None:
+        """Mirror the leader's published index until this process becomes the leader."""
+        next_attempt = time.monotonic() + TAKEOVER_INTERVAL
+        while True:
+            try:
+                self._poll()
+            except sqlite3.Error:
+                pass
+            if time.monotonic() >= next_attempt:
+                if self._leader.try_acquire():
+                    return
+                next_attempt = time.monotonic() + TAKEOVER_INTERVAL
+            time.sleep(1.0)
+
+    def _poll(self) -> None:
+        snapshot = None
+        with self._db:
+            # One read transaction, so snapshot and log belong together.
+            self._db.execute("BEGIN")
+            generation = self._db.execute("SELECT generation FROM search_meta").fetchone()[0]
+            if generation != self._generation:
+                snapshot = self._db.execute("SELECT path, is_dir FROM search_paths").fetchall()
+                log = self._db.execute(
+                    "SELECT seq, op, path, is_dir FROM search_log ORDER BY seq").fetchall()
+            else:
+                log = self._db.execute(
+                    "SELECT seq, op, path, is_dir FROM search_log WHERE seq > ? ORDER BY seq",
+                    (self._seq,)).fetchall()
+        if snapshot is not None:
+            index = _Index()
+            for path, is_dir in snapshot:
+                index.add(path, bool(is_dir))
+            for _, op, path, is_dir in log:
+                index.apply(op, path, bool(is_dir))
+            with self._lock:
+                self._index = index
+            self._generation, self._seq = generation, 0
+            self.ready = generation > 0
+        elif log:
+            with self._lock:
+                for _, op, path, is_dir in log:
+                    self._index.apply(op, path, bool(is_dir))
+        if log:
+            self._seq = log[-1][0]
@@ -0,0 +1,498 @@
+"""Delta sync between share servers: a folder is pulled from another server,
+sending only the blocks that changed (the rsync algorithm).
+
+The puller describes the old copy of a file by a signature: an Adler-32
+and a short BLAKE2b digest of every ``block_size`` byte block. The source
+slides a window over its current file with a rolling Adler-32, looks each
+position up in the signature and streams back a delta: runs of the
+puller's own blocks to copy, and literal bytes for everything else,
+followed by the SHA-256 of the whole file. The puller rebuilds the file in
+the internal directory, checks the SHA-256 and moves it into place, so a
+reader only ever sees the old or the new version.
+
+Delta stream, after the response headers::
+
+    b"C" + u32 first block + u32 block count    copy blocks of the old copy
+    b"L" + u32 length + bytes                   literal data
+    b"E" + 32 byte SHA-256                      end of the file
+"""
+
+import hashlib
+import http.client
+import json
+import math
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote, urlsplit
+
+from .errors import ServiceError
+from .leader import LeaderLock
+from .paths import INTERNAL_DIR_NAME, internal_dir, resolve_shared_path, to_rel_path
+
+MIN_BLOCK_SIZE = 2 * 1024
+MAX_BLOCK_SIZE = 128 * 1024
+MAX_SIGNATURE_BYTES = 32 * 1024 * 1024
+_BLOCK = struct.Struct(">I8s")
+_COPY = struct.Struct(">cII")
+_LITERAL = struct.Struct(">cI")
+_ADLER_MOD = 65521
+READ_SIZE = 1024 * 1024
+# Delta output is sent in pieces of about this size.
+PIECE_SIZE = 256 * 1024
+# The rolling search costs Python bytecode per byte. After this many bytes
+# without a match (a new or rewritten file) the source only checks block
+# steps and rolls through one block in every PROBE_EVERY, which still finds
+# the old data again after an insertion of any length.
+ROLL_LIMIT = 1024 * 1024
+PROBE_EVERY = 16
+
+
+class SyncError(Exception):
+    pass
+
+
+def block_size_for(size: int) -> int:
+    """Block size for a file of ``size`` bytes: about its square root, as a power of two."""
+    root = math.isqrt(max(size, 1))
+    return min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, 1 << max(root - 1, 1).bit_length()))
+
+
+def _strong(block) -> bytes:
+    return hashlib.blake2b(block, digest_size=8).digest()
+
+
+def file_signature(path: Path, block_size: int) -> Tuple[bytes, str]:
+    """Block signature of ``path`` and its SHA-256, in one read."""
+    signature = bytearray()
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            signature += _BLOCK.pack(zlib.adler32(block), _strong(block))
+            digest.update(block)
+    return bytes(signature), digest.hexdigest()
+
+
+def open_delta(path: Path, signature: bytes, block_size: int, basis_size: int
+               ) -> Tuple[os.stat_result, Iterator[bytes]]:
+    """Start a delta of ``path`` against the old copy described by ``signature``.
+
+    Returns the stat of the opened file and the delta stream. Raises
+    ServiceError (400) for a signature that does not fit ``basis_size``.
+    """
+    if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+        raise ServiceError(400, f"block_size must be between {MIN_BLOCK_SIZE} and {MAX_BLOCK_SIZE}")
+    blocks = -(-basis_size // block_size)
+    if basis_size < 0 or len(signature) != blocks * _BLOCK.size:
+        raise ServiceError(400, "Signature does not match basis_size and block_size")
+    table: Dict[int, Dict[bytes, int]] = {}
+    tail = None
+    for index, (weak, strong) in enumerate(_BLOCK.iter_unpack(signature)):
+        if index == blocks - 1 and basis_size % block_size:
+            tail = (index, basis_size % block_size, weak, strong)
+        else:
+            table.setdefault(weak, {}).setdefault(strong, index)
+    fh = open(path, "rb")
+    try:
+        st = os.fstat(fh.fileno())
+    except OSError:
+        fh.close()
+        raise
+    return st, _iter_delta(fh, table, tail, block_size)
+
+
+def _iter_delta(fh: BinaryIO, table: Dict[int, Dict[bytes, int]], tail, block_size: int
+                ) -> Iterator[bytes]:
+    digest = hashlib.sha256()
+    out = bytearray()
+    copy_start, copy_count = 0, 0
+    buf = b""
+    p = lit = 0  # window start, start of the pending literal
+    eof = False
+    weak = None
+    unmatched = 0
+
+    def flush_copy():
+        nonlocal copy_count
+        if copy_count:
+            out.extend(_COPY.pack(b"C", copy_start, copy_count))
+            copy_count = 0
+
+    def flush_literal(end):
+        if end > lit:
+            flush_copy()
+            out.extend(_LITERAL.pack(b"L", end - lit))
+            out.extend(buf[lit:end])
+
+    with fh:
+        while True:
+            if len(buf) - p <= block_size and not eof:
+                data = fh.read(READ_SIZE)
+                eof = not data
+                digest.update(data)
+                buf, p, lit = buf[lit:] + data, p - lit, 0
+                if len(out) >= PIECE_SIZE:
+                    yield bytes(out)
+                    out.clear()
+                else:
+                    yield b""
+                continue
+            if len(buf) - p < block_size:
+                break
+            if weak is None:
+                weak = zlib.adler32(buf[p:p + block_size])
+            candidates = table.get(weak)
+            if candidates is not None:
+                index = candidates.get(_strong(buf[p:p + block_size]))
+                if index is not None:
+                    flush_literal(p)
+                    if copy_count and index == copy_start + copy_count:
+                        copy_count += 1
+                    else:
+                        flush_copy()
+                        copy_start, copy_count = index, 1
+                    p = lit = p + block_size
+                    weak, unmatched = None, 0
+                    continue
+            if p - lit >= READ_SIZE:
+                flush_literal(p)
+                lit = p
+            if (unmatched >= ROLL_LIMIT
+                    and ((unmatched - ROLL_LIMIT) // block_size) % PROBE_EVERY):
+                p += block_size
+                unmatched += block_size
+                weak = None
+            elif p + block_size < len(buf):
+                # Slide the window by one byte: drop buf[p], take in buf[p + block_size].
+                a, b = weak & 0xFFFF, weak >> 16
+                old, new = buf[p], buf[p + block_size]
+                a = (a - old + new) % _ADLER_MOD
+                b = (b - block_size * old + a - 1) % _ADLER_MOD
+                weak = (b << 16) | a
+                p += 1
+                unmatched += 1
+            else:
+                p += 1
+                weak = None
+        if tail is not None:
+            index, length, weak, strong = tail
+            rest = buf[p:]
+            if len(rest) == length and zlib.adler32(rest) == weak and _strong(rest) == strong:
+                flush_literal(p)
+                flush_copy()
+                copy_start, copy_count = index, 1
+                p = lit = len(buf)
+        flush_literal(len(buf))
+        flush_copy()
+        out.extend(b"E" + digest.digest())
+        yield bytes(out)
+
+
+def _read_exact(response, count: int) -> bytes:
+    data = response.read(count)
+    if len(data) != count:
+        raise SyncError("Delta stream ended early")
+    return data
+
+
+def apply_delta(response, basis: BinaryIO, out: BinaryIO, block_size: int, basis_size: int) -> int:
+    """Rebuild the new file from a delta stream, the old copy ``basis`` and write it to ``out``.
+
+    Checks the SHA-256 at the end of the stream; returns the bytes of
+    literal data received.
+    """
+    digest = hashlib.sha256()
+    blocks = -(-basis_size // block_size)
+    literal = 0
+    while True:
+        op = _read_exact(response, 1)
+        if op == b"C":
+            start, count = struct.unpack(">II", _read_exact(response, 8))
+            if start + count > blocks:
+                raise SyncError("Delta refers to a block past the end of the old copy")
+            basis.seek(start * block_size)
+            remaining = min(count * block_size, basis_size - start * block_size)
+            while remaining:
+                data = basis.read(min(remaining, READ_SIZE))
+                if not data:
+                    raise SyncError("Old copy changed during sync")
+                out.write(data)
+                digest.update(data)
+                remaining -= len(data)
+        elif op == b"L":
+            remaining, = struct.unpack(">I", _read_exact(response, 4))
+            literal += remaining
+            while remaining:
+                data = _read_exact(response, min(remaining, READ_SIZE))
+                out.write(data)
+                digest.update(data)
+                remaining -= len(data)
+        elif op == b"E":
+            if _read_exact(response, 32) != digest.digest():
+                raise SyncError("Rebuilt file does not match the source's SHA-256")
+            return literal
+        else:
+            raise SyncError(f"Unknown delta operation {op!r}")
+
+
+class _Connection:
+    """A keep-alive connection to the source, reopened once when the server closed it."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        url = urlsplit(base_url if "://" in base_url else "http://" + base_url)
+        self._class = (http.client.HTTPSConnection if url.scheme == "https"
+                       else http.client.HTTPConnection)
+        self._address = (url.hostname, url.port)
+        self._timeout = timeout
+        self._conn = None
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None
+                ) -> http.client.HTTPResponse:
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._class(*self._address, timeout=self._timeout)
+            try:
+                self._conn.request(method, path, body=body)
+                return self._conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class _Counter:
+    """Wraps a response to count the bytes read from it."""
+
+    def __init__(self, response, run: Dict[str, object]):
+        self._response = response
+        self._run = run
+
+    def read(self, count: int) -> bytes:
+        data = self._response.read(count)
+        self._run["bytes_received"] += len(data)
+        return data
+
+
+class Mirror:
+    """Keeps a folder of the shared directory a copy of a folder on another share server.
+
+    Every ``interval`` seconds (or when ``trigger`` is called) the source's
+    manifest is compared with the local files. Files whose size and mtime
+    match are skipped, as are files whose SHA-256 matches (they only get
+    the source's mtime). New files are downloaded whole; changed files are
+    patched with a delta against the local copy. Each updated file is
+    checked against the source's SHA-256 and then renamed into place. With
+    ``delete``, local files the source no longer has are removed.
+
+    Started with a ``LeaderLock``, only the process holding the lock syncs.
+    """
+
+    def __init__(self, shared_dir: Path, source: str, remote_path: str = "", local_path: str = "",
+                 interval: float = 300.0, delete: bool = False, hash_cache=None):
+        self.shared_dir = shared_dir
+        self.source = source
+        self.remote_path = remote_path.strip("/")
+        self.local_path = local_path.strip("/")
+        self.interval = interval
+        self.delete = delete
+        self.hash_cache = hash_cache
+        self.running = False
+        self.last_run: Optional[Dict[str, object]] = None
+        self._wakeup = threading.Event()
+        self._leader: Optional[LeaderLock] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, leader: Optional[LeaderLock] = None) -> None:
+        if self._thread is None:
+            self._leader = leader
+            self._thread = threading.Thread(target=self._run, name="mirror", daemon=True)
+            self._thread.start()
+
+    def trigger(self) -> bool:
+        """Sync now; False if another worker process does the syncing."""
+        if self._leader is not None and not self._leader.held:
+            return False
+        self._wakeup.set()
+        return True
+
+    def stats(self) -> Dict[str, object]:
+        return {"source": self.source, "remote_path": self.remote_path,
+                "local_path": self.local_path, "interval": self.interval, "delete": self.delete,
+                "active": self._leader is None or self._leader.held,
+                "running": self.running, "last_run": self.last_run}
+
+    def _run(self) -> None:
+        while True:
+            if self._leader is None or self._leader.try_acquire():
+                self.running = True
+                try:
+                    self.last_run = self.run_once()
+                finally:
+                    self.running = False
+            self._wakeup.wait(self.interval if self.interval > 0 else None)
+            self._wakeup.clear()
+
+    def run_once(self) -> Dict[str, object]:
+        """One pass over the source folder; returns what was done."""
+        run = {"started": round(time.time(), 3), "duration": None, "files": 0, "unchanged": 0,
+               "touched": 0, "downloaded": 0, "patched": 0, "deleted": 0, "failed": 0,
+               "bytes_updated": 0, "bytes_received": 0, "errors": []}
+        started = time.monotonic()
+        conn = _Connection(self.source)
+        try:
+            entries = self._manifest(conn, run)
+            wanted: Set[str] = set()
+            for entry in entries:
+                rel_path = self._local_rel_path(entry["path"])
+                full_path = resolve_shared_path(self.shared_dir, rel_path) if rel_path else None
+                if full_path is None or full_path == self.shared_dir:
+                    continue
+                run["files"] += 1
+                wanted.add(rel_path)
+                try:
+                    outcome = self._sync_file(conn, entry, rel_path, full_path, run)
+                except (SyncError, OSError, http.client.HTTPException) as exc:
+                    conn.close()
+                    run["failed"] += 1
+                    if len(run["errors"]) < 10:
+                        run["errors"].append(f"{rel_path}: {exc}")
+                    continue
+                run[outcome] += 1
+                if outcome in ("downloaded", "patched"):
+                    run["bytes_updated"] += entry["size"]
+            if self.delete:
+                self._delete_missing(wanted, run)
+        except (SyncError, OSError, http.client.HTTPException, ValueError) as exc:
+            run["errors"].append(str(exc))
+        finally:
+            conn.close()
+            run["duration"] = round(time.monotonic() - started, 3)
+        return run
+
+    def _manifest(self, conn: _Connection, run: Dict[str, object]) -> List[Dict[str, object]]:
+        response = conn.request("GET", "/api/manifest/" + quote(self.remote_path, safe="/"))
+        body = response.read()
+        run["bytes_received"] += len(body)
+        if response.status != 200:
+            raise SyncError(f"manifest: HTTP {response.status} {body[:200]!r}")
+        return [json.loads(line) for line in body.decode("utf-8").splitlines() if line]
+
+    def _local_rel_path(self, remote_rel_path: str) -> Optional[str]:
+        path = PurePosixPath(remote_rel_path)
+        if path.as_posix() == self.remote_path:
+            relative = path.name  # the source is a single file
+        elif self.remote_path:
+            try:
+                relative = path.relative_to(self.remote_path).as_posix()
+            except ValueError:
+                return None
+        else:
+            relative = path.as_posix()
+        return f"{self.local_path}/{relative}" if self.local_path else relative
+
+    def _sync_file(self, conn: _Connection, entry: Dict[str, object], rel_path: str,
+                   full_path: Path, run: Dict[str, object]) -> str:
+        try:
+            st = full_path.stat()
+        except FileNotFoundError:
+            st = None
+        if st is not None and st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]:
+            return "unchanged"
+        if st is None or st.st_size == 0:
+            self._download(conn, entry, full_path, run)
+            return "downloaded"
+        known = self.hash_cache.get(rel_path, st) if self.hash_cache is not None else None
+        if known is not None and entry["sha256"] == known[1]:
+            os.utime(full_path, ns=(st.st_atime_ns, entry["mtime_ns"]))
+            return "touched"
+        block_size = block_size_for(st.st_size)
+        signature, sha256 = file_signature(full_path, block_size)
+        if entry["sha256"] == sha256:
+            os.utime(full_path, ns=(st.st_atime_ns, entry["mtime_ns"]))
+            return "touched"
+        try:
+            self._patch(conn, entry, full_path, signature, block_size, st.st_size, run)
+        except SyncError:
+            # The local copy changed under us, or the delta did not add up:
+            # fall back to the whole file.
+            conn.close()
+            self._download(conn, entry, full_path, run)
+            return "downloaded"
+        return "patched"
+
+    def _patch(self, conn: _Connection, entry: Dict[str, object], full_path: Path,
+               signature: bytes, block_size: int, basis_size: int, run: Dict[str, object]) -> None:
+        response = conn.request(
+            "POST", f"/api/download/delta/{quote(entry['path'], safe='/')}"
+                    f"?block_size={block_size}&basis_size={basis_size}", body=signature)
+        if response.status != 200:
+            body = response.read()
+            raise SyncError(f"delta: HTTP {response.status} {body[:200]!r}")
+        mtime_ns = int(response.getheader("X-Mtime-Ns", entry["mtime_ns"]))
+
+        def write(out: BinaryIO) -> None:
+            apply_delta(_Counter(response, run), basis, out, block_size, basis_size)
+            # Read the end of the chunked body too; a response left unread
+            # makes the next request on this connection fail and be resent.
+            if response.read():
+                raise SyncError("Data after the end of the delta stream")
+
+        with open(full_path, "rb") as basis:
+            self._replace(full_path, mtime_ns, write)
+
+    def _download(self, conn: _Connection, entry: Dict[str, object], full_path: Path,
+                  run: Dict[str, object]) -> None:
+        response = conn.request("GET", "/api/download/file/" + quote(entry["path"], safe="/"))
+        if response.status != 200:
+            body = response.read()
+            raise SyncError(f"download: HTTP {response.status} {body[:200]!r}")
+
+        def write(out: BinaryIO) -> None:
+            digest = hashlib.sha256()
+            counted = _Counter(response, run)
+            for data in iter(lambda: counted.read(READ_SIZE), b""):
+                out.write(data)
+                digest.update(data)
+            if entry["sha256"] is not None and digest.hexdigest() != entry["sha256"]:
+                raise SyncError("File changed on the source during sync")
+
+        self._replace(full_path, entry["mtime_ns"], write)
+
+    def _replace(self, full_path: Path, mtime_ns: int, write) -> None:
+        """Write the new content to a staging file, then rename it over ``full_path``."""
+        staging = internal_dir(self.shared_dir, "sync") / f"{uuid.uuid4().hex}.part"
+        try:
+            with open(staging, "wb") as out:
+                write(out)
+            os.utime(staging, ns=(time.time_ns(), mtime_ns))
+            full_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staging, full_path)
+        finally:
+            if staging.exists():
+                staging.unlink()
+
+    def _delete_missing(self, wanted: Set[str], run: Dict[str, object]) -> None:
+        root = resolve_shared_path(self.shared_dir, self.local_path)
+        if root is None or not root.is_dir():
+            return
+        for directory, dirs, files in os.walk(root):
+            if Path(directory) == self.shared_dir and INTERNAL_DIR_NAME in dirs:
+                dirs.remove(INTERNAL_DIR_NAME)
+            for name in files:
+                full_path = Path(directory) / name
+                if to_rel_path(self.shared_dir, full_path) not in wanted:
+                    try:
+                        full_path.unlink()
+                        run["deleted"] += 1
+                    except OSError:
+                        pass
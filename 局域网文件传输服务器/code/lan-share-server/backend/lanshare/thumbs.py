@@ -0,0 +1,171 @@
+"""Thumbnail generation with a bounded worker pool and an on-disk cache."""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import importlib.util
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+# The decoders are imported by the first thumbnail request; importing OpenCV
+# alone can take longer than the rest of the server's startup.
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+CV2_AVAILABLE = importlib.util.find_spec("cv2") is not None
+
+from .errors import ServiceError
+from .paths import internal_dir
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".webm"}
+# Requested sizes are rounded up to one of these so the cache stays small.
+THUMB_SIZES = (128, 256, 512)
+JPEG_QUALITY = 80
+
+
+class ThumbnailError(ServiceError):
+    """A thumbnail that cannot be produced."""
+
+
+def _pick_size(size: int) -> int:
+    return next((s for s in THUMB_SIZES if s >= size), THUMB_SIZES[-1])
+
+
+def _render_with_pil(source: Path, target: Path, size: int) -> None:
+    from PIL import Image
+
+    with Image.open(source) as img:
+        # For JPEG this lets the decoder scale by 1/2..1/8 while decoding.
+        img.draft("RGB", (size, size))
+        img.thumbnail((size, size))
+        img.convert("RGB").save(target, "JPEG", quality=JPEG_QUALITY)
+
+
+def _render_with_cv2(source: Path, target: Path, size: int, video: bool) -> None:
+    import cv2
+
+    if video:
+        capture = cv2.VideoCapture(str(source))
+        try:
+            ok, frame = capture.read()
+        finally:
+            capture.release()
+        if not ok:
+            raise ThumbnailError(415, "Cannot decode video")
+    else:
+        frame = cv2.imread(str(source), cv2.IMREAD_REDUCED_COLOR_2)
+        if frame is None:
+            raise ThumbnailError(415, "Cannot decode image")
+    height, width = frame.shape[:2]
+    scale = min(size / width, size / height, 1.0)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ThumbnailError(500, "Cannot encode thumbnail")
+    target.write_bytes(encoded.tobytes())
+
+
+class ThumbnailCache:
+    """Produces JPEG thumbnails for images (and videos with OpenCV).
+
+    Thumbnails are stored under ``.lanshare/thumbs`` named after the source
+    file's identity (dev, inode, size, mtime) and the thumbnail size, so an
+    edited file gets a new thumbnail automatically. Decoding runs in a small
+    thread pool; concurrent requests for the same thumbnail share one
+    decode. The cache directory is trimmed (oldest first) when it grows
+    beyond ``max_bytes``.
+    """
+
+    def __init__(self, shared_dir: Path, workers: int = 2, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = internal_dir(shared_dir, "thumbs")
+        self.max_bytes = max_bytes
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                           thread_name_prefix="thumbs")
+        self._pending: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._cache_bytes = sum(p.stat().st_size for p in self.cache_dir.glob("*.jpg"))
+
+    @staticmethod
+    def supports(path: Path) -> bool:
+        suffix = path.suffix.lower()
+        if suffix in VIDEO_EXTENSIONS:
+            return CV2_AVAILABLE
+        return suffix in IMAGE_EXTENSIONS and (PIL_AVAILABLE or CV2_AVAILABLE)
+
+    def lookup(self, source: Path, size: int, st: os.stat_result) -> Tuple[Path, bool]:
+        """Where the thumbnail of ``source`` (as of ``st``) is cached and whether it exists.
+
+        Touches the disk; async callers run it in a thread pool.
+        """
+        if not self.supports(source):
+            raise ThumbnailError(415, "No thumbnail available for this file type")
+        size = _pick_size(size)
+        key = hashlib.sha1(
+            f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{size}".encode()).hexdigest()
+        target = self.cache_dir / f"{key}.jpg"
+        return target, target.exists()
+
+    async def generate(self, source: Path, target: Path, size: int) -> Path:
+        """Create the thumbnail ``lookup`` placed at ``target``, sharing concurrent requests."""
+        size = _pick_size(size)
+        key = target.stem
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(self._generate, source, target, size)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+        return await asyncio.wrap_future(future)
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def _generate(self, source: Path, target: Path, size: int) -> Path:
+        if target.exists():
+            return target
+        tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+        video = source.suffix.lower() in VIDEO_EXTENSIONS
+        try:
+            if PIL_AVAILABLE and not video:
+                _render_with_pil(source, tmp, size)
+            else:
+                _render_with_cv2(source, tmp, size, video)
+            os.replace(tmp, target)
+        except ThumbnailError:
+            raise
+        except Exception as e:
+            raise ThumbnailError(415, f"Cannot create thumbnail: {e}")
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        self._account(target.stat().st_size)
+        return target
+
+    def _account(self, added: int) -> None:
+        with self._lock:
+            self._cache_bytes += added
+            if self._cache_bytes <= self.max_bytes:
+                return
+        files = []
+        for path in self.cache_dir.glob("*.jpg"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._cache_bytes = total
@@ -0,0 +1,157 @@
+"""Per-response transfer accounting: who downloads what, and how fast."""
+
+import bisect
+import collections
+import itertools
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets; the last bucket is open-ended.
+RATE_BUCKETS = tuple(2 ** exponent * 1024 for exponent in range(6, 21))  # 64 KB/s .. 1 GB/s
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800)
+# Shorter responses say more about latency than about throughput, so they
+# are left out of the rate histogram.
+MIN_RATE_BYTES = 256 * 1024
+
+
+class Transfer:
+    __slots__ = ("id", "client", "method", "path", "range", "status", "length", "sent",
+                 "started", "started_at", "finished", "state")
+
+    def __init__(self, transfer_id: int, client: str, method: str, path: str, range_: Optional[str]):
+        self.id = transfer_id
+        self.client = client
+        self.method = method
+        self.path = path
+        self.range = range_
+        self.status: Optional[int] = None
+        self.length: Optional[int] = None
+        self.sent = 0
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.finished: Optional[float] = None
+        self.state = "active"
+
+    def as_dict(self, now: float) -> Dict[str, object]:
+        duration = (self.finished or now) - self.started
+        return {"id": self.id, "client": self.client, "method": self.method, "path": self.path,
+                "range": self.range, "status": self.status, "state": self.state,
+                "bytes_sent": self.sent, "length": self.length,
+                "progress": round(self.sent / self.length, 4) if self.length else None,
+                "started": round(self.started_at, 3), "duration": round(duration, 3),
+                "rate": round(self.sent / duration) if duration > 0 else None}
+
+
+class _Histogram:
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def as_list(self) -> List[Dict[str, object]]:
+        return [{"le": bound, "count": count}
+                for bound, count in zip(self.bounds + (None,), self.counts)]
+
+
+class TransferLog:
+    """Active transfers, the most recent finished ones, and totals since start.
+
+    Every method is called on the event loop thread (by ``TransferMiddleware``
+    and the admin endpoint), so the bookkeeping needs no lock: counting a
+    body piece is two attribute updates, and histograms are only touched
+    once per finished transfer. Each worker process keeps its own log.
+    """
+
+    def __init__(self, history: int = 200):
+        self._ids = itertools.count(1)
+        self.active: Dict[int, Transfer] = {}
+        self.recent: Deque[Transfer] = collections.deque(maxlen=history)
+        self.completed = 0
+        self.aborted = 0
+        self.bytes_sent = 0
+        self.rates = _Histogram(RATE_BUCKETS)
+        self.durations = _Histogram(DURATION_BUCKETS)
+
+    def open(self, client: str, method: str, path: str, range_: Optional[str] = None) -> Transfer:
+        transfer = Transfer(next(self._ids), client, method, path, range_)
+        self.active[transfer.id] = transfer
+        return transfer
+
+    def close(self, transfer: Transfer, complete: bool) -> None:
+        """Move ``transfer`` to the history; ``complete`` is False if the body was cut short."""
+        transfer.finished = time.monotonic()
+        transfer.state = "done" if complete else "aborted"
+        self.active.pop(transfer.id, None)
+        self.recent.append(transfer)
+        self.bytes_sent += transfer.sent
+        duration = transfer.finished - transfer.started
+        if complete:
+            self.completed += 1
+            self.durations.add(duration)
+            if transfer.sent >= MIN_RATE_BYTES and duration > 0:
+                self.rates.add(transfer.sent / duration)
+        else:
+            self.aborted += 1
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        active = [transfer.as_dict(now) for transfer in self.active.values()]
+        in_flight = sum(transfer.sent for transfer in self.active.values())
+        return {"active": active,
+                "recent": [transfer.as_dict(now) for transfer in reversed(self.recent)],
+                "totals": {"completed": self.completed, "aborted": self.aborted,
+                           "bytes_sent": self.bytes_sent + in_flight},
+                "histograms": {"rate": self.rates.as_list(),
+                               "duration": self.durations.as_list()}}
+
+
+class TransferMiddleware:
+    """ASGI middleware that records every response under ``prefixes`` in a ``TransferLog``.
+
+    Added after ``BandwidthMiddleware`` it sits outside it, so bytes are
+    counted when they are handed to the server, after any pacing.
+    """
+
+    def __init__(self, app, log: TransferLog,
+                 prefixes: Tuple[str, ...] = ("/api/download/", "/api/manifest", "/api/thumb/")):
+        self.app = app
+        self.log = log
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        range_ = None
+        for name, value in scope.get("headers", ()):
+            if name == b"range":
+                range_ = value.decode("latin-1")
+        client = scope["client"][0] if scope.get("client") else "unknown"
+        transfer = self.log.open(client, scope["method"], scope["path"], range_)
+        complete = False
+
+        async def counted_send(message) -> None:
+            nonlocal complete
+            if message["type"] == "http.response.start":
+                transfer.status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-length" and scope["method"] != "HEAD":
+                        transfer.length = int(value)
+            elif message["type"] == "http.response.body":
+                await send(message)
+                transfer.sent += len(message.get("body", b""))
+                complete = not message.get("more_body", False)
+                return
+            elif message["type"] == "http.response.pathsend":
+                await send(message)
+                transfer.sent += transfer.length or 0
+                complete = True
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counted_send)
+        finally:
+            self.log.close(transfer, complete)
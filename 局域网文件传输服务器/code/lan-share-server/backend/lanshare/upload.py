@@ -0,0 +1,253 @@
+"""Chunked, resumable uploads staged next to the shared tree."""
+
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .errors import ServiceError
+from .fileio import preallocate, read_at, write_at
+from .paths import internal_dir, resolve_shared_path, to_rel_path
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# Request body pieces are gathered up to this size before each disk write.
+WRITE_BUFFER = 1024 * 1024
+
+
+class UploadError(ServiceError):
+    """An upload request that cannot be honoured."""
+
+
+@dataclass
+class UploadSession:
+    """A declared upload. Persisted as ``<upload_id>.json`` in the staging dir."""
+    upload_id: str
+    path: str
+    size: int
+    chunk_size: int
+    overwrite: bool
+    created: float
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, index: int) -> int:
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+
+class UploadManager:
+    """Tracks upload sessions and writes chunks straight into staging files.
+
+    Each session owns three files in the staging directory: ``.json`` (the
+    declaration), ``.part`` (the preallocated data file, written with
+    positioned writes) and ``.chunks`` (one byte per chunk, set to 1 once the
+    chunk was written and its checksum verified). All state is on disk, so a
+    client can resume after a dropped link or a server restart.
+
+    A declared size larger than ``max_size`` (0: no limit) or than the free
+    space on the disk is refused before anything is allocated.
+    """
+
+    def __init__(self, shared_dir: Path, chunk_size: int = DEFAULT_CHUNK_SIZE, max_size: int = 0):
+        self.shared_dir = shared_dir
+        self.chunk_size = chunk_size
+        self.max_size = max_size
+        self.staging_dir = internal_dir(shared_dir, "uploads")
+        self._sessions: Dict[str, UploadSession] = {}
+        self._completing = set()
+        self._lock = threading.Lock()
+
+    def create(self, rel_path: str, size: int, chunk_size: Optional[int] = None,
+               overwrite: bool = False) -> UploadSession:
+        """Declare a new upload and preallocate its staging file."""
+        target = self._target(rel_path, overwrite)
+        chunk_size = chunk_size or self.chunk_size
+        if size < 0 or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadError(400, "Invalid size or chunk size")
+        if self.max_size and size > self.max_size:
+            raise UploadError(413, f"Uploads are limited to {self.max_size} bytes")
+        if size > shutil.disk_usage(self.staging_dir).free:
+            raise UploadError(413, "Not enough free disk space for this upload")
+
+        session = UploadSession(secrets.token_hex(16), to_rel_path(self.shared_dir, target),
+                                size, chunk_size, overwrite, time.time())
+        with open(self._file(session.upload_id, ".part"), "wb") as fh:
+            preallocate(fh, size)
+        with open(self._file(session.upload_id, ".chunks"), "wb") as fh:
+            fh.write(b"\0" * session.chunk_count)
+        tmp = self._file(session.upload_id, ".json.tmp")
+        tmp.write_text(json.dumps(asdict(session)), encoding="utf-8")
+        os.replace(tmp, self._file(session.upload_id, ".json"))
+        with self._lock:
+            self._sessions[session.upload_id] = session
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+        if not upload_id.isalnum():
+            raise UploadError(404, "Unknown upload")
+        try:
+            data = json.loads(self._file(upload_id, ".json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            raise UploadError(404, "Unknown upload")
+        session = UploadSession(**data)
+        with self._lock:
+            self._sessions[upload_id] = session
+        return session
+
+    def received_chunks(self, session: UploadSession) -> List[int]:
+        """Indexes of chunks that were written and verified."""
+        bitmap = self._file(session.upload_id, ".chunks").read_bytes()
+        return [index for index, done in enumerate(bitmap) if done]
+
+    async def write_chunk(self, session: UploadSession, index: int,
+                          body: AsyncIterator[bytes], sha256: str) -> None:
+        """Stream one chunk from ``body`` into its place in the staging file.
+
+        The chunk is unmarked before any byte is written and only marked as
+        received again when its length and SHA-256 match; otherwise the client
+        simply sends it again.
+        """
+        if not 0 <= index < session.chunk_count:
+            raise UploadError(400, "Chunk index out of range")
+        expected = session.chunk_length(index)
+        offset = index * session.chunk_size
+        digest = hashlib.sha256()
+        received = 0
+        buffer = bytearray()
+
+        await run_in_threadpool(self._mark, session, index, False)
+        fh = await run_in_threadpool(open, self._file(session.upload_id, ".part"), "r+b")
+        try:
+            async for piece in body:
+                received += len(piece)
+                if received > expected:
+                    raise UploadError(400, f"Chunk {index} is larger than {expected} bytes")
+                digest.update(piece)
+                buffer += piece
+                if len(buffer) >= WRITE_BUFFER:
+                    await run_in_threadpool(write_at, fh, offset, bytes(buffer))
+                    offset += len(buffer)
+                    buffer.clear()
+            if buffer:
+                await run_in_threadpool(write_at, fh, offset, bytes(buffer))
+        finally:
+            await run_in_threadpool(fh.close)
+
+        if received != expected:
+            raise UploadError(400, f"Chunk {index} has {received} bytes, expected {expected}")
+        if digest.hexdigest() != sha256.lower():
+            raise UploadError(422, f"Checksum mismatch for chunk {index}")
+        await run_in_threadpool(self._mark, session, index, True)
+
+    def complete(self, session: UploadSession, sha256: Optional[str] = None) -> Path:
+        """Verify that every chunk arrived and move the file into place.
+
+        Only one request at a time may complete (or abort) a session; the
+        others get 409.
+        """
+        self._claim(session)
+        try:
+            return self._complete(session, sha256)
+        except FileNotFoundError:
+            # Completed or aborted meanwhile by a request in another worker.
+            raise UploadError(409, "Upload was completed or aborted by another request")
+        finally:
+            with self._lock:
+                self._completing.discard(session.upload_id)
+
+    def _complete(self, session: UploadSession, sha256: Optional[str]) -> Path:
+        missing = session.chunk_count - len(self.received_chunks(session))
+        if missing:
+            raise UploadError(409, f"{missing} chunk(s) still missing")
+        part = self._file(session.upload_id, ".part")
+        if sha256 is not None and _sha256_file(part) != sha256.lower():
+            raise UploadError(422, "Checksum mismatch for the complete file")
+
+        target = self._target(session.path, session.overwrite)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with open(part, "rb+") as fh:
+            os.fsync(fh.fileno())
+        # Same filesystem as the shared tree, so this is an atomic rename.
+        os.replace(part, target)
+        self._remove(session.upload_id)
+        return target
+
+    def abort(self, session: UploadSession) -> None:
+        self._claim(session)
+        try:
+            self._remove(session.upload_id)
+        finally:
+            with self._lock:
+                self._completing.discard(session.upload_id)
+
+    def purge_stale(self, max_age: float = 7 * 24 * 3600) -> None:
+        """Delete sessions that have not been touched for ``max_age`` seconds."""
+        now = time.time()
+        for meta in self.staging_dir.glob("*.json"):
+            upload_id = meta.stem
+            try:
+                mtime = max(meta.stat().st_mtime, self._file(upload_id, ".chunks").stat().st_mtime)
+            except OSError:
+                mtime = 0
+            if now - mtime > max_age:
+                self._remove(upload_id)
+
+    def _claim(self, session: UploadSession) -> None:
+        with self._lock:
+            if session.upload_id in self._completing:
+                raise UploadError(409, "Upload is already being completed or aborted")
+            if session.upload_id not in self._sessions:
+                raise UploadError(404, "Unknown upload")
+            self._completing.add(session.upload_id)
+
+    def _target(self, rel_path: str, overwrite: bool) -> Path:
+        target = resolve_shared_path(self.shared_dir, rel_path)
+        if target is None or target == self.shared_dir or not rel_path.strip("/"):
+            raise UploadError(403, "Invalid upload path")
+        if target.is_dir() or (target.exists() and not overwrite):
+            raise UploadError(409, "Target already exists")
+        return target
+
+    def _mark(self, session: UploadSession, index: int, received: bool) -> None:
+        with open(self._file(session.upload_id, ".chunks"), "r+b") as fh:
+            write_at(fh, index, b"\1" if received else b"\0")
+
+    def _file(self, upload_id: str, suffix: str) -> Path:
+        return self.staging_dir / f"{upload_id}{suffix}"
+
+    def _remove(self, upload_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        for suffix in (".json", ".chunks", ".part"):
+            try:
+                self._file(upload_id, suffix).unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    offset = 0
+    with open(path, "rb") as fh:
+        while True:
+            chunk = read_at(fh, offset, WRITE_BUFFER)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
+            offset += len(chunk)
@@ -0,0 +1,250 @@
+"""Filesystem change notifications (inotify on Linux, nothing elsewhere)."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# IN_MODIFY is left out on purpose: a file being written fires it for every
+# write() call. IN_CLOSE_WRITE reports the finished file once.
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+@dataclass(frozen=True)
+class FsEvent:
+    """A change below a watched directory.
+
+    ``kind`` is one of ``created``, ``deleted``, ``modified`` or ``overflow``
+    (the kernel dropped events; every cache must be treated as stale).
+    """
+    kind: str
+    path: Path
+    is_dir: bool = False
+
+
+class InotifyWatcher:
+    """Watches directories with Linux inotify.
+
+    Watches are reference counted, so independent users (the listing cache,
+    the search index) can add and remove the same directory. Directories
+    below a tree root registered with ``add_tree_root`` are watched
+    automatically when they are created, and a ``created`` event is emitted
+    for whatever they already contain by the time the watch is in place.
+
+    Events are delivered from a single background thread to every subscriber,
+    so callbacks must be quick and thread safe.
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._lock = threading.Lock()
+        self._wd_to_path: Dict[int, Path] = {}
+        self._path_to_wd: Dict[Path, int] = {}
+        self._refs: Dict[Path, int] = {}
+        self._tree_roots: List[Tuple[Path, str]] = []
+        self._subscribers: List[Callable[[FsEvent], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        # Set when the kernel refused a watch (fs.inotify.max_user_watches).
+        self.limit_reached = False
+
+    def subscribe(self, callback: Callable[[FsEvent], None]) -> None:
+        """Register a callback invoked for every event."""
+        self._subscribers.append(callback)
+
+    def add_watch(self, path: Path) -> bool:
+        """Start watching a directory (not recursive) or add a reference.
+
+        Returns:
+            True if the directory is watched after the call
+        """
+        with self._lock:
+            if path in self._path_to_wd:
+                self._refs[path] += 1
+                return True
+        wd = self._add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            if ctypes.get_errno() == errno.ENOSPC:
+                self.limit_reached = True
+            return False
+        with self._lock:
+            if path in self._path_to_wd:
+                self._refs[path] += 1
+            else:
+                # The kernel returns the existing wd for a directory that was
+                # moved; forget the path it used to have.
+                old_path = self._wd_to_path.get(wd)
+                if old_path is not None:
+                    self._path_to_wd.pop(old_path, None)
+                    self._refs.pop(old_path, None)
+                self._wd_to_path[wd] = path
+                self._path_to_wd[path] = wd
+                self._refs[path] = 1
+        self._ensure_thread()
+        return True
+
+    def remove_watch(self, path: Path) -> None:
+        """Drop one reference; the watch ends when no reference is left."""
+        with self._lock:
+            refs = self._refs.get(path, 0) - 1
+            if refs > 0:
+                self._refs[path] = refs
+                return
+            self._refs.pop(path, None)
+            wd = self._path_to_wd.pop(path, None)
+            if wd is not None:
+                self._wd_to_path.pop(wd, None)
+        if wd is not None:
+            self._rm_watch(self._fd, wd)
+
+    def add_tree_root(self, root: Path, skip: str = "") -> None:
+        """Watch directories created anywhere below ``root`` automatically.
+
+        Existing directories are not walked here; the caller adds them with
+        ``add_watch`` while it walks the tree anyway. ``skip`` names a
+        top-level directory of ``root`` that is left alone.
+        """
+        with self._lock:
+            self._tree_roots.append((root, skip))
+
+    def is_watched(self, path: Path) -> bool:
+        with self._lock:
+            return path in self._path_to_wd
+
+    def stop(self) -> None:
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        os.close(self._fd)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="inotify-watcher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while self._running:
+            ready, _, _ = select.select([self._fd], [], [], 0.5)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError:
+                continue
+            for event in self._parse(data):
+                self._dispatch(event)
+                if event.kind == "created" and event.is_dir and self._in_tree(event.path):
+                    self._watch_new_tree(event.path)
+
+    def _dispatch(self, event: FsEvent) -> None:
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception:
+                pass
+
+    def _in_tree(self, path: Path) -> bool:
+        with self._lock:
+            roots = list(self._tree_roots)
+        for root, skip in roots:
+            if root in path.parents:
+                rel = path.relative_to(root)
+                if not skip or rel.parts[0] != skip:
+                    return True
+        return False
+
+    def _watch_new_tree(self, top: Path) -> None:
+        # Entries may have been created before the watch existed (mkdir -p,
+        # a moved-in directory), so report everything that is already there.
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            if not self.add_watch(directory):
+                continue
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                self._dispatch(FsEvent("created", Path(entry.path), is_dir))
+                if is_dir:
+                    stack.append(Path(entry.path))
+
+    def _parse(self, data: bytes) -> List[FsEvent]:
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append(FsEvent("overflow", Path("/")))
+                continue
+            with self._lock:
+                base = self._wd_to_path.get(wd)
+                if mask & IN_IGNORED and base is not None:
+                    self._wd_to_path.pop(wd, None)
+                    self._path_to_wd.pop(base, None)
+                    self._refs.pop(base, None)
+            if base is None or mask & IN_IGNORED:
+                continue
+
+            is_dir = bool(mask & IN_ISDIR)
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                events.append(FsEvent("deleted", base, True))
+                continue
+            path = base / os.fsdecode(name) if name else base
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                events.append(FsEvent("created", path, is_dir))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append(FsEvent("deleted", path, is_dir))
+            else:
+                events.append(FsEvent("modified", path, is_dir))
+        return events
+
+
+def create_watcher() -> Optional[InotifyWatcher]:
+    """Return an inotify watcher, or None where inotify is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return InotifyWatcher()
+    except (OSError, AttributeError):
+        return None
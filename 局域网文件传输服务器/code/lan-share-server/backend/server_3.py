@@ -2,8 +2,6 @@
 import os
 import sys
 import yaml
-import zipfile
-import io
 from pathlib import Path
 from typing import List
 from pydantic import BaseModel
@@ -60,6 +58,10 @@ async def download_batch(request: DownloadRequest):
     """
     接收一个包含文件和文件夹路径的列表，将它们全部打包成一个 zip 文件。
     """
+    # 打包模块只在第一次批量下载时加载，不拖慢启动
+    import io
+    import zipfile
+
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
         for item_path_str in request.paths:
@@ -100,21 +102,6 @@ async def read_index():
 # 修改：现在这个挂载点只负责处理 CSS, JS 等静态文件，因为 "/" 路径已经被上面的函数处理了。
 app.mount("/", StaticFiles(directory=frontend_path), name="static")
 
-
-
-
-
-
-class SinglePageApplication(StaticFiles):
-    async def get_response(self, path: str, scope):
-        try:
-            return await super().get_response(path, scope)
-        except HTTPException as ex:
-            if ex.status_code == 404:
-                return await super().get_response("index_3.html", scope)
-            raise ex
-app.mount("/", SinglePageApplication(directory=frontend_path, html=True), name="static")
-
 # --- 4. 启动 ---
 if __name__ == "__main__":
     import uvicorn
@@ -2,17 +2,38 @@
 
 import os
 import sys
-import yaml
-import zipfile
-import io
+
+# --profile-imports (or LANSHARE_PROFILE_IMPORTS=1) times every module loaded
+# during startup and prints the slowest ones once the server is ready. Unlike
+# python -X importtime this also works in the packaged exe.
+import_profiler = None
+if "--profile-imports" in sys.argv or os.environ.get("LANSHARE_PROFILE_IMPORTS"):
+    from lanshare.importprofile import ImportProfiler
+    import_profiler = ImportProfiler()
+    import_profiler.install()
+
+import asyncio
+import json
+import stat
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+
+from lanshare import (FAST_ALGORITHM, BandwidthMiddleware, BandwidthScheduler, BlockingPool,
+                      ChangeFeed, DirectoryLister, DirectorySizes, HashCache, LeaderLock,
+                      ListingQueryError, PrecompressedStaticFiles, SearchIndex, ServiceError,
+                      SmallFileCache, ThumbnailCache, TransferLog, TransferMiddleware,
+                      UploadManager, compressed_response,
+                      create_watcher, file_response, iter_manifest, make_name_filter, negotiate,
+                      resolve_shared_path)
+from lanshare.paths import internal_dir, to_rel_path
 
 # --- 1. PATH AND CONFIGURATION LOGIC FOR PACKAGING ---
 
@@ -32,15 +53,56 @@ BUNDLE_DIR = get_bundle_dir()
 EXE_DIR = get_exe_dir()
 
 DEFAULT_CONFIG = {
-    'server': {'host': '0.0.0.0', 'port': 8000},
-    'files': {'shared_directory': './shared_files'}
+    'server': {'host': '0.0.0.0', 'port': 8000, 'workers': 1},
+    'files': {'shared_directory': './shared_files'},
+    'upload': {'chunk_size_mb': 8},
+    'search': {'rescan_interval': 300},
+    'hash': {'enabled': True, 'max_mb_per_second': 64},
+    'thumbs': {'workers': 2, 'max_cache_mb': 512},
+    'sizes': {'workers': 4},
+    'archive': {'cache_mb': 4096, 'zstd_level': 3, 'zstd_threads': 0,
+                'max_batch_mb': 0, 'warn_batch_mb': 4096},
+    'io': {'threads': 16, 'archive_threads': 4},
+    'memory_cache': {'max_file_kb': 256, 'max_mb': 64},
+    'compression': {'json_min_kb': 4},
+    'bandwidth': {'total_mb_per_second': 0, 'client_mb_per_second': 0},
+    'transfers': {'history': 200},
+    'sync': {'source': '', 'remote_path': '', 'local_path': '', 'interval': 300, 'delete': False}
 }
 
-config_path = os.path.join(EXE_DIR, "config.yaml")
+def load_config(path):
+    """Parse the YAML config, or reuse the JSON copy saved next to it.
+
+    The copy (config.cache.json) is used while the YAML file keeps its size
+    and mtime, so most starts neither import nor run the YAML parser.
+    """
+    cache_path = os.path.splitext(path)[0] + ".cache.json"
+    st = os.stat(path)
+    stamp = [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["stamp"] == stamp:
+            return cached["config"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    import yaml
+    with open(path, "r", encoding="utf-8") as f:
+        parsed = yaml.safe_load(f)
+    try:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stamp": stamp, "config": parsed}, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass  # read-only folder or values JSON cannot hold: parse every time
+    return parsed
+
+# LANSHARE_CONFIG points at another config file (used by the tools in tools/).
+config_path = os.environ.get("LANSHARE_CONFIG") or os.path.join(EXE_DIR, "config.yaml")
 if os.path.isfile(config_path):
     print(f"Loading external config: {config_path}")
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
+    config = load_config(config_path)
 else:
     print("Using internal default configuration.")
     config = DEFAULT_CONFIG
@@ -55,60 +117,486 @@ if not SHARED_DIR.is_dir():
     print(f"Shared directory not found. Creating it at: {SHARED_DIR}")
     SHARED_DIR.mkdir(parents=True, exist_ok=True)
 
+# Worker processes share the port; only the one holding the leader lock walks
+# the tree, keeps the search index and hashes, the others follow its results.
+# Several workers need the app importable by name, which a PyInstaller exe
+# does not offer, so packaged builds always run a single worker.
+WORKERS = 1 if getattr(sys, 'frozen', False) else max(1, int(config.get("server", {}).get("workers", 1)))
+leader = LeaderLock(SHARED_DIR) if WORKERS > 1 else None
+
 # --- 2. FASTAPI APP AND API ROUTES ---
-app = FastAPI()
+# Background work starts shortly after the server, so the tree walks and the
+# hasher do not compete with the first requests for the CPU and the disk.
+BACKGROUND_DELAY = 1.0
+
+def start_background():
+    search_index.start(leader)
+    dir_sizes.start(leader)
+    if hash_cache is not None:
+        hash_cache.start(leader)
+    if mirror is not None:
+        mirror.start(leader)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    threading.Thread(target=frontend.warm, name="precompress", daemon=True).start()
+    asyncio.get_running_loop().call_later(BACKGROUND_DELAY, start_background)
+    if import_profiler is not None:
+        import_profiler.uninstall()
+        print(import_profiler.report())
+    yield
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+# Downloads share the outgoing link fairly between clients (0 = unlimited),
+# so one large transfer cannot starve everybody else on a small hotspot.
+# Each worker paces its own connections, so both limits are split between
+# the workers: a client whose connections land on different workers must
+# not get the per-client limit once per worker.
+bandwidth_config = config.get("bandwidth", {})
+bandwidth = BandwidthScheduler(bandwidth_config.get("total_mb_per_second", 0) * 1024 * 1024 / WORKERS,
+                               bandwidth_config.get("client_mb_per_second", 0) * 1024 * 1024 / WORKERS)
+app.add_middleware(BandwidthMiddleware, scheduler=bandwidth)
+
+# Every download, manifest and thumbnail response is counted (bytes, duration,
+# client) for /api/admin/transfers. Added after the bandwidth limiter, so it
+# wraps it and sees the bytes as they leave, after pacing.
+transfer_log = TransferLog(int(config.get("transfers", {}).get("history", 200)))
+app.add_middleware(TransferMiddleware, log=transfer_log)
+
+# Blocking filesystem work never runs on the event loop. Archive streams get
+# their own pool so large zips cannot starve listings of threads.
+io_config = config.get("io", {})
+fs_pool = BlockingPool(int(io_config.get("threads", 16)), "fs")
+archive_pool = BlockingPool(int(io_config.get("archive_threads", 4)), "archive")
+
+# Listings are served from memory; inotify (Linux) or directory mtime checks
+# tell us when a cached listing has to be rebuilt.
+watcher = create_watcher()
+
+# Content digests are computed by a throttled, low priority background thread
+# and kept in SHARED_DIR/.lanshare/hashes.sqlite3 across restarts.
+hash_config = config.get("hash", {})
+hash_cache = None
+if hash_config.get("enabled", True):
+    hash_cache = HashCache(SHARED_DIR, watcher,
+                           int(hash_config.get("max_mb_per_second", 64) * 1024 * 1024))
+
+# Recursive folder sizes are walked once in parallel, then follow inotify
+# events (or a periodic rescan), and show up in listings as size/file_count.
+dir_sizes = DirectorySizes(SHARED_DIR, watcher, int(config.get("sizes", {}).get("workers", 4)),
+                           config.get("search", {}).get("rescan_interval", 300),
+                           internal_dir(SHARED_DIR, "") / "sizes.sqlite3" if WORKERS > 1 else None)
+
+lister = DirectoryLister(SHARED_DIR, watcher, hash_cache=hash_cache, dir_sizes=dir_sizes)
+
+# Clients subscribe to the directories they have open and get batched
+# changes pushed over Server-Sent Events (inotify only).
+change_feed = ChangeFeed(SHARED_DIR, watcher) if watcher is not None else None
+
+# Uploads are staged under SHARED_DIR/.lanshare/uploads so the final rename
+# into the shared tree is atomic.
+upload_config = config.get("upload", {})
+uploads = UploadManager(SHARED_DIR, int(upload_config.get("chunk_size_mb", 8) * 1024 * 1024),
+                        int(upload_config.get("max_size_mb", 0) * 1024 * 1024))
+uploads.purge_stale()
+
+# Filename search is answered from memory; the index follows inotify events,
+# or is rebuilt every rescan_interval seconds where inotify is unavailable.
+search_index = SearchIndex(SHARED_DIR, watcher, config.get("search", {}).get("rescan_interval", 300),
+                           internal_dir(SHARED_DIR, "") / "search.sqlite3" if WORKERS > 1 else None)
+
+# Thumbnails are decoded by a small worker pool and kept in
+# SHARED_DIR/.lanshare/thumbs, keyed by the source file's identity.
+thumbs_config = config.get("thumbs", {})
+thumbnails = ThumbnailCache(SHARED_DIR, int(thumbs_config.get("workers", 2)),
+                            int(thumbs_config.get("max_cache_mb", 512) * 1024 * 1024))
+
+# Finished batch archives are kept in SHARED_DIR/.lanshare/archives so that
+# repeated downloads of the same, unchanged selection are plain file sends.
+# The archive writers (tarfile, zstandard) are loaded by the first batch
+# download rather than at startup.
+archive_config = config.get("archive", {})
+archive_cache = None
+
+def get_archive_cache():
+    global archive_cache
+    if archive_cache is None:
+        from lanshare import ArchiveCache
+        archive_cache = ArchiveCache(SHARED_DIR, int(archive_config.get("cache_mb", 4096) * 1024 * 1024))
+    return archive_cache
+
+# Batch requests above max_batch_mb are refused before anything is read (0 =
+# no limit); above warn_batch_mb the web page asks before downloading.
+MAX_BATCH_BYTES = int(archive_config.get("max_batch_mb", 0) * 1024 * 1024)
+WARN_BATCH_BYTES = int(archive_config.get("warn_batch_mb", 4096) * 1024 * 1024)
+
+# Small files that many devices fetch at once are served from memory.
+memory_cache_config = config.get("memory_cache", {})
+small_files = None
+if memory_cache_config.get("max_mb", 64) > 0:
+    small_files = SmallFileCache(int(memory_cache_config.get("max_file_kb", 256) * 1024),
+                                 int(memory_cache_config.get("max_mb", 64) * 1024 * 1024))
+
+# With sync.source set, a folder of this share is kept a copy of a folder on
+# another share server. Changed files are patched with rsync-style deltas, so
+# only the blocks that changed cross the network.
+sync_config = config.get("sync", {})
+mirror = None
+if sync_config.get("source"):
+    from lanshare import Mirror
+    mirror = Mirror(SHARED_DIR, sync_config["source"], sync_config.get("remote_path", ""),
+                    sync_config.get("local_path", ""), float(sync_config.get("interval", 300)),
+                    bool(sync_config.get("delete", False)), hash_cache)
+
+# JSON responses (listings, search) of at least json_min_kb are sent gzip or
+# Brotli compressed to clients that accept it.
+JSON_COMPRESS_MIN = int(config.get("compression", {}).get("json_min_kb", 4) * 1024)
+
+def json_response(request: Request, content) -> Response:
+    body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+    return compressed_response(request, body, min_size=JSON_COMPRESS_MIN)
+
+def shared_file(sub_path: str):
+    """(path, stat) of a regular file inside the share, or None. Blocking: run it in fs_pool."""
+    full_path = resolve_shared_path(SHARED_DIR, sub_path)
+    if full_path is None:
+        return None
+    try:
+        st = full_path.stat()
+    except OSError:
+        return None
+    return (full_path, st) if stat.S_ISREG(st.st_mode) else None
+
 class DownloadRequest(BaseModel):
     paths: List[str]
+    compression: Literal["deflate", "store"] = "deflate"
+    format: Literal["zip", "tar", "tar.zst"] = "zip"
+
+class UploadCreateRequest(BaseModel):
+    path: str
+    size: int
+    chunk_size: Optional[int] = None
+    overwrite: bool = False
+
+class UploadCompleteRequest(BaseModel):
+    sha256: Optional[str] = None
+
+@app.exception_handler(ServiceError)
+async def service_error_handler(request: Request, exc: ServiceError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
 @app.get("/api/files/{sub_path:path}", tags=["files"])
 @app.get("/api/files", tags=["files"])
-async def list_files(sub_path: str = ""):
+async def list_files(request: Request,
+                     sub_path: str = "",
+                     limit: Optional[int] = Query(None, ge=1, le=10000),
+                     cursor: Optional[str] = None,
+                     sort: str = "name",
+                     prefix: Optional[str] = None,
+                     glob: Optional[str] = None,
+                     format: str = Query("json", pattern="^(json|ndjson)$")):
+    """List a directory.
+
+    Without ``limit``/``cursor`` the whole (filtered) listing is returned as a
+    JSON array. With them a page ``{"items": [...], "next_cursor": ...}`` is
+    returned; pass ``next_cursor`` back to get the following page.
+    ``format=ndjson`` streams every matching entry, one JSON object per line.
+    """
+    current_path = await fs_pool.run(resolve_shared_path, SHARED_DIR, sub_path)
+    if current_path is None or not await fs_pool.run(current_path.is_dir):
+        raise HTTPException(status_code=403, detail="Access denied or directory not found")
+    name_filter = make_name_filter(prefix, glob)
     try:
-        current_path = SHARED_DIR.joinpath(sub_path).resolve()
-        if not current_path.exists() or not current_path.is_dir() or SHARED_DIR not in current_path.parents and current_path != SHARED_DIR:
-            raise HTTPException(status_code=403, detail="Access denied or directory not found")
-        items = []
-        for item_path in sorted(current_path.iterdir(), key=lambda p: (not p.is_dir(), p.name.lower())):
-            items.append({
-                "name": item_path.name,
-                "path": str(item_path.relative_to(SHARED_DIR)).replace("\\", "/"),
-                "is_directory": item_path.is_dir()
-            })
-        return items
-    except Exception as e:
+        if format == "ndjson":
+            batches = lister.iter_ndjson(current_path, sort, name_filter, batch=limit or 500)
+            return StreamingResponse(fs_pool.iterate(batches), media_type="application/x-ndjson")
+        if limit is None and cursor is None:
+            if sort == "name" and name_filter is None:
+                body, encoding = await fs_pool.run(lister.encoded_listing, current_path,
+                                                   negotiate(request.headers.get("accept-encoding")),
+                                                   JSON_COMPRESS_MIN)
+                headers = {"Vary": "Accept-Encoding"}
+                if encoding is not None:
+                    headers["Content-Encoding"] = encoding
+                return Response(content=body, media_type="application/json", headers=headers)
+            items, _ = await fs_pool.run(lister.page, current_path, sort, limit=sys.maxsize,
+                                         name_filter=name_filter)
+            return await fs_pool.run(json_response, request, items)
+        items, next_cursor = await fs_pool.run(lister.page, current_path, sort, cursor,
+                                               limit or 500, name_filter)
+        return await fs_pool.run(json_response, request, {"items": items, "next_cursor": next_cursor})
+    except ListingQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
         print(f"Error in list_files: {e}")
         raise HTTPException(status_code=500, detail=f"Server error: {e}")
 
+@app.get("/api/events", tags=["files"])
+async def directory_events(path: List[str] = Query([""], max_length=16)):
+    """Server-Sent Events stream of changes in the directories ``path``.
+
+    Each ``changes`` event carries ``{"dir", "changes": [...]}`` with one
+    item per added, removed or modified entry, or ``{"dir", "reset": true}``
+    when the client should list the directory again.
+    """
+    if change_feed is None:
+        raise HTTPException(status_code=503, detail="Change notifications need inotify (Linux)")
+    rel_dirs = []
+    for sub_path in path:
+        full_path = await fs_pool.run(resolve_shared_path, SHARED_DIR, sub_path)
+        if full_path is None or not await fs_pool.run(full_path.is_dir):
+            raise HTTPException(status_code=403, detail="Access denied or directory not found")
+        rel_dirs.append(to_rel_path(SHARED_DIR, full_path))
+    return StreamingResponse(change_feed.stream(rel_dirs), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/search", tags=["files"])
+async def search(request: Request, q: str = Query(..., min_length=1),
+                 limit: int = Query(100, ge=1, le=1000)):
+    """Find files and folders whose relative path contains every term of ``q``."""
+    results = await run_in_threadpool(search_index.search, q, limit)
+    return await fs_pool.run(json_response, request, {
+        "query": q, "results": results, "indexing": not search_index.ready,
+        "indexed": len(search_index)})
+
 @app.post("/api/download/batch", tags=["download"])
-async def download_batch(request: DownloadRequest):
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-        for item_path_str in request.paths:
-            full_path = SHARED_DIR.joinpath(item_path_str).resolve()
-            if SHARED_DIR not in full_path.parents and full_path != SHARED_DIR:
-                continue
-            if full_path.is_file():
-                archive_path = full_path.relative_to(SHARED_DIR.parent)
-                zf.write(full_path, archive_path)
-            elif full_path.is_dir():
-                for root, _, files in os.walk(full_path):
-                    for file in files:
-                        file_abs_path = Path(root) / file
-                        archive_path = file_abs_path.relative_to(SHARED_DIR.parent)
-                        zf.write(file_abs_path, archive_path)
-    zip_buffer.seek(0)
-    return StreamingResponse(zip_buffer, media_type="application/zip", headers={"Content-Disposition": f"attachment; filename=\"shared_files.zip\""})
+async def download_batch(body: DownloadRequest, request: Request):
+    """Archive the selected files and folders.
+
+    ``format`` is ``zip`` (``compression: "store"`` skips compression),
+    ``tar`` or ``tar.zst``. Stored zips and plain tars carry an exact
+    Content-Length even while the archive is still being built.
+    """
+    from lanshare import (ARCHIVE_FORMATS, ZSTD_AVAILABLE, collect_entries, stored_zip_length,
+                          stream_tar, stream_tar_zst, stream_zip, tar_length)
+    if body.format == "tar.zst" and not ZSTD_AVAILABLE:
+        raise HTTPException(status_code=400, detail="tar.zst needs the zstandard module on the server")
+    if MAX_BATCH_BYTES:
+        size, _, _ = await fs_pool.run(dir_sizes.estimate, body.paths)
+        if size > MAX_BATCH_BYTES:
+            raise HTTPException(status_code=413, detail=(
+                f"Selection is {size / 2 ** 20:.0f} MB, the limit is {MAX_BATCH_BYTES / 2 ** 20:.0f} MB"))
+    media_type, suffix = ARCHIVE_FORMATS[body.format]
+    filename = "shared_files" + suffix
+    entries = await fs_pool.run(collect_entries, SHARED_DIR, body.paths)
+    headers = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+    if body.format == "tar":
+        # Nothing to compute, so reading the files again is as cheap as
+        # reading a cached copy; plain tars are not cached.
+        headers["Content-Length"] = str(tar_length(entries))
+        return StreamingResponse(archive_pool.iterate(stream_tar(entries)), media_type=media_type,
+                                 headers=headers)
+
+    archives = get_archive_cache()
+    key = archives.key(entries, body.compression if body.format == "zip" else body.format)
+    cached = await fs_pool.run(archives.lookup, key, body.format)
+    if cached is not None:
+        return await fs_pool.run(file_response, request, cached, filename=filename,
+                                 media_type=media_type)
+    if body.format == "tar.zst":
+        pieces = stream_tar_zst(entries, int(archive_config.get("zstd_level", 3)),
+                                int(archive_config.get("zstd_threads", 0)))
+    else:
+        pieces = stream_zip(entries, body.compression)
+    if sum(entry.size for entry in entries) <= archives.max_bytes:
+        pieces = archives.fill(key, pieces, body.format)
+    if body.format == "zip" and body.compression == "store":
+        headers["Content-Length"] = str(stored_zip_length(entries))
+    return StreamingResponse(archive_pool.iterate(pieces), media_type=media_type, headers=headers)
+
+@app.post("/api/download/batch/estimate", tags=["download"])
+async def estimate_batch(body: DownloadRequest):
+    """Size and file count of a batch selection, from the folder totals.
+
+    ``complete`` is false while folder totals are still being computed.
+    """
+    size, files, complete = await fs_pool.run(dir_sizes.estimate, body.paths)
+    return {"size": size, "files": files, "complete": complete,
+            "warn": bool(WARN_BATCH_BYTES) and size > WARN_BATCH_BYTES,
+            "allowed": not MAX_BATCH_BYTES or size <= MAX_BATCH_BYTES}
+
+@app.api_route("/api/download/file/{file_path:path}", methods=["GET", "HEAD"], tags=["download"])
+async def download_file(file_path: str, request: Request):
+    found = await fs_pool.run(shared_file, file_path)
+    if found is None:
+        raise HTTPException(status_code=403, detail="Access denied or file not found")
+    full_path, st = found
+    if small_files is not None and small_files.accepts(st):
+        cached = small_files.get(full_path, st) or await fs_pool.run(small_files.load, full_path, st)
+        if cached is not None:
+            return file_response(request, full_path, etag=cached.etag, content=cached.data, st=st)
+    digests = (await fs_pool.run(hash_cache.get, to_rel_path(SHARED_DIR, full_path), st)
+               if hash_cache else None)
+    if digests is None:
+        return file_response(request, full_path, st=st)
+    # A content hash makes a strong ETag that survives touch/copy.
+    return file_response(request, full_path, etag=f'"{digests[1]}"', st=st)
+
+@app.post("/api/download/delta/{file_path:path}", tags=["download"])
+async def download_delta(file_path: str, request: Request, block_size: int = Query(...),
+                         basis_size: int = Query(..., ge=0)):
+    """The changes to a file relative to the caller's old copy (rsync style).
+
+    The body is the block signature of the old copy; lanshare/sync.py
+    describes the formats. Used by servers that mirror this one.
+    """
+    from lanshare.sync import MAX_SIGNATURE_BYTES, open_delta
+    found = await fs_pool.run(shared_file, file_path)
+    if found is None:
+        raise HTTPException(status_code=403, detail="Access denied or file not found")
+    full_path = found[0]
+    if int(request.headers.get("content-length", 0)) > MAX_SIGNATURE_BYTES:
+        raise HTTPException(status_code=413, detail="Signature too large")
+    # Chunked bodies carry no Content-Length: count while reading.
+    signature = bytearray()
+    async for piece in request.stream():
+        signature += piece
+        if len(signature) > MAX_SIGNATURE_BYTES:
+            raise HTTPException(status_code=413, detail="Signature too large")
+    signature = bytes(signature)
+    st, pieces = await fs_pool.run(open_delta, full_path, signature, block_size, basis_size)
+    return StreamingResponse(archive_pool.iterate(pieces), media_type="application/octet-stream",
+                             headers={"X-Size": str(st.st_size), "X-Mtime-Ns": str(st.st_mtime_ns)})
+
+@app.get("/api/manifest/{sub_path:path}", tags=["download"])
+@app.get("/api/manifest", tags=["download"])
+async def manifest(sub_path: str = ""):
+    """Every file below a folder (or a single file) as NDJSON.
+
+    Lines carry the file's SHA-256 when it is known; used by clients that
+    download a whole tree, such as tools/parallel_fetch.py.
+    """
+    full_path = await fs_pool.run(resolve_shared_path, SHARED_DIR, sub_path)
+    if full_path is None or not await fs_pool.run(full_path.exists):
+        raise HTTPException(status_code=403, detail="Access denied or path not found")
+    return StreamingResponse(fs_pool.iterate(iter_manifest(SHARED_DIR, full_path, hash_cache)),
+                             media_type="application/x-ndjson")
+
+@app.get("/api/hash/{file_path:path}", tags=["download"])
+async def file_hash(file_path: str):
+    """Digests of a file; 202 while it is still waiting for the hasher."""
+    found = await fs_pool.run(shared_file, file_path)
+    if found is None:
+        raise HTTPException(status_code=403, detail="Access denied or file not found")
+    if hash_cache is None:
+        raise HTTPException(status_code=404, detail="Hashing is disabled")
+    full_path, st = found
+    rel_path = to_rel_path(SHARED_DIR, full_path)
+    digests = await fs_pool.run(hash_cache.get, rel_path, st)
+    if digests is None:
+        hash_cache.request(rel_path)
+        return JSONResponse(status_code=202, content={"path": rel_path, "pending": True})
+    return {"path": rel_path, "size": st.st_size, "sha256": digests[1],
+            "fast_hash": digests[0], "fast_algorithm": FAST_ALGORITHM}
+
+@app.get("/api/thumb/{file_path:path}", tags=["download"])
+async def thumbnail(file_path: str, request: Request, size: int = Query(256, ge=16, le=1024),
+                    v: Optional[str] = None):
+    """JPEG preview of an image (or a video's first frame).
+
+    Clients that pass the file's mtime as ``v`` get a URL that changes with
+    the file, so the response may be cached forever.
+    """
+    found = await fs_pool.run(shared_file, file_path)
+    if found is None:
+        raise HTTPException(status_code=403, detail="Access denied or file not found")
+    full_path, st = found
+    thumb, exists = await fs_pool.run(thumbnails.lookup, full_path, size, st)
+    if not exists:
+        await thumbnails.generate(full_path, thumb, size)
+    response = await fs_pool.run(file_response, request, thumb, filename=full_path.stem + ".jpg",
+                                 media_type="image/jpeg", inline=True)
+    response.headers["cache-control"] = ("public, max-age=31536000, immutable" if v
+                                         else "public, max-age=300")
+    return response
+
+@app.get("/api/admin/bandwidth", tags=["admin"])
+async def bandwidth_status():
+    """Configured limits (bytes/s, null = unlimited) and per-client download rates."""
+    return {"total_limit": bandwidth.total_rate, "client_limit": bandwidth.client_rate,
+            "clients": bandwidth.stats()}
+
+@app.get("/api/admin/transfers", tags=["admin"])
+async def transfers_status():
+    """Active and recent transfers with progress and rate, plus totals and histograms."""
+    return transfer_log.stats()
+
+@app.get("/api/admin/sync", tags=["admin"])
+async def sync_status():
+    """Configuration and outcome of the last pass of the folder sync."""
+    if mirror is None:
+        return {"enabled": False}
+    return {"enabled": True, **mirror.stats()}
+
+@app.post("/api/admin/sync", tags=["admin"])
+async def sync_now():
+    """Start a sync pass now instead of waiting for the interval."""
+    if mirror is None:
+        raise HTTPException(status_code=404, detail="Sync is not configured")
+    if not mirror.trigger():
+        raise HTTPException(status_code=409, detail="Another worker process runs the sync")
+    return {"enabled": True, **mirror.stats()}
+
+@app.get("/api/admin/cache", tags=["admin"])
+async def cache_status():
+    """Hit rate and bytes served from memory by the small file cache."""
+    if small_files is None:
+        return {"enabled": False}
+    return {"enabled": True, **small_files.stats()}
+
+@app.post("/api/upload", tags=["upload"])
+async def create_upload(request: UploadCreateRequest):
+    """Declare an upload; the response tells the client how to split the file."""
+    session = await fs_pool.run(uploads.create, request.path, request.size,
+                                request.chunk_size, request.overwrite)
+    return {"upload_id": session.upload_id, "path": session.path,
+            "chunk_size": session.chunk_size, "chunk_count": session.chunk_count}
+
+@app.get("/api/upload/{upload_id}", tags=["upload"])
+async def upload_status(upload_id: str):
+    """Report which chunks are already stored, so a client can resume."""
+    session = await fs_pool.run(uploads.get, upload_id)
+    received = await fs_pool.run(uploads.received_chunks, session)
+    return {"upload_id": upload_id, "path": session.path, "size": session.size,
+            "chunk_size": session.chunk_size, "chunk_count": session.chunk_count,
+            "received": received}
+
+@app.put("/api/upload/{upload_id}/chunks/{index}", tags=["upload"])
+async def upload_chunk(upload_id: str, index: int, request: Request,
+                       x_chunk_sha256: str = Header(...)):
+    """Store one chunk; chunks may arrive in any order and in parallel."""
+    session = await fs_pool.run(uploads.get, upload_id)
+    await uploads.write_chunk(session, index, request.stream(), x_chunk_sha256)
+    return {"index": index, "stored": True}
+
+@app.post("/api/upload/{upload_id}/complete", tags=["upload"])
+async def complete_upload(upload_id: str, request: Optional[UploadCompleteRequest] = None):
+    session = await fs_pool.run(uploads.get, upload_id)
+    target = await fs_pool.run(uploads.complete, session, request.sha256 if request else None)
+    return {"path": session.path, "size": (await fs_pool.run(target.stat)).st_size}
+
+@app.delete("/api/upload/{upload_id}", tags=["upload"])
+async def abort_upload(upload_id: str):
+    await fs_pool.run(uploads.abort, await fs_pool.run(uploads.get, upload_id))
+    return {"upload_id": upload_id, "aborted": True}
 
 # --- 3. SERVE FRONTEND ---
 frontend_path = os.path.join(BUNDLE_DIR, "frontend")
+# Text assets are compressed (gzip, and Brotli when installed) once at startup
+# and sent by Accept-Encoding.
+frontend = PrecompressedStaticFiles(directory=frontend_path)
 
 @app.get("/", include_in_schema=False)
-async def read_index():
-    return FileResponse(os.path.join(frontend_path, 'index_3.html'))
+async def read_index(request: Request):
+    def locate():
+        index_path = os.path.realpath(os.path.join(frontend_path, 'index_3.html'))
+        return index_path, os.stat(index_path)
+    index_path, st = await fs_pool.run(locate)
+    return frontend.file_response(index_path, st, request.scope)
 
-app.mount("/", StaticFiles(directory=frontend_path), name="static")
+app.mount("/", frontend, name="static")
 
 # --- 4. APP LAUNCHER (WITH DEFINITIVE --noconsole FIX) ---
 if __name__ == "__main__":
@@ -147,4 +635,9 @@ if __name__ == "__main__":
     print(f"Sharing directory: {SHARED_DIR}")
     
     # Run Uvicorn with the appropriate log config
-    uvicorn.run(app, host=host, port=port, log_config=log_config)
\ No newline at end of file
+    if WORKERS > 1:
+        # Each worker process imports this module and builds its own app.
+        uvicorn.run("server_for_packaging:app", host=host, port=port, workers=WORKERS,
+                    log_config=log_config)
+    else:
+        uvicorn.run(app, host=host, port=port, log_config=log_config)
\ No newline at end of file
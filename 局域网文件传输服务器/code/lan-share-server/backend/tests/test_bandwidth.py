@@ -0,0 +1,61 @@
+"""Fair sharing in BandwidthScheduler: clients, not connections, get equal shares.
+
+    python -m pytest tests/test_bandwidth.py
+"""
+
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lanshare.bandwidth import BandwidthScheduler  # noqa: E402
+
+TOTAL_RATE = 4 * 1024 * 1024
+DURATION = 2.0
+
+
+async def _share(piece: int) -> dict:
+    """Bytes granted per second to a client on 4 connections and one on 1."""
+    scheduler = BandwidthScheduler(total_rate=TOTAL_RATE)
+    sent = {"many": 0, "one": 0}
+
+    async def stream(client: str) -> None:
+        scheduler.open(client)
+        try:
+            while True:
+                await scheduler.send(client, piece)
+                sent[client] += piece
+                await asyncio.sleep(0.001)  # the piece going out on the socket
+        finally:
+            scheduler.close(client)
+
+    tasks = [asyncio.ensure_future(stream(client)) for client in ["many"] * 4 + ["one"]]
+    await asyncio.sleep(DURATION)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {client: total / DURATION for client, total in sent.items()}
+
+
+class FairShareTest(unittest.TestCase):
+
+    def _assert_fair(self, piece: int) -> None:
+        rates = asyncio.run(_share(piece))
+        ratio = rates["one"] / rates["many"]
+        self.assertGreater(ratio, 0.7, f"{piece} byte pieces: 4 connections got "
+                                       f"{rates['many'] / 1024:.0f} KB/s, 1 connection "
+                                       f"{rates['one'] / 1024:.0f} KB/s")
+        self.assertLess(sum(rates.values()), TOTAL_RATE * 1.2)
+
+    def test_small_pieces(self):
+        # Deflate zip output and cached small files come in 64 KB pieces.
+        self._assert_fair(64 * 1024)
+
+    def test_pieces_larger_than_quantum(self):
+        self._assert_fair(1024 * 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
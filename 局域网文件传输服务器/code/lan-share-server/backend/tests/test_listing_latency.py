@@ -0,0 +1,112 @@
+"""Listing latency while a multi-GB archive is being streamed.
+
+Starts server_for_packaging.py on a generated tree holding folders of small
+files and a 4 GB sparse file, streams that file as a tar through
+/api/download/batch and, while the archive is flowing, times /api/files
+requests from another connection. Blocking filesystem work in the archive
+stream must not hold up the event loop or the listing threads, so those
+requests are expected to stay fast:
+
+    python -m pytest tests/test_listing_latency.py
+"""
+
+import http.client
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tools"))
+
+from loadtest import _free_port, start_server  # noqa: E402
+
+ARCHIVE_BYTES = 4 * 1024 ** 3
+LISTING_SAMPLES = 200
+# Pass thresholds for listing requests made during the stream.
+MAX_MEDIAN_MS = 50
+MAX_P95_MS = 250
+
+
+def _generate(share: Path) -> None:
+    for folder in range(20):
+        directory = share / "docs" / f"folder_{folder:02d}"
+        directory.mkdir(parents=True)
+        for index in range(100):
+            (directory / f"note_{index:03d}.txt").write_bytes(b"x" * (index * 10))
+    (share / "big").mkdir()
+    with open(share / "big" / "disk.img", "wb") as fh:
+        fh.truncate(ARCHIVE_BYTES)  # sparse: costs no disk space
+
+
+class ListingLatencyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory(prefix="lanshare-latency-")
+        share = Path(cls.workdir.name) / "share"
+        _generate(share)
+        cls.port = _free_port()
+        cls.server = start_server(share, cls.port, 1, Path(cls.workdir.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait(timeout=10)
+        cls.workdir.cleanup()
+
+    def _stream_archive(self, started: threading.Event, stop: threading.Event, received: list):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        body = json.dumps({"paths": ["big"], "format": "tar"})
+        conn.request("POST", "/api/download/batch", body=body,
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        total = 0
+        while not stop.is_set():
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+            started.set()
+        received.append(total)
+        conn.close()
+
+    def test_listings_stay_fast_during_archive_stream(self):
+        started, stop, received = threading.Event(), threading.Event(), []
+        streamer = threading.Thread(target=self._stream_archive, args=(started, stop, received))
+        streamer.start()
+        try:
+            self.assertTrue(started.wait(30), "archive stream did not start")
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            latencies = []
+            for sample in range(LISTING_SAMPLES):
+                path = f"/api/files/docs/folder_{sample % 20:02d}"
+                begin = time.perf_counter()
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                latencies.append((time.perf_counter() - begin) * 1000)
+                self.assertEqual(response.status, 200)
+            conn.close()
+            still_streaming = streamer.is_alive()
+        finally:
+            stop.set()
+            streamer.join()
+
+        self.assertTrue(still_streaming, "the archive finished before the listings; "
+                                         "the test measured nothing")
+        latencies.sort()
+        median = statistics.median(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        summary = (f"listing during archive stream: median {median:.1f} ms, p95 {p95:.1f} ms, "
+                   f"max {latencies[-1]:.1f} ms, archive bytes read {received[0] / 2 ** 20:.0f} MB")
+        self.assertLess(median, MAX_MEDIAN_MS, summary)
+        self.assertLess(p95, MAX_P95_MS, summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Mirror against a live source server: one request per changed file.
+
+Starts server_for_packaging.py as the source, mirrors its tree into a local
+directory with ``Mirror.run_once``, changes a few files on the source and
+syncs again, counting the HTTP requests the mirror sends for each path:
+
+    python -m pytest tests/test_sync.py
+"""
+
+import collections
+import http.client
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.parse import unquote, urlsplit
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+sys.path.insert(0, str(BACKEND / "tools"))
+
+from lanshare.sync import Mirror  # noqa: E402
+from loadtest import _free_port, start_server  # noqa: E402
+
+FILES = 4
+FILE_BYTES = 256 * 1024
+
+
+class MirrorRequestTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.TemporaryDirectory(prefix="lanshare-sync-")
+        cls.source = Path(cls.workdir.name) / "source"
+        cls.rng = random.Random(1)
+        (cls.source / "data").mkdir(parents=True)
+        for index in range(FILES):
+            (cls.source / "data" / f"f{index}.bin").write_bytes(cls.rng.randbytes(FILE_BYTES))
+        cls.port = _free_port()
+        cls.server = start_server(cls.source, cls.port, 1, Path(cls.workdir.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait(timeout=10)
+        cls.workdir.cleanup()
+
+    def _run(self, mirror: Mirror):
+        """Run one pass; returns it and the number of requests sent per (method, path)."""
+        sent = collections.Counter()
+        original = http.client.HTTPConnection.request
+
+        def counting(conn, method, url, *args, **kwargs):
+            sent[method, unquote(urlsplit(url).path)] += 1
+            return original(conn, method, url, *args, **kwargs)
+
+        with mock.patch.object(http.client.HTTPConnection, "request", counting):
+            run = mirror.run_once()
+        self.assertEqual(run["errors"], [])
+        return run, sent
+
+    def test_each_changed_file_is_requested_once(self):
+        local = Path(self.workdir.name) / "mirror"
+        local.mkdir()
+        mirror = Mirror(local, f"http://127.0.0.1:{self.port}")
+
+        run, sent = self._run(mirror)
+        self.assertEqual(run["downloaded"], FILES)
+        self.assertTrue(all(count == 1 for count in sent.values()), sent)
+
+        for index in range(FILES):
+            path = self.source / "data" / f"f{index}.bin"
+            data = bytearray(path.read_bytes())
+            data[FILE_BYTES // 2:FILE_BYTES // 2 + 8] = b"changed!"
+            path.write_bytes(bytes(data))
+
+        run, sent = self._run(mirror)
+        self.assertEqual(run["patched"], FILES)
+        deltas = {path: count for (method, path), count in sent.items() if method == "POST"}
+        self.assertEqual(deltas, {f"/api/download/delta/data/f{index}.bin": 1
+                                  for index in range(FILES)})
+        for index in range(FILES):
+            self.assertEqual((local / "data" / f"f{index}.bin").read_bytes(),
+                             (self.source / "data" / f"f{index}.bin").read_bytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Benchmark of the batch download archive formats.
+
+Builds each archive format the server offers from the same files and
+reports wall time, CPU time (all threads, so multi-threaded zstd counts in
+full), output size and throughput as JSON:
+
+    python tools/archive_bench.py --source D:/photos --output bench.json
+
+Without ``--source`` the synthetic tree of tools/loadtest.py is used. The
+files are read once before the first run so every format sees a warm page
+cache; the numbers compare CPU cost, not disk speed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lanshare.archive import (ZSTD_AVAILABLE, collect_entries, stream_tar, stream_tar_zst,
+                              stream_zip)
+from loadtest import generate_tree
+
+
+def _warm_up(entries) -> None:
+    for entry in entries:
+        with open(entry.path, "rb") as fh:
+            while fh.read(1024 * 1024):
+                pass
+
+
+def measure(name, pieces_factory, input_bytes: int):
+    wall, cpu = time.perf_counter(), time.process_time()
+    size = 0
+    for piece in pieces_factory():
+        size += len(piece)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {"format": name, "wall_s": round(wall, 3), "cpu_s": round(cpu, 3),
+            "output_mb": round(size / 2 ** 20, 1), "ratio": round(size / max(1, input_bytes), 3),
+            "input_mb_per_s": round(input_bytes / 2 ** 20 / wall, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source", type=Path, help="directory to archive")
+    parser.add_argument("--workdir", type=Path,
+                        default=Path(tempfile.gettempdir()) / "lanshare-loadtest",
+                        help="where the synthetic tree lives when --source is not given")
+    parser.add_argument("--zstd-level", type=int, default=3)
+    parser.add_argument("--zstd-threads", type=int, default=0, help="0 = one per CPU")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    if args.source is None:
+        args.source = args.workdir / "share"
+        generate_tree(args.source, 5000, 2, 512 * 1024 * 1024, 8)
+    source = args.source.resolve()
+    entries = collect_entries(source.parent, [source.name])
+    input_bytes = sum(entry.size for entry in entries)
+    _warm_up(entries)
+
+    runs = [
+        ("zip (deflate)", lambda: stream_zip(entries, "deflate")),
+        ("zip (store)", lambda: stream_zip(entries, "store")),
+        ("tar", lambda: stream_tar(entries)),
+    ]
+    if ZSTD_AVAILABLE:
+        runs.append((f"tar.zst (level {args.zstd_level})",
+                     lambda: stream_tar_zst(entries, args.zstd_level, args.zstd_threads)))
+    else:
+        print("zstandard is not installed; skipping tar.zst", file=sys.stderr)
+
+    report = {
+        "source": str(source),
+        "files": len(entries),
+        "input_mb": round(input_bytes / 2 ** 20, 1),
+        "cpus": os.cpu_count(),
+        "results": [measure(name, factory, input_bytes) for name, factory in runs],
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Load test for the share server.
+
+Generates a synthetic shared tree (many small files in deep folders plus a
+few huge files), starts server_for_packaging.py on it and drives concurrent
+listing, single-file and batch-zip clients for a fixed time. Prints (or
+writes) a JSON report with request rates, throughput, time to first byte and
+the server's RSS/CPU, so runs on different boards or commits can be compared.
+
+Runs offline on one machine with the standard library only:
+
+    python tools/loadtest.py --duration 30 --output before.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+import yaml
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+READ_SIZE = 1024 * 1024
+
+
+def generate_tree(root: Path, small_files: int, huge_files: int, huge_size: int,
+                  depth: int, seed: int = 1) -> Dict[str, object]:
+    """Create the synthetic tree below ``root`` (reused if it already matches)."""
+    spec = {"small_files": small_files, "huge_files": huge_files,
+            "huge_size": huge_size, "depth": depth, "seed": seed}
+    marker = root.parent / (root.name + ".json")
+    if root.is_dir() and marker.is_file() and json.loads(marker.read_text()) == spec:
+        return spec
+
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    folders = [root]
+    for index in range(max(1, small_files // 50)):
+        # Random walk downwards so some folders end up `depth` levels deep.
+        parent = rng.choice(folders)
+        if len(parent.relative_to(root).parts) < depth:
+            folder = parent / f"dir_{index:04d}"
+            folder.mkdir(exist_ok=True)
+            folders.append(folder)
+    for index in range(small_files):
+        size = int(rng.paretovariate(1.2) * 1024) % (256 * 1024)
+        (rng.choice(folders) / f"file_{index:06d}.dat").write_bytes(rng.randbytes(size))
+
+    huge_dir = root / "huge"
+    huge_dir.mkdir(exist_ok=True)
+    block = rng.randbytes(READ_SIZE)
+    for index in range(huge_files):
+        with open(huge_dir / f"huge_{index}.bin", "wb") as fh:
+            for _ in range(huge_size // READ_SIZE):
+                fh.write(block)
+    marker.write_text(json.dumps(spec))
+    return spec
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(share: Path, port: int, workers: int, workdir: Path,
+                 extra_config: Optional[Dict[str, object]] = None) -> subprocess.Popen:
+    config = {"server": {"host": "127.0.0.1", "port": port, "workers": workers},
+              "files": {"shared_directory": str(share)}, **(extra_config or {})}
+    config_path = workdir / "loadtest_config.yaml"
+    config_path.write_text(yaml.safe_dump(config), encoding="utf-8")
+    env = dict(os.environ, LANSHARE_CONFIG=str(config_path))
+    process = subprocess.Popen([sys.executable, "server_for_packaging.py"], cwd=BACKEND_DIR,
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/files")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("server did not start within 60 s")
+
+
+def _process_tree(pid: int) -> List[int]:
+    """``pid`` and all its descendants (Linux /proc)."""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as fh:
+                    ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+class ResourceSampler(threading.Thread):
+    """Samples RSS and CPU of the server process tree twice a second."""
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.rss: List[float] = []
+        self.cpu: List[float] = []
+        self.supported = os.path.isdir("/proc/self")
+        self._finished = threading.Event()
+
+    def _totals(self):
+        rss = ticks = 0
+        for pid in _process_tree(self.pid):
+            try:
+                with open(f"/proc/{pid}/stat") as fh:
+                    fields = fh.read().rsplit(")", 1)[1].split()
+                ticks += int(fields[11]) + int(fields[12])
+                rss += int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+            except (OSError, IndexError, ValueError):
+                continue
+        return rss, ticks / os.sysconf("SC_CLK_TCK")
+
+    def run(self) -> None:
+        if not self.supported:
+            return
+        _, last_cpu = self._totals()
+        last = time.monotonic()
+        while not self._finished.wait(0.5):
+            rss, cpu = self._totals()
+            now = time.monotonic()
+            self.rss.append(rss / 2 ** 20)
+            self.cpu.append(100 * (cpu - last_cpu) / (now - last))
+            last, last_cpu = now, cpu
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        self._finished.set()
+        self.join()
+        if not self.rss:
+            return {"rss_mb_max": None, "rss_mb_mean": None, "cpu_percent_mean": None,
+                    "cpu_percent_max": None}
+        return {"rss_mb_max": round(max(self.rss), 1),
+                "rss_mb_mean": round(statistics.mean(self.rss), 1),
+                "cpu_percent_mean": round(statistics.mean(self.cpu), 1),
+                "cpu_percent_max": round(max(self.cpu), 1)}
+
+
+class ClientStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttfb: List[float] = []
+        self.latency: List[float] = []
+        self.bytes = 0
+        self.errors = 0
+
+    def record(self, ttfb: float, latency: float, size: int) -> None:
+        with self.lock:
+            self.ttfb.append(ttfb)
+            self.latency.append(latency)
+            self.bytes += size
+
+    def summary(self, duration: float) -> Dict[str, object]:
+        def percentiles(values: List[float]) -> Dict[str, float]:
+            if not values:
+                return {}
+            ordered = sorted(values)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return {"p50": round(pick(0.5) * 1000, 2), "p90": round(pick(0.9) * 1000, 2),
+                    "p99": round(pick(0.99) * 1000, 2), "max": round(ordered[-1] * 1000, 2)}
+        return {"requests": len(self.latency), "errors": self.errors,
+                "requests_per_s": round(len(self.latency) / duration, 2),
+                "throughput_mb_s": round(self.bytes / duration / 2 ** 20, 2),
+                "ttfb_ms": percentiles(self.ttfb), "latency_ms": percentiles(self.latency)}
+
+
+def _fetch(port: int, method: str, path: str, body: Optional[bytes] = None):
+    """One request on a fresh connection; returns (ttfb, latency, bytes)."""
+    headers = {"Content-Type": "application/json"} if body else {}
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        first = response.read(1)
+        ttfb = time.perf_counter() - started
+        size = len(first)
+        while True:
+            chunk = response.read(READ_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+        if response.status >= 400:
+            raise OSError(f"HTTP {response.status}")
+        return ttfb, time.perf_counter() - started, size
+    finally:
+        conn.close()
+
+
+def run_clients(port: int, share: Path, duration: float, listing: int, files: int,
+                zips: int) -> Dict[str, object]:
+    folders, small, huge = [], [], []
+    for directory, _, names in os.walk(share):
+        rel_dir = Path(directory).relative_to(share).as_posix()
+        if rel_dir.startswith(".lanshare"):
+            continue
+        folders.append("" if rel_dir == "." else rel_dir)
+        for name in names:
+            rel_path = name if rel_dir == "." else f"{rel_dir}/{name}"
+            (huge if rel_dir == "huge" else small).append(rel_path)
+
+    stats = {"listing": ClientStats(), "file": ClientStats(), "zip": ClientStats()}
+    deadline = time.monotonic() + duration
+
+    def listing_client(rng: random.Random) -> Iterator[tuple]:
+        while time.monotonic() < deadline:
+            yield "GET", "/api/files/" + quote(rng.choice(folders)), None
+
+    def file_client(rng: random.Random) -> Iterator[tuple]:
+        while time.monotonic() < deadline:
+            # Every fifth request is a huge file, the rest small ones.
+            pool = huge if huge and rng.random() < 0.2 else small
+            yield "GET", "/api/download/file/" + quote(rng.choice(pool)), None
+
+    def zip_client(rng: random.Random) -> Iterator[tuple]:
+        while time.monotonic() < deadline:
+            selection = rng.sample(folders, min(len(folders), 3))
+            yield "POST", "/api/download/batch", json.dumps({"paths": selection}).encode()
+
+    def worker(kind: str, requests, seed: int) -> None:
+        for method, path, body in requests(random.Random(seed)):
+            try:
+                stats[kind].record(*_fetch(port, method, path, body))
+            except OSError:
+                with stats[kind].lock:
+                    stats[kind].errors += 1
+
+    threads = []
+    for kind, requests, count in (("listing", listing_client, listing),
+                                  ("file", file_client, files), ("zip", zip_client, zips)):
+        for index in range(count):
+            threads.append(threading.Thread(target=worker, args=(kind, requests, index),
+                                            daemon=True))
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return {kind: stat.summary(elapsed) for kind, stat in stats.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workdir", type=Path,
+                        default=Path(tempfile.gettempdir()) / "lanshare-loadtest",
+                        help="where the synthetic tree is generated (reused between runs)")
+    parser.add_argument("--small-files", type=int, default=5000)
+    parser.add_argument("--huge-files", type=int, default=2)
+    parser.add_argument("--huge-size-mb", type=int, default=512)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--listing-clients", type=int, default=8)
+    parser.add_argument("--file-clients", type=int, default=4)
+    parser.add_argument("--zip-clients", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    args.workdir.mkdir(parents=True, exist_ok=True)
+    share = args.workdir / "share"
+    print(f"Generating tree in {share} ...", file=sys.stderr)
+    tree = generate_tree(share, args.small_files, args.huge_files,
+                         args.huge_size_mb * 1024 * 1024, args.depth)
+
+    port = _free_port()
+    server = start_server(share, port, args.workers, args.workdir)
+    try:
+        sampler = ResourceSampler(server.pid)
+        sampler.start()
+        print(f"Running load for {args.duration:.0f} s ...", file=sys.stderr)
+        results = run_clients(port, share, args.duration, args.listing_clients,
+                              args.file_clients, args.zip_clients)
+        resources = sampler.stop()
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": {"platform": sys.platform, "cpus": os.cpu_count(),
+                 "python": sys.version.split()[0]},
+        "tree": tree,
+        "load": {"duration": args.duration, "workers": args.workers,
+                 "listing_clients": args.listing_clients, "file_clients": args.file_clients,
+                 "zip_clients": args.zip_clients},
+        "results": results,
+        "server": resources,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
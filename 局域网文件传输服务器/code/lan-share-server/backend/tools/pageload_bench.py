@@ -0,0 +1,138 @@
+"""Page load time of the web UI over an emulated slow link.
+
+Loads the page the way a browser does (index, then its scripts and styles
+over up to six connections, then the listing of a large folder) through a
+client-side model of a slow link: every request waits one round trip, and
+all response bytes share one bandwidth budget. Each run is done once
+without compression (``Accept-Encoding: identity``, what the server sent
+before it compressed anything) and once as a browser would ask. Prints a
+JSON report:
+
+    python tools/pageload_bench.py --kbps 2000 --rtt-ms 40 --files 3000
+    python tools/pageload_bench.py --url http://192.168.1.10:8005 --folder photos
+"""
+
+import argparse
+import concurrent.futures
+import http.client
+import json
+import re
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from loadtest import _free_port, start_server
+
+BROWSER_ENCODINGS = "gzip, deflate, br"
+CONNECTIONS = 6  # per host, as browsers do
+_ASSET = re.compile(r'<(?:script[^>]*\ssrc|link[^>]*\shref)="([^"#?]+)', re.IGNORECASE)
+
+
+class Link:
+    """Shared bandwidth of an emulated link; ``transfer`` blocks as long as the bytes take."""
+
+    def __init__(self, bits_per_second: float, rtt: float):
+        self.bytes_per_second = bits_per_second / 8
+        self.rtt = rtt
+        self._free_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def transfer(self, count: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._free_at = max(self._free_at, now) + count / self.bytes_per_second
+            wait = self._free_at - now
+        time.sleep(wait)
+
+
+def _get(host: str, port: int, path: str, encoding: str, link: Link) -> int:
+    """Fetch ``path`` through ``link``; returns the bytes that crossed it."""
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        time.sleep(link.rtt)
+        conn.request("GET", path, headers={"Accept-Encoding": encoding})
+        response = conn.getresponse()
+        size = 0
+        while True:
+            block = response.read(16 * 1024)
+            if not block:
+                break
+            link.transfer(len(block))
+            size += len(block)
+        if response.status != 200:
+            raise RuntimeError(f"GET {path}: HTTP {response.status}")
+        return size
+    finally:
+        conn.close()
+
+
+def load_page(host: str, port: int, folder: str, encoding: str, link: Link):
+    # The asset list is read outside the emulated link and not timed.
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    conn.request("GET", "/")
+    assets = list(dict.fromkeys(_ASSET.findall(conn.getresponse().read().decode("utf-8"))))
+    conn.close()
+    started = time.perf_counter()
+    transferred = _get(host, port, "/", encoding, link)
+    with concurrent.futures.ThreadPoolExecutor(CONNECTIONS) as pool:
+        transferred += sum(pool.map(lambda asset: _get(host, port, "/" + asset.lstrip("/"),
+                                                       encoding, link), assets))
+    page_ready = time.perf_counter() - started
+    transferred += _get(host, port, "/api/files", encoding, link)
+    if folder:
+        transferred += _get(host, port, "/api/files/" + quote(folder), encoding, link)
+    return page_ready, time.perf_counter() - started, transferred
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="server to measure (default: start a local one)")
+    parser.add_argument("--folder", default="big_folder",
+                        help="folder opened after the page loads")
+    parser.add_argument("--files", type=int, default=3000,
+                        help="files in the generated folder (local server only)")
+    parser.add_argument("--kbps", type=float, default=2000, help="link bandwidth, kbit/s")
+    parser.add_argument("--rtt-ms", type=float, default=40, help="link round trip time")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="lanshare-pageload-"))
+        folder = workdir / "share" / args.folder
+        folder.mkdir(parents=True)
+        for index in range(args.files):
+            (folder / f"IMG_{index:06d}.jpg").write_bytes(b"")
+        host, port = "127.0.0.1", _free_port()
+        process = start_server(workdir / "share", port, 1, workdir)
+        time.sleep(1.5)  # let the frontend assets be compressed
+    link = Link(args.kbps * 1000, args.rtt_ms / 1000)
+
+    report = {"kbps": args.kbps, "rtt_ms": args.rtt_ms, "folder": args.folder}
+    try:
+        for label, encoding in (("uncompressed", "identity"), ("compressed", BROWSER_ENCODINGS)):
+            runs = [load_page(host, port, args.folder, encoding, link) for _ in range(args.runs)]
+            report[label] = {
+                "page_ready_s": round(statistics.median(run[0] for run in runs), 3),
+                "folder_listed_s": round(statistics.median(run[1] for run in runs), 3),
+                "transferred_kb": round(runs[-1][2] / 1024, 1),
+            }
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
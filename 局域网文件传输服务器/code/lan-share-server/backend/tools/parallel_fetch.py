@@ -0,0 +1,417 @@
+"""Multi-connection downloader for the share server.
+
+Fetches the manifest of a shared file or folder, then downloads it over
+several connections at once. Files larger than ``--chunk-mb`` are split
+into byte ranges that are fetched in parallel, so even a single large file
+uses every connection. Only the standard library is needed:
+
+    python tools/parallel_fetch.py http://192.168.1.10:8005 datasets/run3 ./run3
+    python tools/parallel_fetch.py http://192.168.1.10:8005 "" ./everything --connections 16
+
+Downloads go to ``<name>.lspart`` next to the target, and the bytes
+received so far are recorded in ``<name>.lspart.json``; running the same command
+again after an interruption only fetches what is missing. Finished files
+are checked against the server's SHA-256 (waiting up to ``--hash-wait``
+seconds when the server has not hashed them yet) and get the server's
+modification time, so files already present with the same size and mtime
+are skipped on the next run.
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional
+from urllib.parse import quote, urlsplit
+
+PART_SUFFIX = ".lspart"
+READ_SIZE = 1024 * 1024
+# Progress within a chunk is saved after this many bytes, so an interrupted
+# run loses at most this much per connection.
+SAVE_EVERY = 4 * 1024 * 1024
+RETRIES = 3
+
+
+class DownloadError(Exception):
+    pass
+
+
+class RemoteChanged(DownloadError):
+    """The file on the server no longer matches the manifest."""
+
+
+class Remote:
+    """One keep-alive connection to the server per thread."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        url = urlsplit(base_url if "://" in base_url else "http://" + base_url)
+        self.connection_class = (http.client.HTTPSConnection if url.scheme == "https"
+                                 else http.client.HTTPConnection)
+        self.host = url.hostname
+        self.port = url.port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, headers: Optional[Dict[str, str]] = None
+                ) -> http.client.HTTPResponse:
+        """Send a request; a connection the server has closed is reopened once."""
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self.connection_class(self.host, self.port,
+                                                                timeout=self.timeout)
+            try:
+                conn.request(method, path, headers=headers or {})
+                return conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+
+    def get_json(self, path: str):
+        response = self.request("GET", path)
+        body = response.read()
+        return response.status, json.loads(body) if body else None
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _url_path(rel_path: str) -> str:
+    return quote(rel_path, safe="/")
+
+
+def fetch_manifest(remote: Remote, rel_path: str) -> List[Dict[str, object]]:
+    response = remote.request("GET", "/api/manifest/" + _url_path(rel_path))
+    if response.status != 200:
+        raise DownloadError(f"manifest: HTTP {response.status} {response.read()[:200]!r}")
+    return [json.loads(line) for line in response.read().decode("utf-8").splitlines() if line]
+
+
+def _sha256_of(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Progress:
+    def __init__(self, total_bytes: int, total_files: int):
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.bytes = 0
+        self.files = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.bytes += count
+
+    def resumed(self, count: int) -> None:
+        """``count`` bytes were already there from an earlier run."""
+        with self._lock:
+            self.total_bytes -= count
+
+    def file_done(self) -> None:
+        with self._lock:
+            self.files += 1
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f"{self.bytes / 2 ** 20:,.1f} / {self.total_bytes / 2 ** 20:,.1f} MB  "
+                f"{self.bytes / 2 ** 20 / elapsed:,.1f} MB/s  "
+                f"{self.files}/{self.total_files} files")
+
+
+class FileJob:
+    """One file being downloaded, split into chunks of ``chunk_size`` bytes."""
+
+    def __init__(self, entry: Dict[str, object], target: Path, chunk_size: int):
+        self.rel_path = str(entry["path"])
+        self.size = int(entry["size"])
+        self.mtime_ns = int(entry["mtime_ns"])
+        self.sha256 = entry.get("sha256")
+        self.target = target
+        self.part = target.with_name(target.name + PART_SUFFIX)
+        self.state = target.with_name(target.name + PART_SUFFIX + ".json")
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-self.size // chunk_size))
+        self.received: Dict[int, int] = {}  # chunk index -> bytes from its start
+        self.failed = False
+        self._finishing = False
+        self._lock = threading.Lock()
+
+    def up_to_date(self) -> bool:
+        """True if the target already holds this version of the file."""
+        try:
+            st = self.target.stat()
+        except OSError:
+            return False
+        if st.st_size != self.size:
+            return False
+        if abs(st.st_mtime_ns - self.mtime_ns) < 2_000_000_000:  # FAT keeps 2 s steps
+            return True
+        if self.sha256 and _sha256_of(self.target) == self.sha256:
+            os.utime(self.target, ns=(self.mtime_ns, self.mtime_ns))
+            return True
+        return False
+
+    def prepare(self) -> List[int]:
+        """Open (or resume) the partial file; return the chunks not yet complete."""
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        self.received = {}
+        try:
+            state = json.loads(self.state.read_text(encoding="utf-8"))
+            if (state["size"], state["mtime_ns"], state["chunk_size"]) == \
+                    (self.size, self.mtime_ns, self.chunk_size) and \
+                    self.part.stat().st_size == self.size:
+                self.received = {int(index): count for index, count in state["received"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+        if not self.received:
+            with open(self.part, "wb") as fh:
+                fh.truncate(self.size)
+        return [index for index in range(self.chunk_count) if not self.complete(index)]
+
+    def chunk_range(self, index: int):
+        start = index * self.chunk_size
+        return start, min(self.size, start + self.chunk_size) - 1
+
+    def complete(self, index: int) -> bool:
+        start, end = self.chunk_range(index)
+        return self.received.get(index, 0) >= end - start + 1
+
+    def record(self, index: int, count: int) -> None:
+        """Save that the first ``count`` bytes of a chunk are in the partial file."""
+        with self._lock:
+            self.received[index] = count
+            tmp = self.state.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"size": self.size, "mtime_ns": self.mtime_ns,
+                                       "chunk_size": self.chunk_size,
+                                       "received": self.received}), encoding="utf-8")
+            os.replace(tmp, self.state)
+
+    def claim_finish(self) -> bool:
+        """True for exactly one caller once every chunk is complete."""
+        with self._lock:
+            if self._finishing or not all(map(self.complete, range(self.chunk_count))):
+                return False
+            self._finishing = True
+            return True
+
+    def discard(self) -> None:
+        for path in (self.part, self.state):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+class Fetcher:
+    def __init__(self, remote: Remote, connections: int, hash_wait: float, verify: bool):
+        self.remote = remote
+        self.connections = connections
+        self.hash_wait = hash_wait
+        self.verify = verify
+        self.progress: Optional[Progress] = None
+        self.downloaded = 0
+        self.unverified: List[str] = []
+        self.errors: List[str] = []
+        self._lock = threading.Lock()
+
+    def run(self, jobs: List[FileJob]) -> None:
+        tasks: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        for job in jobs:
+            missing = job.prepare()
+            self.progress.resumed(sum(job.received.values()))
+            for index in missing:
+                tasks.put((job, index))
+            if not missing:  # every chunk arrived before an interruption
+                tasks.put((job, None))
+            if not self.verify or job.sha256 or job.size < job.chunk_size:
+                continue
+            # Ask now so the server hashes large files while we download them.
+            self._remote_sha256(job.rel_path)
+        threads = [threading.Thread(target=self._worker, args=(tasks,), daemon=True)
+                   for _ in range(self.connections)]
+        for thread in threads:
+            tasks.put(None)
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _worker(self, tasks: "queue.Queue[Optional[tuple]]") -> None:
+        while True:
+            task = tasks.get()
+            if task is None:
+                self.remote.close()
+                return
+            job, index = task
+            if job.failed:
+                continue
+            try:
+                if index is not None:
+                    self._fetch_chunk(job, index)
+                if job.claim_finish():
+                    self._finish(job)
+            except (DownloadError, http.client.HTTPException, OSError, ValueError) as e:
+                job.failed = True
+                with self._lock:
+                    self.errors.append(f"{job.rel_path}: {e}")
+
+    def _fetch_chunk(self, job: FileJob, index: int) -> None:
+        start, end = job.chunk_range(index)
+        for attempt in range(RETRIES):
+            offset = start + job.received.get(index, 0)
+            if job.size == 0 or offset > end:
+                job.record(index, end - start + 1)
+                return
+            try:
+                response = self.remote.request("GET", "/api/download/file/" + _url_path(job.rel_path),
+                                               {"Range": f"bytes={offset}-{end}"})
+                if response.status != 206:
+                    response.read()
+                    raise DownloadError(f"HTTP {response.status} for a range request")
+                if response.getheader("Content-Range", "") != f"bytes {offset}-{end}/{job.size}":
+                    response.read()
+                    raise RemoteChanged("file changed on the server, run again to restart it")
+                self._receive(job, index, offset, response)
+                if job.complete(index):
+                    return
+                raise DownloadError("connection closed early")
+            except (http.client.HTTPException, OSError, DownloadError) as e:
+                self.remote.close()
+                if isinstance(e, RemoteChanged) or attempt == RETRIES - 1:
+                    raise
+                time.sleep(0.5 * (attempt + 1))
+
+    def _receive(self, job: FileJob, index: int, offset: int,
+                 response: http.client.HTTPResponse) -> None:
+        """Write a range response into the partial file, saving progress as it goes."""
+        start, _ = job.chunk_range(index)
+        buffer = memoryview(bytearray(READ_SIZE))
+        with open(job.part, "r+b") as fh:
+            fh.seek(offset)
+            unsaved = 0
+            try:
+                while True:
+                    count = response.readinto(buffer)
+                    if not count:
+                        break
+                    fh.write(buffer[:count])
+                    offset += count
+                    unsaved += count
+                    self.progress.add(count)
+                    if unsaved >= SAVE_EVERY:
+                        fh.flush()
+                        job.record(index, offset - start)
+                        unsaved = 0
+            finally:
+                fh.flush()
+                job.record(index, offset - start)
+
+    def _finish(self, job: FileJob) -> None:
+        if self.verify:
+            expected = job.sha256 or self._remote_sha256(job.rel_path, self.hash_wait)
+            if expected is None:
+                with self._lock:
+                    self.unverified.append(job.rel_path)
+            elif _sha256_of(job.part) != expected:
+                job.discard()
+                raise DownloadError("SHA-256 mismatch, the download was discarded")
+        os.utime(job.part, ns=(job.mtime_ns, job.mtime_ns))
+        os.replace(job.part, job.target)
+        job.discard()
+        with self._lock:
+            self.downloaded += 1
+        self.progress.file_done()
+
+    def _remote_sha256(self, rel_path: str, wait: float = 0.0) -> Optional[str]:
+        """The server's SHA-256 of ``rel_path``; a 202 queues it with priority."""
+        deadline = time.monotonic() + wait
+        while True:
+            status, body = self.remote.get_json("/api/hash/" + _url_path(rel_path))
+            if status == 200:
+                return body["sha256"]
+            if status != 202 or time.monotonic() >= deadline:
+                return None
+            time.sleep(0.5)
+
+
+def _local_path(dest: Path, root: str, rel_path: str, single_file: bool) -> Path:
+    """Target of a manifest entry; refuses paths that would leave ``dest``."""
+    path = PurePosixPath(rel_path)
+    if single_file:
+        relative = PurePosixPath(path.name)
+    else:
+        relative = path.relative_to(root) if root else path
+    if relative.is_absolute() or ".." in relative.parts or not relative.parts:
+        raise DownloadError(f"refusing unsafe path {rel_path!r}")
+    return dest.joinpath(*relative.parts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("server", help="server address, e.g. http://192.168.1.10:8005")
+    parser.add_argument("path", help='shared file or folder ("" for everything)')
+    parser.add_argument("dest", type=Path, help="local folder to download into")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--chunk-mb", type=float, default=16,
+                        help="files larger than this are fetched as parallel ranges")
+    parser.add_argument("--hash-wait", type=float, default=30.0,
+                        help="seconds to wait for the server to hash a file before skipping the check")
+    parser.add_argument("--no-verify", action="store_true", help="do not check SHA-256")
+    args = parser.parse_args()
+
+    remote = Remote(args.server)
+    root = args.path.strip("/")
+    try:
+        manifest = fetch_manifest(remote, root)
+    except (DownloadError, http.client.HTTPException, OSError) as e:
+        sys.exit(f"Cannot fetch the manifest: {e}")
+    single_file = len(manifest) == 1 and manifest[0]["path"] == root
+    chunk_size = max(1, int(args.chunk_mb * 1024 * 1024))
+    jobs, skipped = [], 0
+    for entry in manifest:
+        job = FileJob(entry, _local_path(args.dest, root, str(entry["path"]), single_file), chunk_size)
+        if job.up_to_date():
+            skipped += 1
+        else:
+            jobs.append(job)
+
+    fetcher = Fetcher(remote, max(1, args.connections), args.hash_wait, not args.no_verify)
+    fetcher.progress = progress = Progress(sum(job.size for job in jobs), len(jobs))
+    runner = threading.Thread(target=fetcher.run, args=(jobs,), daemon=True)
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(1.0)
+            if sys.stderr.isatty():
+                print("\r" + progress.line(), end="  ", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        sys.exit("\nInterrupted; run the same command again to resume.")
+    if sys.stderr.isatty():
+        print(file=sys.stderr)
+
+    print(f"{progress.line()}; {skipped} up to date")
+    for rel_path in fetcher.unverified:
+        print(f"not verified (server has no hash yet): {rel_path}")
+    for error in fetcher.errors:
+        print(f"failed: {error}", file=sys.stderr)
+    if fetcher.errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
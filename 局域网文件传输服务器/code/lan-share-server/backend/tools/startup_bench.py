@@ -0,0 +1,108 @@
+"""Startup-to-first-response benchmark of the share server.
+
+Starts the server (server_for_packaging.py, or a packaged exe with
+``--exe``) several times and measures the time from launching the process
+until ``GET /`` and ``GET /api/files`` first answer with 200. Prints a
+JSON summary:
+
+    python tools/startup_bench.py --runs 10 --output startup.json
+    python tools/startup_bench.py --exe dist/lan-share.exe
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loadtest import BACKEND_DIR, _free_port
+
+
+def _ok(port: int, path: str) -> bool:
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status == 200
+    except OSError:
+        return False
+
+
+def measure(command, cwd: Path, config_path: Path, port: int, timeout: float):
+    """Seconds until / and /api/files answer, for one server start."""
+    env = dict(os.environ, LANSHARE_CONFIG=str(config_path))
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        first_page = None
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            if first_page is None and _ok(port, "/"):
+                first_page = time.perf_counter() - started
+            if first_page is not None and _ok(port, "/api/files"):
+                return first_page, time.perf_counter() - started
+            time.sleep(0.005)
+        raise RuntimeError(f"server did not answer within {timeout:.0f} s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _summary(values):
+    return {"median": round(statistics.median(values), 3), "min": round(min(values), 3),
+            "max": round(max(values), 3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--exe", type=Path, help="packaged executable to start instead")
+    parser.add_argument("--share", type=Path, help="shared directory (default: an empty temp dir)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="lanshare-startup-"))
+    share = args.share or workdir / "share"
+    share.mkdir(parents=True, exist_ok=True)
+    port = _free_port()
+    config_path = workdir / "config.yaml"
+    config_path.write_text(f"server:\n  host: 127.0.0.1\n  port: {port}\n"
+                           f"files:\n  shared_directory: {json.dumps(str(share))}\n",
+                           encoding="utf-8")
+    if args.exe:
+        command, cwd = [str(args.exe.resolve())], args.exe.resolve().parent
+    else:
+        command, cwd = [sys.executable, "server_for_packaging.py"], BACKEND_DIR
+
+    first_page, first_listing = [], []
+    for _ in range(args.runs):
+        page, listing = measure(command, cwd, config_path, port, args.timeout)
+        first_page.append(page)
+        first_listing.append(listing)
+
+    report = {
+        "command": " ".join(command),
+        "runs": args.runs,
+        "first_page_s": _summary(first_page),
+        "first_listing_s": _summary(first_listing),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Delta sync between two local share servers.
+
+Starts a source server and a mirror server (``sync.source`` pointing at the
+first) on free ports with their own directories, then measures three sync
+passes: the first copy (the pass the mirror runs when it starts), a pass
+after typical edits (bytes inserted into the middle of a large file, a log
+appended to, a few bytes overwritten in place, small files changed, added
+and deleted) and a pass with nothing to do. After each pass both trees are
+compared file by file. Prints a JSON report with the bytes each pass moved
+against the size of the files it updated:
+
+    python tools/sync_bench.py --large-mb 64
+"""
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from loadtest import _free_port, start_server
+
+
+def _tree(root: Path) -> Dict[str, str]:
+    digests = {}
+    for directory, dirs, files in os.walk(root):
+        if Path(directory) == root and ".lanshare" in dirs:
+            dirs.remove(".lanshare")
+        for name in files:
+            path = Path(directory) / name
+            digests[path.relative_to(root).as_posix()] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return digests
+
+
+def _generate(share: Path, large_mb: int, rng: random.Random) -> None:
+    (share / "data").mkdir(parents=True)
+    (share / "data" / "model.bin").write_bytes(rng.randbytes(large_mb * 1024 * 1024))
+    with open(share / "data" / "log.csv", "w", encoding="utf-8") as fh:
+        for row in range(200_000):
+            fh.write(f"{row},{rng.random():.6f},{rng.random():.6f},{rng.choice('ABCD')}\n")
+    for index in range(200):
+        (share / "data" / f"label_{index:03d}.txt").write_bytes(rng.randbytes(rng.randint(100, 4000)))
+
+
+def _edit(share: Path, rng: random.Random) -> None:
+    model = share / "data" / "model.bin"
+    data = model.read_bytes()
+    middle = len(data) // 2
+    data = data[:middle] + rng.randbytes(100) + data[middle:]  # shifts everything after it
+    data = data[:1000] + b"patched!" + data[1008:]
+    model.write_bytes(data)
+    with open(share / "data" / "log.csv", "a", encoding="utf-8") as fh:
+        for row in range(20_000):
+            fh.write(f"new{row},{rng.random():.6f}\n")
+    for index in range(0, 10):
+        (share / "data" / f"label_{index:03d}.txt").write_bytes(rng.randbytes(2000))
+    for index in range(190, 200):
+        (share / "data" / f"label_{index:03d}.txt").unlink()
+    (share / "data" / "new.bin").write_bytes(rng.randbytes(1024 * 1024))
+
+
+def _sync(port: int, trigger: bool = True, timeout: float = 600.0) -> Dict[str, object]:
+    """Run a sync pass on the mirror (or wait for the one it runs at startup)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    started = time.time()
+    if trigger:
+        conn.request("POST", "/api/admin/sync")
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"POST /api/admin/sync: HTTP {response.status}")
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.2)
+        conn.request("GET", "/api/admin/sync")
+        status = json.loads(conn.getresponse().read())
+        last = status["last_run"]
+        if (not status["running"] and last is not None
+                and (not trigger or last["started"] >= started - 0.5)):
+            return last
+    raise RuntimeError("sync did not finish in time")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--large-mb", type=int, default=64, help="size of the large binary file")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    workdir = Path(tempfile.mkdtemp(prefix="lanshare-sync-"))
+    source_share, mirror_share = workdir / "source" / "share", workdir / "mirror" / "share"
+    _generate(source_share, args.large_mb, rng)
+    mirror_share.mkdir(parents=True)
+    source_port, mirror_port = _free_port(), _free_port()
+    source = start_server(source_share, source_port, 1, source_share.parent)
+    mirror = None
+    report = {"large_mb": args.large_mb, "passes": {}}
+    try:
+        mirror = start_server(mirror_share, mirror_port, 1, mirror_share.parent, {
+            "sync": {"source": f"http://127.0.0.1:{source_port}", "interval": 0, "delete": True}})
+        for label in ("initial", "after_edits", "unchanged"):
+            if label == "after_edits":
+                _edit(source_share, rng)
+            run = _sync(mirror_port, trigger=label != "initial")
+            identical = _tree(source_share) == _tree(mirror_share)
+            report["passes"][label] = {
+                key: run[key] for key in ("duration", "files", "unchanged", "touched", "downloaded",
+                                          "patched", "deleted", "failed", "bytes_updated",
+                                          "bytes_received")}
+            report["passes"][label]["identical"] = identical
+            if run["errors"]:
+                report["passes"][label]["errors"] = run["errors"]
+    finally:
+        for process in (source, mirror):
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
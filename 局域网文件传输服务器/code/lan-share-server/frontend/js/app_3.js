@@ -6,6 +6,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const breadcrumbElement = document.getElementById('breadcrumb');
     const actionBar = document.getElementById('action-bar');
     const downloadBtn = document.getElementById('batch-download-btn');
+    const searchInput = document.getElementById('search-input');
 
     let selectedItems = new Set();
 
@@ -18,38 +19,148 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function formatSize(bytes) {
+        if (bytes === null || bytes === undefined) return '';
+        const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+        let i = 0;
+        while (bytes >= 1024 && i < units.length - 1) { bytes /= 1024; i++; }
+        return `${i === 0 ? bytes : bytes.toFixed(1)} ${units[i]}`;
+    }
+
+    // 大目录分页加载：每次只取一页，滚动到底部时再取下一页
+    const PAGE_SIZE = 500;
+    let currentPath = '';
+    let nextCursor = null;
+    let loadingMore = false;
+    const sentinel = document.createElement('div');
+    sentinel.className = 'loading';
+    const observer = new IntersectionObserver(entries => {
+        if (entries[0].isIntersecting) loadMore();
+    });
+
+    async function fetchPage(path, cursor) {
+        const params = new URLSearchParams({ limit: PAGE_SIZE });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE_URL}/files/${path}?${params}`);
+        if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
+        return response.json();
+    }
+
+    function setNextCursor(cursor) {
+        nextCursor = cursor;
+        observer.unobserve(sentinel);
+        if (cursor) {
+            sentinel.textContent = '正在加载更多...';
+            fileListElement.appendChild(sentinel);
+            observer.observe(sentinel);
+        } else {
+            sentinel.remove();
+        }
+    }
+
     async function fetchFiles(path = '') {
         selectedItems.clear();
         updateActionbar();
+        currentPath = path;
+        setNextCursor(null);
         fileListElement.innerHTML = '<div class="loading">正在加载...</div>';
         try {
-            const response = await fetch(`${API_BASE_URL}/files/${path}`);
-            if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
-            const files = await response.json();
-            renderFiles(files);
+            const page = await fetchPage(path, null);
+            if (path !== currentPath) return;
+            fileListElement.innerHTML = '';
+            if (page.items.length === 0) {
+                fileListElement.innerHTML = '<div class="loading">文件夹为空</div>';
+            }
+            renderFiles(page.items);
+            setNextCursor(page.next_cursor);
             updateBreadcrumb(path);
+            watchDirectory(path);
         } catch (error) {
             fileListElement.innerHTML = `<div class="loading">加载失败: ${error.message}</div>`;
         }
     }
 
-    function renderFiles(files) {
-        fileListElement.innerHTML = '';
-        if (files.length === 0) {
-            fileListElement.innerHTML = '<div class="loading">文件夹为空</div>'; return;
+    async function loadMore() {
+        if (!nextCursor || loadingMore) return;
+        loadingMore = true;
+        const path = currentPath;
+        try {
+            const page = await fetchPage(path, nextCursor);
+            if (path !== currentPath) return;
+            renderFiles(page.items);
+            setNextCursor(page.next_cursor);
+        } catch (error) {
+            sentinel.textContent = `加载失败: ${error.message}`;
+        } finally {
+            loadingMore = false;
         }
+    }
+
+    // 通过 SSE 订阅当前目录的变化，新增/删除/修改的文件直接更新到列表中
+    let changeSource = null;
+
+    function watchDirectory(path) {
+        if (changeSource) changeSource.close();
+        changeSource = null;
+        if (path === null || typeof EventSource === 'undefined') return;
+        const source = new EventSource(`${API_BASE_URL}/events?path=${encodeURIComponent(path)}`);
+        source.addEventListener('changes', (event) => {
+            if (path !== currentPath) return;
+            const batch = JSON.parse(event.data);
+            if (batch.reset) fetchFiles(path); else applyChanges(batch.changes);
+        });
+        changeSource = source;
+    }
+
+    function applyChanges(changes) {
+        changes.forEach(change => {
+            const existing = fileListElement.querySelector(`.file-item[data-path="${CSS.escape(change.path)}"]`);
+            if (change.kind === 'deleted') {
+                if (existing) existing.remove();
+                selectedItems.delete(change.path);
+            } else if (existing) {
+                if (!change.is_directory) existing.querySelector('.meta').textContent = formatMeta(change);
+            } else if (!nextCursor) {
+                // 还有未加载的分页时不插入，翻到对应位置时自然会出现
+                const empty = fileListElement.querySelector('.loading');
+                if (empty) empty.remove();
+                renderFiles([change]);
+            }
+        });
+        updateActionbar();
+    }
+
+    const THUMB_EXTENSIONS = /\.(jpe?g|png|bmp|gif|webp|tiff?)$/i;
 
+    function encodePath(path) {
+        return path.split('/').map(encodeURIComponent).join('/');
+    }
+
+    // 文件夹的大小和文件数由服务端后台统计，统计完成前为 null
+    function formatMeta(file) {
+        if (!file.is_directory) return formatSize(file.size);
+        if (file.size == null) return '';
+        return `${formatSize(file.size)} · ${file.file_count} 个文件`;
+    }
+
+    function renderFiles(files) {
+        const fragment = document.createDocumentFragment();
         files.forEach(file => {
             const itemElement = document.createElement('div');
             itemElement.className = 'file-item';
             itemElement.dataset.path = file.path;
 
             const icon = file.is_directory ? '📁' : '📄';
+            // 图片显示缩略图；v=mtime 使文件变化后 URL 随之变化，浏览器可长期缓存
+            const iconHtml = !file.is_directory && THUMB_EXTENSIONS.test(file.name)
+                ? `<img class="thumb" loading="lazy" alt="" src="${API_BASE_URL}/thumb/${encodePath(file.path)}?size=128&v=${file.mtime}">`
+                : icon;
 
             itemElement.innerHTML = `
                 <input type="checkbox" class="checkbox">
-                <span class="icon">${icon}</span>
+                <span class="icon">${iconHtml}</span>
                 <div class="name-link">${file.name}</div>
+                <span class="meta">${formatMeta(file)}</span>
             `;
 
             const checkbox = itemElement.querySelector('.checkbox');
@@ -66,16 +177,42 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (file.is_directory) {
                 itemElement.querySelector('.name-link').addEventListener('click', () => fetchFiles(file.path));
+            } else {
+                // 单文件走 /api/download/file，支持断点续传和多线程下载工具
+                itemElement.querySelector('.name-link').addEventListener('click', () => {
+                    window.location.href = `${API_BASE_URL}/download/file/${encodePath(file.path)}`;
+                });
             }
 
-            fileListElement.appendChild(itemElement);
+            fragment.appendChild(itemElement);
         });
+        fileListElement.appendChild(fragment);
     }
 
     downloadBtn.addEventListener('click', async () => {
         if (selectedItems.size === 0) return;
 
         const originalText = downloadBtn.textContent;
+        const paths = Array.from(selectedItems);
+
+        // 打包前先按文件夹统计估算大小，超出上限或过大时提示
+        try {
+            const estimate = await (await fetch(`${API_BASE_URL}/download/batch/estimate`, {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({ paths })
+            })).json();
+            if (!estimate.allowed) {
+                alert(`选中内容共 ${formatSize(estimate.size)}，超过服务器允许的打包上限。`);
+                return;
+            }
+            if (estimate.warn && !confirm(`选中内容共 ${formatSize(estimate.size)}（${estimate.files} 个文件），确定要打包下载吗？`)) {
+                return;
+            }
+        } catch (error) {
+            console.error('估算大小失败:', error);
+        }
+
         downloadBtn.textContent = '正在打包...';
         downloadBtn.disabled = true;
 
@@ -83,7 +220,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const response = await fetch(`${API_BASE_URL}/download/batch`, {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({ paths: Array.from(selectedItems) })
+                body: JSON.stringify({ paths })
             });
 
             if (response.ok) {
@@ -123,5 +260,37 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // 文件名搜索：由服务端内存索引回答，结果复用列表渲染
+    async function searchFiles(query) {
+        selectedItems.clear();
+        updateActionbar();
+        currentPath = null;
+        setNextCursor(null);
+        watchDirectory(null);
+        fileListElement.innerHTML = '<div class="loading">正在搜索...</div>';
+        try {
+            const params = new URLSearchParams({ q: query, limit: 200 });
+            const response = await fetch(`${API_BASE_URL}/search?${params}`);
+            if (!response.ok) throw new Error(`HTTP 错误! 状态: ${response.status}`);
+            const data = await response.json();
+            fileListElement.innerHTML = '';
+            if (data.results.length === 0) {
+                fileListElement.innerHTML = `<div class="loading">没有找到匹配的文件${data.indexing ? '（索引仍在建立中）' : ''}</div>`;
+            }
+            renderFiles(data.results);
+            breadcrumbElement.innerHTML = '<a href="#" data-path="">根目录</a><span>/</span>';
+            breadcrumbElement.append(`搜索 "${query}" 的结果`);
+            breadcrumbElement.querySelector('a').addEventListener('click', (e) => { e.preventDefault(); searchInput.value = ''; fetchFiles(''); });
+        } catch (error) {
+            fileListElement.innerHTML = `<div class="loading">搜索失败: ${error.message}</div>`;
+        }
+    }
+
+    searchInput.addEventListener('keydown', (e) => {
+        if (e.key !== 'Enter') return;
+        const query = searchInput.value.trim();
+        if (query) searchFiles(query); else fetchFiles('');
+    });
+
     fetchFiles();
 });
\ No newline at end of file